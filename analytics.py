@@ -0,0 +1,342 @@
+from os import replace
+
+import numpy as np
+import pandas as pd
+import pytz
+
+
+_EASTERN_TZ = pytz.timezone('US/Eastern')
+
+# daily bar columns pulled from each price history
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits']
+
+
+# price history index as US/Eastern, yfinance has returned both naive and tz aware dates
+def eastern_index(index):
+    index = pd.DatetimeIndex(index)
+    if index.tz is None:
+        return index.tz_localize(_EASTERN_TZ)
+    return index.tz_convert(_EASTERN_TZ)
+
+
+def empty_earnings_table():
+    return pd.DataFrame(columns=[
+        *[f'{_}_Pre' for _ in PRICE_COLUMNS], 'Date_Pre',
+        *[f'{_}_Post' for _ in PRICE_COLUMNS], 'Date_Post',
+        'Point_Change', 'Percent_Change', 'Date'])
+
+
+# all symbols' daily bars concatenated: symbol offsets, int64 UTC times and a float value matrix
+def _long_prices(histories):
+    offsets = [0]
+    times = []
+    values = []
+    for history in histories:
+        if history is None or len(history) == 0:
+            offsets.append(offsets[-1])
+            continue
+        times.append(eastern_index(history.index).as_unit('ns').asi8)
+        values.append(history.reindex(columns=PRICE_COLUMNS).to_numpy(dtype=np.float64))
+        offsets.append(offsets[-1] + len(history))
+    if len(times) == 0:
+        return np.array(offsets), np.empty(0, dtype=np.int64), np.empty((0, len(PRICE_COLUMNS)))
+    return np.array(offsets), np.concatenate(times), np.concatenate(values)
+
+
+###
+# Locate every earnings date of every symbol in the daily bars of the whole universe: the last
+# bar before the earnings day (pre) and the first bar on/after the date (post), one
+# searchsorted over the price times of every symbol at once.
+#   returns offsets / times / values of the concatenated bars (see _long_prices), the number of
+#   dates of each symbol, the symbol of each date (segment), the dates and pre / post positions
+#   with their missing masks (no such bar inside the symbol's history)
+###
+def _locate_events(symbols, histories, earnings):
+    offsets, times, values = _long_prices([histories.get(symbol) for symbol in symbols])
+    counts = np.array([len(earnings[symbol]) for symbol in symbols])
+    segment = np.repeat(np.arange(len(symbols)), counts)
+
+    dates = pd.DatetimeIndex(pd.to_datetime(
+        pd.Series([_ for symbol in symbols for _ in earnings[symbol]], dtype=object), utc=True))
+    date_times = dates.as_unit('ns').asi8
+    # the market day before is looked up from the start of the earnings day
+    day_times = dates.tz_convert(_EASTERN_TZ).normalize().as_unit('ns').asi8
+
+    # each symbol's times are sorted, shifting every symbol into its own span of seconds
+    # makes the concatenated keys sorted so one searchsorted resolves every symbol at once
+    base = min(times.min(initial=date_times.min()), day_times.min()) // 10**9
+    span = max(times.max(initial=date_times.max()), date_times.max()) // 10**9 - base + 1
+    price_segment = np.repeat(np.arange(len(symbols)), np.diff(offsets))
+    keys = (times // 10**9 - base) + price_segment * span
+
+    pre = np.searchsorted(keys, (day_times // 10**9 - base) + segment * span, side='left') - 1
+    post = np.searchsorted(keys, (date_times // 10**9 - base) + segment * span, side='left')
+    # no market day before / after inside the symbol's history
+    pre_missing = pre < offsets[segment]
+    post_missing = post >= offsets[segment + 1]
+    return offsets, times, values, counts, segment, dates, pre, post, pre_missing, post_missing
+
+
+###
+# For every earnings date of every symbol find the daily bar of the market day before and
+# the market day on/after the date. Replaces the per date boolean masks of SNPData.daily_prices
+# with one searchsorted over the price times of the whole universe.
+#   histories: symbol -> daily price history, earnings: symbol -> list of earnings dates
+#   returns symbol -> table laid out like SNPData.daily_prices
+###
+def earnings_tables(histories, earnings):
+    symbols = [symbol for symbol in earnings if len(earnings[symbol]) > 0]
+    tables = {symbol: empty_earnings_table() for symbol in histories if symbol not in symbols}
+    if len(symbols) == 0:
+        return tables
+
+    offsets, times, values, counts, segment, dates, pre, post, pre_missing, post_missing = (
+        _locate_events(symbols, histories, earnings))
+
+    def bars(positions, missing):
+        positions = np.where(missing, 0, positions)
+        bar_values = values[positions] if len(values) else np.full(
+            (len(positions), len(PRICE_COLUMNS)), np.nan)
+        bar_values[missing] = np.nan
+        bar_times = np.where(missing, np.iinfo(np.int64).min,
+                             times[positions] if len(times) else 0)
+        return bar_values, pd.DatetimeIndex(bar_times.view('M8[ns]')).tz_localize(
+            'UTC').tz_convert(_EASTERN_TZ)
+
+    pre_values, pre_times = bars(pre, pre_missing)
+    post_values, post_times = bars(post, post_missing)
+    point_change = post_values[:, 3] - pre_values[:, 3]
+
+    daily = pd.DataFrame({
+        **{f'{_}_Pre': pre_values[:, i] for i, _ in enumerate(PRICE_COLUMNS)},
+        'Date_Pre': pre_times,
+        **{f'{_}_Post': post_values[:, i] for i, _ in enumerate(PRICE_COLUMNS)},
+        'Date_Post': post_times,
+        'Point_Change': point_change,
+        'Percent_Change': point_change * 100 / pre_values[:, 3],
+        'Date': dates.tz_convert(_EASTERN_TZ),
+    })
+
+    # split back out per symbol, rows keep the order of each symbol's dates
+    bounds = np.r_[0, np.cumsum(counts)]
+    for i, symbol in enumerate(symbols):
+        tables[symbol] = daily.iloc[bounds[i]:bounds[i + 1]].reset_index(drop=True)
+    return tables
+
+
+# int64 UTC nanoseconds (iNaT for missing) -> US/Eastern dates
+def _from_utc_nanos(values):
+    return pd.DatetimeIndex(np.asarray(values, dtype=np.int64).view('M8[ns]')).tz_localize(
+        'UTC').tz_convert(_EASTERN_TZ)
+
+
+def _eastern_time(value):
+    value = pd.Timestamp(value)
+    return value.tz_localize(_EASTERN_TZ) if value.tz is None else value.tz_convert(_EASTERN_TZ)
+
+
+###
+# Every earnings reaction of the universe in one long table indexed by (Symbol, Date).
+#   symbols, lengths: the symbol of each run of rows and its number of rows
+#   columns: table columns laid out back to back (see SNPStore.field_columns), dates as int64
+#   UTC nanoseconds
+# Rank counts each symbol's reports from its most recent one (0), the order the tables keep.
+###
+def earnings_panel(symbols, lengths, columns):
+    lengths = np.asarray(lengths, dtype=np.int64)
+    rank = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    data = {column: _from_utc_nanos(values) if column.startswith('Date') else values
+            for column, values in columns.items()}
+    data['Rank'] = rank
+    index = pd.MultiIndex.from_arrays(
+        [np.repeat(np.array(symbols, dtype=object), lengths), data.pop('Date')],
+        names=['Symbol', 'Date'])
+    return pd.DataFrame(data, index=index)
+
+
+# earnings_panel of symbol -> table laid out like SNPData.daily_prices,
+# columns limits it to those columns and the dates
+def panel_from_tables(tables, columns=None):
+    names = [_ for _ in empty_earnings_table().columns if columns is None or _ in columns or _ == 'Date']
+    symbols = list(tables)
+    lengths = [len(tables[_]) for _ in symbols]
+
+    def values(table, column):
+        if column not in table:
+            return np.full(len(table), np.iinfo(np.int64).min if column.startswith('Date') else np.nan)
+        series = table[column]
+        if column.startswith('Date'):
+            if not isinstance(series.dtype, pd.DatetimeTZDtype):
+                series = pd.to_datetime(series, utc=True)
+            return series.dt.as_unit('ns').array.asi8
+        if series.dtype != np.float64:
+            series = pd.to_numeric(series, errors='coerce')
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+    flat = {column: np.concatenate([
+        np.empty(0, dtype=np.int64 if column.startswith('Date') else np.float64),
+        *[values(tables[_], column) for _ in symbols]]) for column in names}
+    return earnings_panel(symbols, lengths, flat)
+
+
+###
+# Reaction statistics of every symbol in one grouped pass over an earnings panel.
+#   n: only each symbol's n most recent reports, start / end: only reports dated in [start, end)
+#   returns a frame indexed by symbol: count of reports with a reaction, point_avg, percent_avg,
+#   point_median, percent_median, hit_rate (share of reactions that were up) and volatility
+#   (standard deviation of the percent reactions)
+###
+def earnings_stats(panel, n=None, start=None, end=None):
+    keep = np.ones(len(panel), dtype=bool)
+    if n is not None:
+        keep &= panel['Rank'].to_numpy() < n
+    dates = panel.index.get_level_values('Date')
+    if start is not None:
+        keep &= dates >= _eastern_time(start)
+    if end is not None:
+        keep &= dates < _eastern_time(end)
+    rows = panel[keep]
+
+    percent = rows['Percent_Change']
+    reactions = pd.DataFrame({
+        'point': rows['Point_Change'].to_numpy(),
+        'percent': percent.to_numpy(),
+        'up': (percent > 0).to_numpy(),
+        'valid': percent.notna().to_numpy(),
+    }, index=rows.index.get_level_values('Symbol'))
+    grouped = reactions.groupby(level='Symbol', sort=False)
+    sums = grouped[['up', 'valid']].sum()
+    return pd.DataFrame({
+        'count': sums['valid'],
+        'point_avg': grouped['point'].mean(),
+        'percent_avg': grouped['percent'].mean(),
+        'point_median': grouped['point'].median(),
+        'percent_median': grouped['percent'].median(),
+        'hit_rate': sums['up'] / sums['valid'].where(sums['valid'] > 0),
+        'volatility': grouped['percent'].std(),
+    })
+
+
+###
+# Daily bars around every earnings date of every symbol, in compact float32 arrays with one
+# row per event. The events of a symbol are contiguous and keep the order of its earnings dates
+# (most recent first). Day 0 is the first bar on/after the report, the day after for reports
+# after the close, day -1 the last bar before the report day, like earnings_tables.
+#   returns: [events, before + after + 1] close of each day relative to day -1's close
+#   gap: day 0's open relative to day -1's close, intraday: day 0's close relative to its open
+#   volume_ratio: day 0's volume over the mean volume of the days before it in the window
+# Days outside a symbol's history are nan. stamp identifies the data it was computed from and
+# day is the US/Eastern date it was computed on.
+###
+class EventStudy:
+    _ARRAYS = ('lengths', 'dates', 'returns', 'gap', 'intraday', 'volume_ratio')
+
+    def __init__(self, before, after, symbols, lengths, dates, returns, gap, intraday,
+                 volume_ratio, stamp=None, day=None):
+        self.before = before
+        self.after = after
+        self.symbols = list(symbols)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        # int64 UTC nanoseconds
+        self.dates = np.asarray(dates, dtype=np.int64)
+        self.returns = returns
+        self.gap = gap
+        self.intraday = intraday
+        self.volume_ratio = volume_ratio
+        self.stamp = stamp
+        self.day = day
+
+    def __len__(self):
+        return len(self.dates)
+
+    # trading day of each returns column
+    @property
+    def days(self):
+        return np.arange(-self.before, self.after + 1)
+
+    ###
+    # Per symbol means over its n most recent events (all when None): gap, intraday, window
+    # (the return over the whole window, day -1 to day +after) and volume_ratio, plus the number
+    # of events with a window return. One pass over every event, a frame indexed by symbol.
+    ###
+    def summary(self, n=None):
+        rank = np.arange(len(self)) - np.repeat(np.cumsum(self.lengths) - self.lengths, self.lengths)
+        keep = rank < n if n is not None else np.ones(len(self), dtype=bool)
+        segment = np.repeat(np.arange(len(self.symbols)), self.lengths)[keep]
+
+        def mean(values):
+            values = values[keep].astype(np.float64)
+            valid = ~np.isnan(values)
+            total = np.bincount(segment[valid], values[valid], minlength=len(self.symbols))
+            count = np.bincount(segment[valid], minlength=len(self.symbols))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return total / np.where(count > 0, count, np.nan), count
+        window, count = mean(self.returns[:, -1])
+        return pd.DataFrame({
+            'count': count,
+            'gap': mean(self.gap)[0],
+            'intraday': mean(self.intraday)[0],
+            'window': window,
+            'volume_ratio': mean(self.volume_ratio)[0],
+        }, index=pd.Index(self.symbols, name='Symbol'))
+
+    # written next to path and moved over it, a reader never sees a partly written study
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            np.savez_compressed(
+                file, before=self.before, after=self.after, stamp=str(self.stamp),
+                day=str(self.day), symbols=np.array(self.symbols, dtype=str),
+                **{_: getattr(self, _) for _ in self._ARRAYS})
+        replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(int(arrays['before']), int(arrays['after']), arrays['symbols'].tolist(),
+                       *[arrays[_] for _ in cls._ARRAYS], stamp=str(arrays['stamp']),
+                       day=str(arrays['day']) if 'day' in arrays else None)
+
+
+###
+# EventStudy of the bars from before trading days ahead of to after trading days past every
+# earnings date, computed for the whole universe at once from the positions _locate_events finds.
+#   histories: symbol -> daily price history, earnings: symbol -> list of earnings dates
+###
+def event_study(histories, earnings, before=5, after=5):
+    symbols = [symbol for symbol in earnings if len(earnings[symbol]) > 0]
+    empty = np.empty(0, dtype=np.float32)
+    if len(symbols) == 0:
+        return EventStudy(before, after, [], [], [], np.empty((0, before + after + 1), np.float32),
+                          empty, empty, empty)
+
+    offsets, times, values, counts, segment, dates, pre, post, pre_missing, post_missing = (
+        _locate_events(symbols, histories, earnings))
+    if len(values) == 0:
+        values = np.full((1, len(PRICE_COLUMNS)), np.nan)
+
+    # bar position of every day of every window, days -before..-1 count back from pre and
+    # days 0..after forward from post, each side is missing with its anchor
+    days = np.arange(-before, after + 1)
+    positions = np.where(days < 0, pre[:, None] + days + 1, post[:, None] + days)
+    missing = ((positions < offsets[segment][:, None]) | (positions >= offsets[segment + 1][:, None])
+               | np.where(days < 0, pre_missing[:, None], post_missing[:, None]))
+    positions = np.where(missing, 0, positions)
+
+    def window(column):
+        return np.where(missing, np.nan, values[positions, column])
+    opens, closes, volumes = window(0), window(3), window(4)
+    day0 = before
+    with np.errstate(invalid='ignore', divide='ignore'):
+        base = closes[:, day0 - 1] if before > 0 else np.where(
+            pre_missing, np.nan, values[np.where(pre_missing, 0, pre), 3])
+        returns = closes / base[:, None] - 1
+        gap = opens[:, day0] / base - 1
+        intraday = closes[:, day0] / opens[:, day0] - 1
+        prior = volumes[:, :day0]
+        prior_count = (~np.isnan(prior)).sum(axis=1)
+        prior_mean = np.nansum(prior, axis=1) / np.where(prior_count > 0, prior_count, np.nan)
+        volume_ratio = volumes[:, day0] / np.where(prior_mean > 0, prior_mean, np.nan)
+
+    return EventStudy(before, after, symbols, counts, dates.as_unit('ns').asi8,
+                      returns.astype(np.float32), gap.astype(np.float32),
+                      intraday.astype(np.float32), volume_ratio.astype(np.float32))
@@ -1,44 +1,90 @@
 import pickle
+import numpy as np
 import pandas as pd
-import requests
-from glob import glob
-from os import makedirs, remove
-from os.path import isfile, exists
+from os.path import exists
 import io
-from json import loads
+from json import dumps, loads
+import sys
+import zlib
 
-import yfinance as yf
 import datetime
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from contextlib import contextmanager
 from dateutil import parser
-from dateutil.relativedelta import relativedelta
 import pytz
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from requests_futures.sessions import FuturesSession
-from bs4 import BeautifulSoup
-
-from tqdm import tqdm # console progress bar
-
-
-class Singleton(type):
-    _instances = {}
-
-    def __call__(self, *args, **kwargs):
-        if self not in self._instances:
-            self._instances[self] = super(
-                Singleton, self).__call__(*args, **kwargs)
-        return self._instances[self]
+import settings
+from analytics import EventStudy, earnings_tables, empty_earnings_table, event_study, panel_from_tables
+from analytics import earnings_panel as _earnings_panel, earnings_stats as _earnings_stats
+from extract import zacks_earnings_announcements
+from fetch import FetchEngine
+from prices import OHLCVCache, PriceFetcher
+from singleton import Singleton
+from snapshots import Snapshots
+from store import SNPArrays, SNPStore, from_epoch
+
+
+# parse(content) of each (symbol, content) page, in a worker process of a sharded build
+def _parse_shard(parse, pages):
+    results = []
+    for symbol, content in pages:
+        try:
+            results.append((symbol, parse(content), None))
+        except Exception as e:
+            results.append((symbol, None, f'parse error: {e}'))
+    return results
+
+
+###
+# Parse (symbol, content) pages as they arrive, yields (symbol, result, failure reason).
+# Pages that failed to download arrive as exceptions. Without a pool every page is parsed here,
+# with a process pool the pages are handed over BUILD_SHARD_SIZE at a time and parsed on every
+# core while the next ones download, results come back in the order their shards finish.
+###
+def _parse_pages(pages, parse, pool=None):
+    pending = set()
+    shard = []
+
+    def finished(block):
+        if len(pending) == 0:
+            return []
+        done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        pending.difference_update(done)
+        return [_ for future in done for _ in future.result()]
+
+    for symbol, content in pages:
+        if isinstance(content, Exception):
+            yield symbol, None, f'{type(content).__name__}: {content}'
+        elif pool is None:
+            yield from _parse_shard(parse, [(symbol, content)])
+        else:
+            shard.append((symbol, content))
+            if len(shard) >= settings.BUILD_SHARD_SIZE:
+                pending.add(pool.submit(_parse_shard, parse, shard))
+                shard = []
+            yield from finished(False)
+    if len(shard) > 0:
+        pending.add(pool.submit(_parse_shard, parse, shard))
+    while len(pending) > 0:
+        yield from finished(True)
 
 
 class _CurrentSPXCompanies(metaclass=Singleton):
     _wiki_source = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
     def __init__(self):
+        self.update()
+
+    # scrape the current company list, max_age bounds the age of a cached page
+    def update(self, max_age=None):
 
         _WIKI_ERROR_MSG = "Can't parse Wikipedia's table! It's possible Wikipedia S&P Column Headers Changed."
 
         # first table on page _wiki_sorce lists company data
         try:
-            table = pd.read_html(self._wiki_source)[0]
+            content = FetchEngine().get(self._wiki_source, max_age=max_age)
+            table = pd.read_html(io.StringIO(content.decode('utf-8', 'replace')))[0]
             col0 = table.columns[0]
             col1 = table.columns[1]
         except:
@@ -55,6 +101,7 @@ class _CurrentSPXCompanies(metaclass=Singleton):
             "symbol": _[0],
             "name": _[1],
         } for _ in sorted_symbol_name_zip]
+        return self.companies
 
 class _EarningsDates(metaclass=Singleton):
     _EASTERN_TZ = pytz.timezone('US/Eastern')
@@ -62,22 +109,36 @@ class _EarningsDates(metaclass=Singleton):
         "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.75 Safari/537.36",
         "X-Requested-With": "XMLHttpRequest"
     }
-    _TIMEOUT = 300
+    _EARNINGS_URL = "https://www.zacks.com/stock/research/%s/earnings-announcements"
+    _NEXT_EARNINGS_URL = 'https://www.zacks.com/stock/quote/%s/detailed-estimates'
+    _TIMEOUT = 32
 
     def __init__(self):
-        self._pool = ThreadPoolExecutor(max_workers=8)
-        self._session = FuturesSession()
+        self._engine = FetchEngine()
 
-    def _ftodate(self, filename):
-        return self._EASTERN_TZ.localize(parser.parse(filename, fuzzy=True))
+    @classmethod
+    def _ftodate(cls, filename):
+        return cls._EASTERN_TZ.localize(parser.parse(filename, fuzzy=True))
 
     # zacks stores earnings dates data in a script tag in the page
     # parse dates from that script tag and return dates offest by earnings time
-    def earnings_by_symbol(self, symbol):
-        symbol = symbol.upper()
-        url = "https://www.zacks.com/stock/research/%s/earnings-announcements"
-        content = requests.get(
-            url % symbol, headers=self._REQUEST_HEADER, timeout=(5, 27)).content
+    # (class methods, so a sharded build can send them to its worker processes)
+    @classmethod
+    def parse_earnings(cls, content):
+        table = zacks_earnings_announcements(content)
+        if table is None:
+            return None
+        dates, after_close = table
+        dates = pd.DatetimeIndex(dates)
+        # report days the known format could not read fall back to a fuzzy parse
+        if dates.isna().any():
+            return cls._parse_earnings_fuzzy(content)
+        dates = dates + pd.to_timedelta(after_close.astype(int), unit='D')
+        return dates.tz_localize(cls._EASTERN_TZ).to_pydatetime().tolist()
+
+    @classmethod
+    def _parse_earnings_fuzzy(cls, content):
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(content, 'html.parser')
         scripts = soup.find_all('script')
         table_scripts = [
@@ -86,209 +147,478 @@ class _EarningsDates(metaclass=Singleton):
             js = table_scripts[0].string
             obj = loads(js[js.find('{'): js.rfind('}')+1])
             earnings_ann_table = obj["earnings_announcements_earnings_table"]
-            dates = map(lambda _: self._ftodate(_[0]), earnings_ann_table)
+            dates = map(lambda _: cls._ftodate(_[0]), earnings_ann_table)
             offests = map(lambda _: datetime.timedelta(days=1) if _[
                           6] == "After Close" else None, earnings_ann_table)
             return [d + o if o else d for d, o in zip(dates, offests)]
 
-    def earnings(self, symbols):
-        futures = []
-        for symbol in symbols:
-            future = self._pool.submit(self.earnings_by_symbol, symbol)
-            future.symbol = symbol
-            futures.append(future)
-
-        dates_dict = {}
-        pbar = tqdm(total=len(futures))
-        try:
-            for future in as_completed(futures, timeout=self._TIMEOUT):
+    def earnings_by_symbol(self, symbol):
+        symbol = symbol.upper()
+        content = self._engine.get(
+            self._EARNINGS_URL % symbol, headers=self._REQUEST_HEADER, timeout=self._TIMEOUT)
+        return self.parse_earnings(content)
 
-                # console progress bar
-                pbar.set_description(future.symbol)
-                pbar.update()
+    ###
+    # Fetch every page concurrently through the shared engine and parse each one as it arrives.
+    #   on_parsed(symbol, dates) is called for every parsed page
+    #   failures, when given, is filled with symbol -> reason for pages that failed or didn't parse
+    #   pool: process pool of a sharded build that parses the pages (see _parse_pages)
+    #   returns symbol -> dates for the pages that had dates
+    ###
+    def _fetch_and_parse(self, url, symbols, parse, max_age=None, on_parsed=None, failures=None,
+                         pool=None):
+        from tqdm import tqdm # console progress bar
+        pbar = tqdm(total=len(symbols))
+        failures = {} if failures is None else failures
 
-                dates = future.result()
-                symbol = future.symbol
-                if isinstance(dates, list) and len(dates) > 0:
-                    dates_dict[symbol] = dates
-        except:
-            pass
+        dates_dict = {}
+        pages = self._engine.iter_all(
+            {symbol: url % symbol.upper() for symbol in symbols},
+            headers=self._REQUEST_HEADER, timeout=self._TIMEOUT, max_age=max_age)
+        for symbol, dates, failure in _parse_pages(pages, parse, pool):
+            # console progress bar
+            pbar.set_description(symbol)
+            pbar.update()
+            if failure:
+                failures[symbol] = failure
+                continue
+            if dates is None:
+                failures[symbol] = 'nothing to parse on the page'
+                continue
+            if on_parsed:
+                on_parsed(symbol, dates)
+            if len(dates) > 0:
+                dates_dict[symbol] = dates
+        pbar.close()
         return dates_dict
 
-    def next_earnings_by_symbol(self, symbol):
-        _ZACKS_URL = 'https://www.zacks.com/stock/quote/%s/detailed-estimates'
-        _ZACKS_ERROR_MSG = 'Unable to get next earnings date for %s from Zacks.'
+    def earnings(self, symbols, max_age=None, on_parsed=None, failures=None, pool=None):
+        return self._fetch_and_parse(
+            self._EARNINGS_URL, symbols, self.parse_earnings, max_age=max_age,
+            on_parsed=on_parsed, failures=failures, pool=pool)
+
+    @classmethod
+    def parse_next_earnings(cls, content):
+        _ZACKS_ERROR_MSG = 'Unable to get next earnings date from Zacks.'
         try:
-            r = requests.get(_ZACKS_URL % symbol, headers=self._REQUEST_HEADER)
             next_earnings_table = pd.read_html(
-                r.content, match="Next Report Date", index_col=0, parse_dates=True)
+                io.StringIO(content.decode('utf-8', 'replace')),
+                match="Next Report Date", index_col=0)
             if len(next_earnings_table) == 0:
-                raise Exception(_ZACKS_ERROR_MSG % symbol)
+                raise Exception(_ZACKS_ERROR_MSG)
             date_string = next_earnings_table[0].loc['Next Report Date'].values[0]
-            date = self._EASTERN_TZ.localize(
+            date = cls._EASTERN_TZ.localize(
                 parser.parse(date_string, fuzzy=True))
             return [date]
         except:
             pass
         return []
 
-    def next_earnings(self, symbols):
-        futures = []
-        for symbol in symbols:
-            future = self._pool.submit(self.next_earnings_by_symbol, symbol)
-            future.symbol = symbol
-            futures.append(future)
-
-        dates_dict = {}
-        pbar = tqdm(total=len(futures))
+    def next_earnings_by_symbol(self, symbol):
         try:
-            for future in as_completed(futures, self._TIMEOUT):
-
-                # console progress bar
-                pbar.set_description(future.symbol)
-                pbar.update()
-
-                dates = future.result()
-                symbol = future.symbol
-                if isinstance(dates, list) and len(dates) > 0:
-                    dates_dict[symbol] = dates
+            content = self._engine.get(
+                self._NEXT_EARNINGS_URL % symbol, headers=self._REQUEST_HEADER,
+                timeout=self._TIMEOUT)
         except:
-            pass
-        return dates_dict
+            return []
+        return self.parse_next_earnings(content)
+
+    def next_earnings(self, symbols, max_age=None, on_parsed=None, failures=None, pool=None):
+        return self._fetch_and_parse(
+            self._NEXT_EARNINGS_URL, symbols, self.parse_next_earnings, max_age=max_age,
+            on_parsed=on_parsed, failures=failures, pool=pool)
 
 
 class SNPData(metaclass=Singleton):
     _EASTERN_TZ = pytz.timezone('US/Eastern')
-    _TIMEOUT = 300
-    def __init__(self):
-        self.companies = _CurrentSPXCompanies().companies
+    def __init__(self, prices=None, refresh=True, workers=None):
+        # seconds and traced peak memory (when tracemalloc is on) of each build stage
+        self.timings = {}
+        # processes parsing pages during a refresh, 0 parses them on the refreshing thread
+        self.workers = settings.BUILD_WORKERS if workers is None else workers
+        self._pool = None
+        # (store version, earnings panel) of the last earnings_panel call
+        self._panel = None
+        # SNPArrays over snp_dict, replaced with the dict
+        self._arrays = None
+        self._events = None
+
+        self._engine = FetchEngine()
+        self.prices = prices or PriceFetcher()
+        self.ohlcv = OHLCVCache(self.prices)
+
+        # company data is read lazily from the columnar store,
+        # a legacy snp_dict.pickle is migrated into the store once, before anything is journaled
+        with self._stage('load'):
+            self._store = SNPStore()
+            if not self._store.exists() and exists('snp_dict.pickle'):
+                self._store.save(pickle.load(open('snp_dict.pickle', 'rb')))
+            self.snp_dict = self._store.load()
+
+        self._read_meta()
+
+        if refresh:
+            self.refresh()
+
+    def _read_meta(self):
+        # the last refreshed company list, stores written before it was saved only know the symbols
+        self.companies = self._store.meta.get(
+            'companies', [{'symbol': symbol, 'name': symbol} for symbol in self.snp_dict])
+        # time of the last complete refresh, None when unknown
+        self.refreshed_at = self._store.meta.get('refreshed_at')
+        # symbol -> time it was last checked on its own since the last complete refresh
+        self.checked_at = self._store.meta.get('checked_at', {})
+        # symbol -> {stage: reason} of the stages that failed for it in the last refresh
+        self.failures = self._store.meta.get('failures', {})
 
-        self._pool = ThreadPoolExecutor(max_workers=8)
-        self._session = FuturesSession()
+    ###
+    # Hold the store's lock between processes for a refresh (see SNPStore.writing), so the app
+    # and refresh.py never refresh the same store at once. Whatever another process saved is
+    # read in first.
+    #   yields False when blocking is False and another process is refreshing
+    ###
+    @contextmanager
+    def locked(self, blocking=True):
+        with self._store.writing(blocking) as acquired:
+            if acquired:
+                self._read_meta()
+            yield acquired
 
+    ###
+    # Scrape everything that changed since the snapshot and save a new one.
+    # Every symbol's result is written to the store journal as soon as it is in, so an interrupted
+    # refresh resumes where it stopped: the next run only finds the records that are still
+    # missing a field. Symbols that failed a stage are kept in self.failures and retried next run.
+    # progress(symbols) is called after each stage with the symbols whose data it changed,
+    # it runs on the refreshing thread.
+    # With workers the build is sharded over two tiers: this process downloads every page and
+    # writes the results to the store, a pool of worker processes parses the pages as they come in.
+    # blocking=False returns False right away when another process is refreshing the store.
+    ###
+    def refresh(self, progress=None, blocking=True):
+        with self.locked(blocking) as acquired:
+            if not acquired:
+                return False
+            # checkpoints pile up in the journal until the save at the end instead of being compacted
+            with self._store.bulk(), self._parse_pool():
+                self._refresh(progress or (lambda symbols: None))
+            return True
+
+    # spawned workers, forking would copy the fetch engine's running event loop thread
+    @contextmanager
+    def _parse_pool(self):
+        if self.workers < 1:
+            yield None
+            return
+        # imported here, most starts never build with worker processes
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        self._pool = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            yield self._pool
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _refresh(self, progress):
+        with self._stage('companies'):
+            companies = _CurrentSPXCompanies().companies
         earningsInstance = _EarningsDates()
 
-        self.snp_dict = {}
-        if exists('snp_dict.pickle'):
-            self.snp_dict = pickle.load(open('snp_dict.pickle', 'rb'))
-
-        current_symbols = [_['symbol'] for _ in self.companies]
-
+        # journaled right away, a refresh that fails later still leaves the names in the store
+        self.companies = companies
+        self._store.set_meta('companies', companies)
+        current_symbols = [_['symbol'] for _ in companies]
 
         # remove delisted companies
-        for symbol in [_ for _ in self.snp_dict]:
-            if symbol not in current_symbols:
-                del self.snp_dict[symbol]
+        for symbol in [_ for _ in self.snp_dict if _ not in current_symbols]:
+            self._store.delete(self.snp_dict, symbol)
+        self.failures = {k: v for k, v in self.failures.items() if k in current_symbols}
 
         # update earnings estimates for companies with earnings in the next 15 days
-        self.update_upcomming_earnings(15)
+        with self._stage('upcoming_earnings'):
+            progress(self.update_upcomming_earnings(15))
 
         # new S&P 500 companies
         new_companies = [_ for _ in current_symbols if _ not in self.snp_dict]
 
-        # companies with recent earnings
-        recent_earnings_companies = []
-        for symbol in self.snp_dict:
-            try:
-                earnings_date = self.snp_dict[symbol].get('next_earnings', [])
-                if len(earnings_date) > 0:
-                    now = datetime.datetime.now(tz=self._EASTERN_TZ)
-                    if earnings_date[0] + datetime.timedelta(days=1) < now:
-                        recent_earnings_companies.append(symbol)
-            except:
-                continue
-
-        ## all companies that need updating
-        companies_to_update = [*new_companies, *recent_earnings_companies]
+        # companies with recent earnings, records without earnings and last run's failures
+        earnings_companies = list(dict.fromkeys([
+            *new_companies, *[_ for _ in self.snp_dict if self.has_reported(_)],
+            *self.failed('earnings')]))
+        next_earnings_companies = list(dict.fromkeys([
+            *earnings_companies,
+            *[_ for _ in self.snp_dict if 'next_earnings' not in self.snp_dict[_]],
+            *self.failed('next_earnings')]))
+
+        # new earnings are merged in as each page is parsed, the prices stage rebuilds the tables
+        def earnings_parsed(symbol, dates):
+            record = self.snp_dict.get(symbol, {})
+            merged = self.merge_earnings(record.get('earnings', []), dates)
+            if 'earnings' not in record or merged != record['earnings']:
+                self.update(symbol, 'earnings', merged)
+                if 'table' in record:
+                    self._store.delete(self.snp_dict, symbol, 'table')
+
+        def next_earnings_parsed(symbol, dates):
+            dates = self.with_pending_reports(symbol, dates)
+            if dates != self.snp_dict.get(symbol, {}).get('next_earnings'):
+                self.update(symbol, 'next_earnings', dates)
 
-        ## new companies
         print("\n\nUpdating company earnings:\n\n")
-        earnings = earningsInstance.earnings(companies_to_update)
+        with self._stage('earnings'):
+            failures = {}
+            earningsInstance.earnings(
+                earnings_companies, on_parsed=earnings_parsed, failures=failures, pool=self._pool)
+            self._record_failures('earnings', earnings_companies, failures)
         print("\n\nUpdating company earnings dates:\n\n")
-        next_earnings_dates = earningsInstance.next_earnings(companies_to_update)
-        # merge earnings with new_earnings and update snp_dict
+        with self._stage('next_earnings'):
+            failures = {}
+            earningsInstance.next_earnings(
+                next_earnings_companies, on_parsed=next_earnings_parsed, failures=failures,
+                pool=self._pool)
+            self._record_failures('next_earnings', next_earnings_companies, failures)
+        # new companies whose pages failed start out empty, their failures retry them next run
         for symbol in new_companies:
-            dates = earnings.get(symbol, [])[:10]
-            table = self.daily_prices(symbol, dates)
-            self.snp_dict[symbol] = {
-                'earnings': dates,
-                'next_earnings': next_earnings_dates.get(symbol, []),
-                'table': table,
-                'avg': self.avg_price(table, 10)
-            }
-
-        futures = []
-        # make sure all averages and tables are up to date
-        for symbol in self.snp_dict:
-            info = self.snp_dict[symbol]
-            if 'earnings' in info and 'table' not in info:
-                dates = info['earnings']
-                future = self._pool.submit(self.daily_prices, symbol, dates)
-                future.symbol = symbol
-                futures.append(future)
-
-        # wait and consume all futures
-        pbar = tqdm(total=len(futures))
+            for field in ('earnings', 'next_earnings'):
+                if field not in self.snp_dict.get(symbol, {}):
+                    self.update(symbol, field, [])
+        progress(list(dict.fromkeys([*earnings_companies, *next_earnings_companies])))
+
+        # make sure all averages and tables are up to date,
+        # prices for every missing table come from a few batched downloads
+        # that the OHLCV cache keeps per symbol
         print("\n\nUpdating price data and averages:\n\n")
-        try:
-            for future in as_completed(futures, timeout=self._TIMEOUT):
-
-                # console progress bar
-                pbar.set_description(future.symbol)
-                pbar.update()
-                table = future.result()
-                symbol = future.symbol
-                if isinstance(table, pd.DataFrame):
-                    self.snp_dict[symbol] = {
-                        **self.snp_dict[symbol],
-                        'table': table,
-                        'avg': self.avg_price(table, 10)
-                    }
-        except:
-            pass
+        with self._stage('prices'):
+            failed = self.failed('prices')
+            missing_tables = {
+                symbol: self.snp_dict[symbol]['earnings'] for symbol in self.snp_dict
+                if 'earnings' in self.snp_dict[symbol]
+                and ('table' not in self.snp_dict[symbol] or symbol in failed)}
+            tables = self.daily_prices_many(missing_tables)
+            self.update_many('table', tables)
+            self.update_many('avg', self.avg_prices(tables, 10))
+            self._record_failures('prices', missing_tables, self._price_failures(tables))
+        progress(list(missing_tables))
 
 
         ## get company details
-        futures = []
-        for symbol in self.snp_dict:
-            if not 'detail' in self.snp_dict[symbol]:
-                self.snp_dict[symbol]['detail'] = ''
-                future = self._pool.submit(
-                    self.market_watch_company_detail, symbol)
-                future.symbol = symbol
-                futures.append(future)
-
-        # wait and consume all futures
         print("\n\nGetting company details:\n\n")
-        pbar = tqdm(total=len(futures))
-        try:
-            for future in as_completed(futures, timeout=self._TIMEOUT):
+        with self._stage('details'):
+            failed = self.failed('details')
+            missing_details = [
+                symbol for symbol in self.snp_dict
+                if not 'detail' in self.snp_dict[symbol] or symbol in failed]
+            failures = {}
+            self.market_watch_company_details(
+                missing_details, on_parsed=lambda symbol, detail: self.update(symbol, 'detail', detail),
+                failures=failures, pool=self._pool)
+            self._record_failures('details', missing_details, failures)
+
+        if self.failures:
+            print(f"\n\n{len(self.failures)} companies could not be fully updated, "
+                  "they are retried on the next refresh (see SNPData.failures)\n\n")
+
+        # tables already carry their earnings dates in the 'Date' column (see daily_prices)
+        with self._stage('save'):
+            self.refreshed_at = time.time()
+            self.checked_at = {}
+            self.save()
+            self._engine.cache.prune()
+
+    # symbols whose last attempt at stage failed
+    def failed(self, stage):
+        return [symbol for symbol, stages in self.failures.items() if stage in stages]
+
+    # symbol -> reason for the tables without a single close around their earnings dates
+    @staticmethod
+    def _price_failures(tables):
+        return {symbol: 'no price history around the earnings dates' for symbol, table in tables.items()
+                if len(table) > 0 and table['Close_Pre'].isna().all() and table['Close_Post'].isna().all()}
+
+    # failures: symbol -> reason for the symbols of 'attempted' that failed stage,
+    # journaled with the stage's checkpoints so an interrupted refresh keeps them
+    def _record_failures(self, stage, attempted, failures):
+        for symbol in attempted:
+            stages = self.failures.get(symbol, {})
+            if symbol in failures:
+                stages[stage] = failures[symbol]
+            else:
+                stages.pop(stage, None)
+            if stages:
+                self.failures[symbol] = stages
+            else:
+                self.failures.pop(symbol, None)
+        self._store.set_meta('failures', self.failures)
 
-                # console progress bar
-                pbar.set_description(future.symbol)
-                pbar.update()
+    # the last known report date has passed, so the source can list a newer report
+    def has_reported(self, symbol, now=None):
+        record = self.snp_dict[symbol]
+        return 'earnings' not in record or len(self.pending_reports(record, now)) > 0
 
-                detail = future.result()
-                symbol = future.symbol
-                if isinstance(detail, str):
-                    self.snp_dict[symbol]['detail'] = detail
-        except:
-            pass
+    ###
+    # Report dates of a record's next_earnings at least a day past, within the last quarter,
+    # that its stored earnings have no row for yet. An after close report's row is dated the
+    # next trading day, so a row up to a long weekend later counts.
+    ###
+    def pending_reports(self, record, now=None):
+        now = now or datetime.datetime.now(tz=self._EASTERN_TZ)
+        earnings = record.get('earnings', [])
+        return [date for date in record.get('next_earnings', [])
+                if now - datetime.timedelta(days=90) < date < now - datetime.timedelta(days=1)
+                and not any(date - datetime.timedelta(days=1) <= _ <= date + datetime.timedelta(days=4)
+                            for _ in earnings)]
+
+    # scraped next earnings dates of a symbol with its pending reports kept after them, zacks can
+    # move the next date on before the report's row is posted and has_reported must still see it
+    def with_pending_reports(self, symbol, dates):
+        pending = self.pending_reports(self.snp_dict.get(symbol, {}))
+        return [*dates, *[_ for _ in pending if _ not in dates]]
+
+    # newest first, the 10 most recent report dates of both lists
+    @staticmethod
+    def merge_earnings(earnings, new_earnings):
+        return sorted({*earnings, *new_earnings}, reverse=True)[:10]
 
-        ## add date as index to each table in snp_dict
-        ##
-        for symbol in self.snp_dict:
-            info = self.snp_dict[symbol]
-            info['table']['Date'] = pd.Series(self.snp_dict[symbol]['earnings'])
-            info['table'].set_index('Date')
-        ##
+    ###
+    # Refresh only the given symbols, used by the refresh scheduler (see refresh.py).
+    # Next earnings dates are fetched for every symbol, earnings pages only for symbols that
+    # reported since their last check. Changed fields go through the store journal.
+    #   max_age: cached pages older than this many seconds are revalidated
+    #   returns the symbols whose data changed
+    ###
+    def refresh_symbols(self, symbols, max_age=None):
+        symbols = [_ for _ in symbols if _ in self.snp_dict]
+        earningsInstance = _EarningsDates()
+        failed = self.failed('earnings')
+        reported = [_ for _ in symbols if self.has_reported(_) or _ in failed]
+        changed = set()
+
+        failures = {}
+        next_earnings_dates = earningsInstance.next_earnings(
+            symbols, max_age=max_age, failures=failures)
+        self._record_failures('next_earnings', symbols, failures)
+        for symbol, dates in next_earnings_dates.items():
+            dates = self.with_pending_reports(symbol, dates)
+            if dates != self.snp_dict[symbol].get('next_earnings', []):
+                self.update(symbol, 'next_earnings', dates)
+                changed.add(symbol)
+
+        failures = {}
+        earnings = earningsInstance.earnings(reported, max_age=max_age, failures=failures)
+        self._record_failures('earnings', reported, failures)
+        new_earnings = {}
+        for symbol in reported:
+            current = self.snp_dict[symbol].get('earnings', [])
+            merged = self.merge_earnings(current, earnings.get(symbol, []))
+            if merged != current or 'table' not in self.snp_dict[symbol]:
+                new_earnings[symbol] = merged
+
+        tables = self.daily_prices_many(new_earnings)
+        self.update_many('earnings', new_earnings)
+        self.update_many('table', tables)
+        self.update_many('avg', self.avg_prices(tables, 10))
+        changed.update(tables)
+        return sorted(changed)
+
+    ###
+    # Scrape the company list, drop delisted companies and build the records of new ones.
+    # The snapshot is rewritten only when the list changed.
+    #   returns (added, removed) symbols
+    ###
+    def refresh_companies(self, max_age=None):
+        companies = _CurrentSPXCompanies().update(max_age=max_age)
+        current_symbols = [_['symbol'] for _ in companies]
+        removed = [_ for _ in self.snp_dict if _ not in current_symbols]
+        added = [_ for _ in current_symbols if _ not in self.snp_dict]
+
+        if companies != self.companies:
+            self.companies = companies
+            self._store.set_meta('companies', companies)
+        for symbol in removed:
+            self._store.delete(self.snp_dict, symbol)
+        if len(added) == 0:
+            return added, removed
+
+        # pages that fail are recorded like a refresh's stages, so refresh_symbols and the
+        # next refresh retry them
+        earningsInstance = _EarningsDates()
+        failures = {}
+        earnings = earningsInstance.earnings(added, max_age=max_age, failures=failures)
+        self._record_failures('earnings', added, failures)
+        failures = {}
+        next_earnings_dates = earningsInstance.next_earnings(added, max_age=max_age, failures=failures)
+        self._record_failures('next_earnings', added, failures)
+        for symbol in added:
+            self.snp_dict[symbol] = {
+                'earnings': earnings.get(symbol, [])[:10],
+                'next_earnings': next_earnings_dates.get(symbol, []),
+            }
+        tables = self.daily_prices_many({_: self.snp_dict[_]['earnings'] for _ in added})
+        averages = self.avg_prices(tables, 10)
+        self._record_failures('prices', added, self._price_failures(tables))
+        failures = {}
+        details = self.market_watch_company_details(added, failures=failures)
+        self._record_failures('details', added, failures)
+        for symbol in added:
+            self.snp_dict[symbol]['table'] = tables[symbol]
+            self.snp_dict[symbol]['avg'] = averages[symbol]
+            self.snp_dict[symbol]['detail'] = details.get(symbol, '')
+        self.save()
+        return added, removed
 
-        pickle.dump(self.snp_dict, open('snp_dict.pickle', 'wb'))
+    ###
+    # Record that symbols were checked without rewriting the snapshot. refreshed_at is the
+    # oldest check of any symbol, it only moves once every symbol was checked since it was set.
+    ###
+    def mark_refreshed(self, symbols, when=None):
+        when = when or time.time()
+        self.checked_at = {symbol: checked for symbol, checked in
+                           {**self.checked_at, **dict.fromkeys(symbols, when)}.items()
+                           if symbol in self.snp_dict}
+        if all(symbol in self.checked_at for symbol in self.snp_dict):
+            self.refreshed_at = min(self.checked_at.values(), default=when)
+        self._store.set_meta('checked_at', self.checked_at)
+        self._store.set_meta('refreshed_at', self.refreshed_at)
+
+    # memory is only traced when whoever started tracemalloc imported it, it is not imported here
+    @contextmanager
+    def _stage(self, name):
+        tracemalloc = sys.modules.get('tracemalloc')
+        tracing = tracemalloc is not None and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            peak = tracemalloc.get_traced_memory()[1] if tracing else None
+            self.timings[name] = (time.perf_counter() - start, peak)
 
     @property
     def data(self):
         return self.snp_dict
 
+    # values of the store's meta not set here, e.g. the snapshot version, are kept
+    def save(self):
+        self.snp_dict = self._store.save(self.snp_dict, {
+            **self._store.meta, 'companies': self.companies, 'refreshed_at': self.refreshed_at,
+            'checked_at': self.checked_at, 'failures': self.failures})
+
+    # save the data as a new snapshot version with the patch from the last one (see snapshots.py)
+    def snapshot(self, snapshots=None):
+        version, self.snp_dict = (snapshots or Snapshots()).build(self._store, self.snp_dict)
+        return version
+
+    # cheap single symbol update, appended to the store journal instead of rewriting the store
+    def update(self, symbol, field, value):
+        self._store.update(self.snp_dict, symbol, field, value)
+
+    # field of several symbols, symbol -> value, in one journal write
+    def update_many(self, field, values):
+        self._store.update_many(self.snp_dict, field, values)
+
     def first_date(self):
         dates = []
         for symbol in self.snp_dict:
@@ -312,163 +642,384 @@ class SNPData(metaclass=Singleton):
                 continue
 
         print("\n\nUpdating upcommings earnings:\n\n")
-        update_next_earnings = _EarningsDates().next_earnings(update_symbols)
+        update_next_earnings = _EarningsDates().next_earnings(update_symbols, pool=self._pool)
         for symbol in update_next_earnings:
             if symbol in self.snp_dict:
-                self.snp_dict[symbol]['next_earnings'] = update_next_earnings[symbol]
+                self.update(symbol, 'next_earnings',
+                            self.with_pending_reports(symbol, update_next_earnings[symbol]))
+        return [_ for _ in update_next_earnings if _ in self.snp_dict]
 
     ###
     # for each date in dates return the daily for the market day before and after date
     ###
     def daily_prices(self, symbol, dates):
+        return self.daily_prices_many({symbol: dates})[symbol]
 
-        if len(dates) == 0:
-            ret = pd.DataFrame(columns=['Date', 'Open_Pre', 'High_Pre', 'Low_Pre', 'Close_Pre', 'Volume_Pre',
-                                        'Dividends_Pre', 'Stock Splits_Pre', 'Date_Pre', 'Open_Post',
-                                        'High_Post', 'Low_Post', 'Close_Post', 'Volume_Post', 'Dividends_Post',
-                                        'Stock Splits_Post', 'Date_Post', 'Point_Change', 'Percent_Change'])
-            ret.set_index('Date')
-            return ret
-
-        # yfinance uses dashes and not dots in symbols
-        symbol = symbol.replace('.', '-')
-
-        ticker = yf.Ticker(symbol)
-
-        if isinstance(dates, list):
-            dates = pd.Series(dates)
+    # daily_prices for many symbols, histories are pulled in batches over one shared date window
+    def daily_prices_many(self, dates_by_symbol):
+        dates_by_symbol = {symbol: list(dates) for symbol, dates in dates_by_symbol.items()}
+        all_dates = pd.Series([_ for dates in dates_by_symbol.values() for _ in dates])
+        if len(all_dates) == 0:
+            return {symbol: empty_earnings_table() for symbol in dates_by_symbol}
 
         # pull dates 10 days ahead of max date to make sure that we always have a next market day
         min_date = pd.to_datetime(
-            str(dates.min() - datetime.timedelta(days=10))).strftime('%Y-%m-%d')
+            str(all_dates.min() - datetime.timedelta(days=10))).strftime('%Y-%m-%d')
         max_date = pd.to_datetime(
-            str(dates.max() + datetime.timedelta(days=10))).strftime('%Y-%m-%d')
-
-        price_history = ticker.history(
-            start=min_date, end=max_date, interval="1d")
-        price_history.index = price_history.index.map(
-            lambda date: self._EASTERN_TZ.localize(date.to_pydatetime()))
-
-        # closest market day greater than each date in dates
-        def date_upper_bound(
-            df, date): return df.loc[df.loc[df.index >= date].index.min()]
-        def date_lower_bound(df, date): return df.loc[df.loc[df.index < date.replace(
-            hour=0, minute=0)].index.max()]
-
-        # closest market day before earning date
-        pre_daily = pd.DataFrame(
-            [date_lower_bound(price_history, date) for date in dates])
-        pre_daily['Date'] = pre_daily.index
-        pre_daily = pre_daily.reset_index(drop=True)
-
-        # closest market day after earning date
-        post_daily = pd.DataFrame(
-            [date_upper_bound(price_history, date) for date in dates])
-        post_daily['Date'] = post_daily.index
-        post_daily = post_daily.reset_index(drop=True)
-
-        daily = pre_daily.join(post_daily, lsuffix="_Pre", rsuffix="_Post")
-        daily = daily.assign(
-            Point_Change=lambda row: row['Close_Post'] - row['Close_Pre'],
-            Percent_Change=lambda row: (row['Close_Post'] - row['Close_Pre']) * 100 / row['Close_Pre'])
-        daily['Date'] = dates
-        daily.set_index('Date')
-
-        return daily
+            str(all_dates.max() + datetime.timedelta(days=10))).strftime('%Y-%m-%d')
+
+        symbols = [symbol for symbol, dates in dates_by_symbol.items() if len(dates) > 0]
+        histories = self.ohlcv.histories(symbols, min_date, max_date)
+
+        # pre and post market days for every date are resolved in one vectorized pass
+        return earnings_tables(
+            {symbol: histories.get(symbol) for symbol in dates_by_symbol}, dates_by_symbol)
 
     def avg_price(self, prices, n):
         return {'point_avg': prices['Point_Change'][:n].mean(), 'percent_avg': prices['Percent_Change'][:n].mean()}
 
-    def market_watch_company_detail(self, symbol):
-        _MARKET_WATCH_URL = 'https://www.marketwatch.com/investing/stock/%s'
-        try:
-            content = requests.get(_MARKET_WATCH_URL %
-                                   symbol, timeout=5).content
-        except:
-            return ''
+    # avg_price of every table, symbol -> table, in one grouped pass
+    def avg_prices(self, tables, n):
+        panel = panel_from_tables(tables, columns=('Point_Change', 'Percent_Change'))
+        stats = _earnings_stats(panel, n).reindex(list(tables))
+        return {symbol: {'point_avg': float(stats.at[symbol, 'point_avg']),
+                         'percent_avg': float(stats.at[symbol, 'percent_avg'])}
+                for symbol in tables}
+
+    # snp_dict read as the store's columns (see store.SNPArrays)
+    def arrays(self):
+        arrays = self._arrays
+        if arrays is None or arrays.snp_dict is not self.snp_dict:
+            arrays = self._arrays = SNPArrays(self._store, self.snp_dict)
+        return arrays
+
+    ###
+    # Every earnings reaction of the universe, one row per symbol and report date
+    # (see analytics.earnings_panel). It is gathered straight from the store's table columns
+    # and kept until a record changes, so statistics for another n or window cost no fetching.
+    ###
+    def earnings_panel(self):
+        version = self._store.version
+        if self._panel is None or self._panel[0] != version:
+            self._panel = (version, _earnings_panel(*self._store.field_columns(self.snp_dict, 'table')))
+        return self._panel[1]
+
+    # reaction statistics of every symbol (see analytics.earnings_stats)
+    def earnings_stats(self, n=None, start=None, end=None):
+        return _earnings_stats(self.earnings_panel(), n, start, end)
+
+    ###
+    # Bars from before trading days ahead of to after days past every earnings date of every
+    # symbol (see analytics.EventStudy), read from the OHLCV cache. The study is saved to
+    # EVENT_STUDY_PATH and reused until the earnings dates change. Windows still being filled
+    # in are picked up by computing it again once a day, until then the saved study is shown.
+    #   compute=False only returns a study of the current earnings dates, None otherwise
+    ###
+    def event_study(self, before=None, after=None, compute=True):
+        before = settings.EVENT_DAYS_BEFORE if before is None else before
+        after = settings.EVENT_DAYS_AFTER if after is None else after
+        symbols, lengths, columns = self._store.field_columns(self.snp_dict, 'earnings')
+        stamp = '%08x' % zlib.crc32(columns['values'].tobytes(), zlib.crc32(dumps([
+            before, after, symbols, lengths.tolist()]).encode('utf-8')))
+        today = str(datetime.datetime.now(tz=self._EASTERN_TZ).date())
+
+        if self._events is None and exists(settings.EVENT_STUDY_PATH):
+            try:
+                self._events = EventStudy.load(settings.EVENT_STUDY_PATH)
+            except Exception:
+                pass
+        if self._events is not None and self._events.stamp == stamp and (
+                not compute or self._events.day == today):
+            return self._events
+        if not compute:
+            return None
+
+        earnings = dict(zip(symbols, [from_epoch(_) for _ in np.split(
+            columns['values'], np.cumsum(lengths)[:-1])] if len(symbols) else []))
+        dates = pd.Series([_ for dates in earnings.values() for _ in dates])
+        histories = {}
+        if len(dates) > 0:
+            # calendar days comfortably covering the trading days of every window
+            histories = self.ohlcv.histories(
+                list(earnings),
+                (dates.min() - datetime.timedelta(days=2 * before + 10)).strftime('%Y-%m-%d'),
+                (dates.max() + datetime.timedelta(days=2 * after + 10)).strftime('%Y-%m-%d'))
+        study = event_study(histories, earnings, before, after)
+        study.stamp = stamp
+        study.day = today
+        study.save(settings.EVENT_STUDY_PATH)
+        self._events = study
+        return study
+
+    _MARKET_WATCH_URL = 'https://www.marketwatch.com/investing/stock/%s'
+
+    @staticmethod
+    def parse_company_detail(content):
+        from bs4 import BeautifulSoup
         details = BeautifulSoup(content, 'html.parser').find_all(
             class_='description__text')
         if len(details) > 0:
             return details[0].text
         return ''
 
+    def market_watch_company_detail(self, symbol):
+        try:
+            content = self._engine.get(self._MARKET_WATCH_URL % symbol, timeout=5)
+        except:
+            return ''
+        return self.parse_company_detail(content)
+
+    # symbol -> description, each page is parsed as it arrives (see _EarningsDates._fetch_and_parse)
+    def market_watch_company_details(self, symbols, on_parsed=None, failures=None, pool=None):
+        from tqdm import tqdm
+        pbar = tqdm(total=len(symbols))
+        failures = {} if failures is None else failures
+
+        details = {}
+        pages = self._engine.iter_all(
+            {symbol: self._MARKET_WATCH_URL % symbol for symbol in symbols}, timeout=5)
+        for symbol, detail, failure in _parse_pages(pages, self.parse_company_detail, pool):
+            # console progress bar
+            pbar.set_description(symbol)
+            pbar.update()
+            if failure:
+                failures[symbol] = failure
+            details[symbol] = detail or ''
+            if on_parsed:
+                on_parsed(symbol, details[symbol])
+        pbar.close()
+        return details
+
 # main api singleton
 
 
 class CompanyInfo(metaclass=Singleton):
     _EASTERN_TZ = pytz.timezone('US/Eastern')
+    _NO_DATE = datetime.datetime(year=1970, month=1, day=1)
 
     def __init__(self):
-        snp = SNPData()
-        self.companies = snp.companies
-        self.snp_dict = snp.data
+        self._snp = SNPData()
+        # symbols whose next earnings date is being fetched
+        self._fetching = set()
+        self._lock = threading.Lock()
+
+    # read through SNPData, a refresh replaces its company list and may replace its dict
+    @property
+    def companies(self):
+        return self._snp.companies
+
+    @property
+    def snp_dict(self):
+        return self._snp.data
+
+    # the accessors below slice the store's columns instead of decoding a company's record
+    @property
+    def arrays(self):
+        return self._snp.arrays()
 
     def earnings_averages(self, symbol):
         symbol = symbol.upper()
-        if symbol in self.snp_dict:
-            return self.snp_dict[symbol]['avg']
-
+        arrays = self.arrays
+        if symbol in arrays:
+            avg = arrays.columns(symbol, 'avg')
+            return {column: float(values[0]) for column, values in avg.items()}
+
+    # per company means of the event study windows around its n latest reports, a frame
+    # indexed by symbol (see analytics.EventStudy.summary), None when compute=False and the
+    # saved study is of other earnings dates
+    def event_summary(self, n=None, compute=True):
+        study = self._snp.event_study(compute=compute)
+        if study is None:
+            return None
+        return study.summary(settings.EVENT_REPORTS if n is None else n)
+
+    # averages, medians, hit rates and volatility of every company's reactions to its n latest
+    # reports and / or the reports dated in [start, end), a frame indexed by symbol
+    def earnings_stats(self, n=10, start=None, end=None):
+        return self._snp.earnings_stats(n, start, end)
+
+    # rows of (date, close before, close after, percent change), dates as US/Eastern Timestamps
     def earnings_change(self, symbol):
         symbol = symbol.upper()
-        if symbol in self.snp_dict:
-            return self.snp_dict[symbol]['table'][['Date', 'Close_Pre', 'Close_Post', 'Percent_Change']].values
-
+        arrays = self.arrays
+        if symbol in arrays:
+            table = arrays.columns(symbol, 'table')
+            values = np.empty((len(table['Date']), 4), dtype=object)
+            values[:, 0] = list(from_epoch(table['Date']))
+            for i, column in enumerate(('Close_Pre', 'Close_Post', 'Percent_Change'), 1):
+                values[:, i] = table[column]
+            return values
+
+    # datetime64[ns] in UTC
     def earnings_dates(self, symbol):
         symbol = symbol.upper()
-        if symbol in self.snp_dict:
-            return self.snp_dict[symbol]['table']['Date'].values
+        arrays = self.arrays
+        if symbol in arrays:
+            return arrays.columns(symbol, 'table')['Date'].view('M8[ns]')
 
-    def next_earnings_date(self, symbol):
+    # fetch=False skips scraping a missing date, the next refresh fills it in
+    def next_earnings_date(self, symbol, fetch=True):
         symbol = symbol.upper()
-        if symbol in self.snp_dict:
-            dates = self.snp_dict[symbol]['next_earnings']
+        if fetch:
+            return self.next_earnings_dates([symbol])[symbol]
+        arrays = self.arrays
+        if arrays.present(symbol, 'next_earnings'):
+            dates = arrays.columns(symbol, 'next_earnings')['values']
             if len(dates) > 0:
-                return dates[0]
-            else:
-                # try to get the next_earnings for symbol
-                next_earnings = _EarningsDates().next_earnings_by_symbol(symbol)
-                if len(next_earnings) > 0:
-                    self.snp_dict[symbol]['next_earnings'] = next_earnings
-                    pickle.dump(self.snp_dict, open('snp_dict.pickle', 'wb'))
-                    return next_earnings[0]
+                return from_epoch(dates[:1]).to_pydatetime()[0]
 
         #error datetime to cause update next start
-        return datetime.datetime(year=1970, month=1, day=1)
+        return self._NO_DATE
+
+    ###
+    # Next earnings date of every symbol, _NO_DATE where none is known.
+    # The missing dates are fetched together in one concurrent batch and saved with one journal
+    # write. Without a callback that happens before returning, with one the placeholders are
+    # returned right away and callback(symbol -> date) gets the dates that were found, on a
+    # worker thread.
+    ###
+    def next_earnings_dates(self, symbols, callback=None):
+        dates = {}
+        missing = []
+        for symbol in [_.upper() for _ in symbols]:
+            dates[symbol] = self.next_earnings_date(symbol, fetch=False)
+            if dates[symbol] is self._NO_DATE and symbol in self.snp_dict:
+                missing.append(symbol)
+
+        if len(missing) == 0:
+            if callback:
+                callback({})
+            return dates
+        if callback is None:
+            dates.update(self._fetch_next_earnings(missing))
+            return dates
+        threading.Thread(
+            target=lambda: callback(self._fetch_next_earnings(missing)), daemon=True).start()
+        return dates
+
+    def _fetch_next_earnings(self, symbols):
+        # symbols already being fetched for another caller are left to it
+        with self._lock:
+            symbols = [_ for _ in symbols if _ not in self._fetching]
+            self._fetching.update(symbols)
+        try:
+            found = _EarningsDates().next_earnings(symbols)
+            self._snp.update_many('next_earnings', {
+                symbol: self._snp.with_pending_reports(symbol, dates) for symbol, dates in found.items()})
+        finally:
+            with self._lock:
+                self._fetching.difference_update(symbols)
+        return {symbol: dates[0] for symbol, dates in found.items()}
 
     def company_detail(self, symbol):
         symbol = symbol.upper()
-        if symbol in self.snp_dict:
-            return self.snp_dict[symbol]['detail']
+        arrays = self.arrays
+        if symbol in arrays:
+            return arrays.columns(symbol, 'detail')['values'].tobytes().decode('utf-8')
 
     def earnings_range(self, symbol):
         symbol = symbol.upper()
-        if symbol in self.snp_dict:
-            table = self.snp_dict[symbol]['table']
-            min_date = table['Date'].min()
-            max_date = table['Date'].max()
-            return {'start': min_date, 'end': max_date}
+        arrays = self.arrays
+        if symbol in arrays:
+            dates = arrays.columns(symbol, 'table')['Date']
+            dates = dates[dates != np.iinfo(np.int64).min]
+            if len(dates) == 0:
+                return {'start': pd.NaT, 'end': pd.NaT}
+            start, end = from_epoch([dates.min(), dates.max()])
+            return {'start': start, 'end': end}
 
     def stock_data(self, symbol, start, end=None):
-        # yahoo uses '-' and not '.' in ex BRK-B
-        symbol = symbol.replace('.', '-')
-        return yf.Ticker(symbol).history(start=start, end=end)
+        return self._snp.ohlcv.history(symbol, start, end)
 
 
+###
+# Current quotes from zacks' quote feed.
+# Symbols are requested in chunks of QUOTE_CHUNK_SIZE fetched in parallel, so one failed request
+# only costs the quotes of its chunk, and those fall back to the last known quote.
+# Quotes are kept for QUOTE_TTL_SECONDS so callers asking again right away don't fetch again.
+###
 class SNPPrice:
     _BASE_URL = "http://quote-feed.zacks.com/?t=%s"
     _REQUEST_HEADER = {
         "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.75 Safari/537.36",
         "X-Requested-With": "XMLHttpRequest"
     }
+    # symbol -> (quote, time it was fetched)
+    _quotes = {}
+    _lock = threading.Lock()
 
+    # symbol -> last price, '' when no quote was ever fetched
     @staticmethod
-    def prices(symbols):
-        try:
-            url = SNPPrice._BASE_URL % ",".join(symbols)
-            resp = requests.get(url, timeout=5).content
-            obj = loads(resp)
-            return {k: obj[k].get('last', '') for k in obj}
-        except:
-            pass
-        return {k: '' for k in symbols}
-
+    def prices(symbols, max_age=None):
+        max_age = settings.QUOTE_TTL_SECONDS if max_age is None else max_age
+        now = time.time()
+        with SNPPrice._lock:
+            stale = [_ for _ in symbols
+                     if _ not in SNPPrice._quotes or now - SNPPrice._quotes[_][1] >= max_age]
+
+        chunks = [stale[i:i + settings.QUOTE_CHUNK_SIZE]
+                  for i in range(0, len(stale), settings.QUOTE_CHUNK_SIZE)]
+        # the quotes are shown right away, a failure is not worth waiting for retries
+        pages = FetchEngine().get_all(
+            {i: SNPPrice._BASE_URL % ",".join(chunk) for i, chunk in enumerate(chunks)},
+            headers=SNPPrice._REQUEST_HEADER, timeout=5, retries=0)
+        for i, content in pages.items():
+            try:
+                obj = loads(content)
+                quotes = {k: obj[k].get('last', '') for k in obj}
+            except:
+                continue
+            with SNPPrice._lock:
+                for symbol, quote in quotes.items():
+                    if quote != '':
+                        SNPPrice._quotes[symbol] = (quote, now)
+
+        with SNPPrice._lock:
+            return {_: SNPPrice._quotes[_][0] if _ in SNPPrice._quotes else '' for _ in symbols}
+
+
+###
+# Polls SNPPrice every QUOTE_POLL_SECONDS on a daemon thread and hands only the quotes that
+# changed to the subscribers: callback(symbol -> price) runs on the polling thread.
+# The last polled quotes are in quotes, views read them from there instead of fetching.
+###
+class QuoteService(metaclass=Singleton):
+    def __init__(self, interval=None):
+        self.interval = interval or settings.QUOTE_POLL_SECONDS
+        self.quotes = {}
+        self._symbols = []
+        self._callbacks = []
+        self._wake = threading.Event()
+        self._thread = None
+
+    # replace the polled symbols, new ones are fetched right away
+    def watch(self, symbols):
+        self._symbols = list(symbols)
+        self._wake.set()
+
+    def subscribe(self, callback):
+        self._callbacks.append(callback)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def poll(self):
+        prices = SNPPrice.prices(self._symbols, max_age=self.interval / 2)
+        changed = {symbol: price for symbol, price in prices.items()
+                   if price != '' and self.quotes.get(symbol) != price}
+        self.quotes.update(changed)
+        if changed:
+            for callback in self._callbacks:
+                callback(changed)
+        return changed
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                pass
+            self._wake.wait(self.interval)
+            self._wake.clear()
@@ -0,0 +1,916 @@
+import argparse
+import asyncio
+import datetime
+import io
+import multiprocessing
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from contextlib import redirect_stderr, redirect_stdout
+from glob import glob
+from json import dumps, loads
+from os import chdir
+from os.path import abspath, dirname, join
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from dateutil import parser as date_parser
+
+from analytics import earnings_tables
+from extract import zacks_earnings_announcements
+
+
+# Offline benchmarks for the data pipeline, nothing here touches the network.
+# usage: python3 benchmark.py <benchmark> [options]
+
+_EASTERN_TZ = pytz.timezone('US/Eastern')
+
+
+# best wall time of 'repeat' runs
+def _timeit(func, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+# random walk daily bars for each symbol and quarterly earnings dates inside them
+def _price_fixture(n_symbols, n_earnings, seed=0):
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(end='2021-06-30', periods=n_earnings * 63 + 40, tz=_EASTERN_TZ)
+    histories = {}
+    earnings = {}
+    for i in range(n_symbols):
+        symbol = f'S{i:04d}'
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(days))))
+        histories[symbol] = pd.DataFrame({
+            'Open': close * 0.99, 'High': close * 1.01, 'Low': close * 0.98, 'Close': close,
+            'Volume': rng.integers(1e5, 1e7, len(days)).astype(float),
+            'Dividends': 0.0, 'Stock Splits': 0.0,
+        }, index=days)
+        # newest first, like zacks, some after close (+1 day) and some on non market days
+        offsets = np.arange(n_earnings) * 63 + rng.integers(20, 40, n_earnings)
+        dates = days[len(days) - 1 - offsets].normalize()
+        dates = dates + pd.to_timedelta(rng.integers(0, 2, n_earnings), unit='D')
+        earnings[symbol] = dates.to_pydatetime().tolist()
+    return histories, earnings
+
+
+# SNPData.daily_prices before it was vectorized: a boolean mask and a .loc per date
+def _legacy_daily_prices(price_history, dates):
+    dates = pd.Series(dates)
+
+    def date_upper_bound(
+        df, date): return df.loc[df.loc[df.index >= date].index.min()]
+    def date_lower_bound(df, date): return df.loc[df.loc[df.index < date.replace(
+        hour=0, minute=0)].index.max()]
+
+    pre_daily = pd.DataFrame(
+        [date_lower_bound(price_history, date) for date in dates])
+    pre_daily['Date'] = pre_daily.index
+    pre_daily = pre_daily.reset_index(drop=True)
+
+    post_daily = pd.DataFrame(
+        [date_upper_bound(price_history, date) for date in dates])
+    post_daily['Date'] = post_daily.index
+    post_daily = post_daily.reset_index(drop=True)
+
+    daily = pre_daily.join(post_daily, lsuffix="_Pre", rsuffix="_Post")
+    daily = daily.assign(
+        Point_Change=lambda row: row['Close_Post'] - row['Close_Pre'],
+        Percent_Change=lambda row: (row['Close_Post'] - row['Close_Pre']) * 100 / row['Close_Pre'])
+    daily['Date'] = dates
+    return daily
+
+
+def bench_daily_prices(args):
+    histories, earnings = _price_fixture(args.symbols, args.earnings)
+    print(f"{args.symbols} symbols x {args.earnings} earnings, "
+          f"{len(next(iter(histories.values())))} daily bars each")
+
+    legacy_time, legacy = _timeit(lambda: {
+        symbol: _legacy_daily_prices(histories[symbol], earnings[symbol]) for symbol in histories
+    }, repeat=1)
+    vector_time, tables = _timeit(lambda: earnings_tables(histories, earnings), repeat=args.repeat)
+
+    for symbol in histories:
+        if not np.allclose(legacy[symbol]['Percent_Change'], tables[symbol]['Percent_Change'],
+                           equal_nan=True):
+            raise Exception(f"earnings_tables does not match the legacy tables for {symbol}")
+
+    print(f"legacy per date lookups: {legacy_time:8.3f} s")
+    print(f"earnings_tables:         {vector_time:8.3f} s   ({legacy_time / vector_time:.0f}x)")
+
+
+# page shaped like zacks' earnings announcements: page chrome, several scripts, and the
+# earnings table as json inside one of them
+def _zacks_earnings_page(n_rows, seed=0, end='2021-06-30', filler_rows=2000):
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(end=end, periods=n_rows * 63)[::-63]
+    rows = [[f'{_.month}/{_.day}/{_.year}', f'{_.month}/{_.year}', f'${rng.uniform(0, 3):.2f}',
+             f'${rng.uniform(0, 3):.2f}', '+0.01', '+1.00%',
+             ['After Close', 'Before Open', '--'][rng.integers(0, 3)]] for _ in days]
+    filler = ''.join(f'<div class="row"><span>item {i}</span><a href="/x/{i}">link</a></div>'
+                     for i in range(filler_rows))
+    scripts = ''.join(f'<script>var config_{i} = {{"a": {i}, "b": "{"x" * 200}"}};</script>'
+                      for i in range(30))
+    table = dumps({
+        'earnings_announcements_earnings_table': rows,
+        'earnings_announcements_sales_table': rows,
+    })
+    return (f'<html><head>{scripts}</head><body>{filler}'
+            f'<script>\n  document.obj_data = {table};\n</script>{filler}</body></html>').encode('utf-8')
+
+
+# _EarningsDates.parse_earnings before the targeted extractor: soup, every script, fuzzy dates
+def _legacy_parse_earnings(content):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'html.parser')
+    scripts = soup.find_all('script')
+    table_scripts = [
+        _ for _ in scripts if _.string and "earnings_announcements_earnings_table" in _.string]
+    if len(table_scripts) > 0:
+        js = table_scripts[0].string
+        obj = loads(js[js.find('{'): js.rfind('}')+1])
+        earnings_ann_table = obj["earnings_announcements_earnings_table"]
+        dates = map(lambda _: _EASTERN_TZ.localize(date_parser.parse(_[0], fuzzy=True)), earnings_ann_table)
+        offests = map(lambda _: datetime.timedelta(days=1) if _[
+                      6] == "After Close" else None, earnings_ann_table)
+        return [d + o if o else d for d, o in zip(dates, offests)]
+
+
+# report days of zacks_earnings_announcements the way _EarningsDates.parse_earnings dates them,
+# the day after for reports after the close
+def _reported(dates, after_close):
+    dates = pd.DatetimeIndex(dates) + pd.to_timedelta(after_close.astype(int), unit='D')
+    return list(dates.tz_localize(_EASTERN_TZ))
+
+
+def bench_zacks(args):
+    if args.fixtures:
+        pages = []
+        for path in sorted(glob(join(args.fixtures, '*'))):
+            with open(path, 'rb') as f:
+                pages.append(f.read())
+    else:
+        pages = [_zacks_earnings_page(args.rows, seed=i) for i in range(args.pages)]
+    size = sum(len(_) for _ in pages) / len(pages) / 1024
+    print(f"{len(pages)} pages, {size:.0f} KiB each on average")
+
+    legacy_time, legacy = _timeit(lambda: [_legacy_parse_earnings(_) for _ in pages], repeat=1)
+    extract_time, extracted = _timeit(
+        lambda: [zacks_earnings_announcements(_) for _ in pages], repeat=args.repeat)
+
+    for old, new in zip(legacy, extracted):
+        if (old is None) != (new is None):
+            raise Exception("zacks_earnings_announcements does not match the legacy parser")
+        if old is not None and _reported(*new) != [pd.Timestamp(_) for _ in old]:
+            raise Exception("zacks_earnings_announcements does not match the legacy parser")
+
+    print(f"legacy soup + fuzzy dates: {legacy_time * 1000 / len(pages):8.3f} ms / page")
+    print(f"targeted extractor:        {extract_time * 1000 / len(pages):8.3f} ms / page"
+          f"   ({legacy_time / extract_time:.0f}x)")
+
+
+# home page rows as the treeview holds them: symbol, name, price, averages and a date string
+def _treeview_rows(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2026-01-01') + pd.to_timedelta(rng.integers(0, 365, n_rows), unit='D')
+    return [(f'S{i:06d}', f'Company {rng.integers(n_rows)}', round(rng.uniform(5, 500), 2),
+             round(rng.normal(0, 2), 2), round(rng.normal(0, 3), 2), str(date)[:10])
+            for i, date in enumerate(dates)]
+
+
+# SortTreeview._sort before the row model: every cell parsed again on every click
+def _legacy_sort(cells, data_type, reverse):
+    l = [(cell, k) for k, cell in enumerate(cells)]
+    l.sort(key=lambda t: data_type(t[0]), reverse=reverse)
+    return [k for _, k in l]
+
+
+def bench_sort(args):
+    from rowmodel import RowModel
+    columns = ('Symbol', 'Company Name', 'Current Price', 'Point Average', 'Percent Average', 'Date')
+    sort = ('name', 'name', 'num', 'num', 'num', 'date')
+    parse_date = lambda string: datetime.datetime.strptime(string, "%Y-%m-%d")
+
+    for n_rows in args.rows:
+        rows = _treeview_rows(n_rows)
+        # Tk hands cells back as strings
+        prices = [str(_[2]) for _ in rows]
+        dates = [_[5] for _ in rows]
+
+        legacy_num, _ = _timeit(lambda: _legacy_sort(prices, float, True), args.repeat)
+        legacy_date, _ = _timeit(lambda: _legacy_sort(dates, parse_date, False), args.repeat)
+
+        def build():
+            model = RowModel(columns, sort)
+            for i, row in enumerate(rows):
+                model.add(i, row)
+            return model
+        build_time, model = _timeit(build, 1)
+        cold_num, _ = _timeit(lambda: (model._orders.clear(), model.order('Current Price', True)), args.repeat)
+        cold_date, _ = _timeit(lambda: (model._orders.clear(), model.order('Date')), args.repeat)
+        cached, _ = _timeit(lambda: model.order('Date', True), args.repeat)
+
+        print(f"\n{n_rows} rows, filling the model costs {build_time * 1000:.1f} ms once")
+        print(f"  price column   legacy {legacy_num * 1000:8.2f} ms   row model {cold_num * 1000:8.2f} ms")
+        print(f"  date column    legacy {legacy_date * 1000:8.2f} ms   row model {cold_date * 1000:8.2f} ms")
+        print(f"  cached order, reversed                 {cached * 1000:8.2f} ms")
+
+
+# SearchBox.search before the prefix index: every cell of every row compared on each query
+def _legacy_search(rows, query):
+    return [values for values in rows
+            if any([query.lower() == str(_).lower()[:len(query)] for _ in values])]
+
+
+def bench_search(args):
+    from rowmodel import RowModel
+    columns = ('Symbol', 'Company Name', 'Current Price', 'Point Average', 'Percent Average', 'Date')
+    sort = ('name', 'name', 'num', 'num', 'num', 'date')
+    queries = ['s', 's00', 'S0001', 'comp', 'company 12', 'x']
+
+    for n_rows in args.rows:
+        rows = _treeview_rows(n_rows)
+        model = RowModel(columns, sort)
+        build_time, _ = _timeit(lambda: [model.add(i, row) for i, row in enumerate(rows)], 1)
+        sort_time, _ = _timeit(lambda: model.search(''), 1)
+        print(f"\n{n_rows} rows, filling the model costs {build_time * 1000:.1f} ms,"
+              f" sorting the index {sort_time * 1000:.1f} ms on the first search")
+        for query in queries:
+            legacy, found = _timeit(lambda: _legacy_search(rows, query), args.repeat)
+            indexed, items = _timeit(lambda: model.search(query), args.repeat)
+            print(f"  {query!r:12} {len(items):7} matches   legacy {legacy * 1000:8.2f} ms"
+                  f"   index {indexed * 1000:8.3f} ms")
+        # a refresh renaming one row
+        renamed = list(rows[0])
+        renamed[1] = 'Renamed Company'
+        update_time, _ = _timeit(lambda: model.update(0, renamed), args.repeat)
+        print(f"  updating one row                            index {update_time * 1000:8.3f} ms")
+
+
+# daily bars since 'years' ago and an earnings date every quarter
+def _chart_fixture(years, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end='2026-06-30', periods=252 * years, tz=_EASTERN_TZ)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(index))))
+    history = pd.DataFrame({'Open': close, 'High': close * 1.01, 'Low': close * 0.99,
+                            'Close': close, 'Volume': 1e6}, index=index)
+    dates = pd.Series(index[::63] + pd.Timedelta(hours=16)).values
+    return history, dates
+
+
+def bench_chart(args):
+    import matplotlib
+    matplotlib.use('Agg')
+    import mplfinance as mpf
+    from charts import ChartRenderer, render_chart
+
+    for years in args.years:
+        history, dates = _chart_fixture(years)
+        strings = [str(_)[:10] for _ in dates]
+
+        # StockChart.plot before: a list membership test per bar and every bar drawn
+        def legacy():
+            markers = [_ in strings for _ in [str(_)[:10] for _ in history.index]]
+            addplot = mpf.make_addplot((history['Open'] * 0.95).where(markers),
+                                       type='scatter', marker='^', markersize=200)
+            fig, _ = mpf.plot(history, type='line', addplot=addplot, returnfig=True)
+            fig.canvas.draw()
+            matplotlib.pyplot.close(fig)
+        legacy_time, _ = _timeit(legacy, args.repeat)
+        render_time, _ = _timeit(lambda: render_chart(history, dates), args.repeat)
+
+        renderer = ChartRenderer(stock_data=lambda symbol, start: history)
+        renderer.render('SYM', '2000-01-01', dates)
+        cached_time, _ = _timeit(lambda: renderer.request('SYM', '2000-01-01', dates, lambda symbol, image: None), args.repeat)
+
+        print(f"\n{years} years, {len(history)} bars")
+        print(f"  on the tk thread before   {legacy_time * 1000:8.1f} ms")
+        print(f"  rendered by the worker    {render_time * 1000:8.1f} ms")
+        print(f"  reopened from the cache   {cached_time * 1000:8.3f} ms")
+
+
+def bench_panel(args):
+    from analytics import earnings_panel, earnings_stats, panel_from_tables
+    from store import SNPStore
+
+    for n_symbols in args.symbols:
+        histories, earnings = _price_fixture(n_symbols, args.earnings)
+        tables = earnings_tables(histories, earnings)
+        chdir(tempfile.mkdtemp(prefix='snp-bench-'))
+        store = SNPStore()
+        snp_dict = store.save({symbol: {'table': table} for symbol, table in tables.items()})
+
+        # SNPData.avg_price per symbol, every table decoded from the store first
+        def legacy(n):
+            records = store.load()
+            return {symbol: {'point_avg': records[symbol]['table']['Point_Change'][:n].mean(),
+                             'percent_avg': records[symbol]['table']['Percent_Change'][:n].mean()}
+                    for symbol in records}
+        legacy_time, _ = _timeit(lambda: legacy(10), args.repeat)
+        panel_time, panel = _timeit(
+            lambda: earnings_panel(*store.field_columns(snp_dict, 'table')), args.repeat)
+        tables_time, _ = _timeit(
+            lambda: panel_from_tables(tables, columns=('Point_Change', 'Percent_Change')), args.repeat)
+
+        print(f"\n{n_symbols} symbols x {args.earnings} earnings, {len(panel)} panel rows")
+        print(f"  averages per symbol, tables decoded    {legacy_time * 1000:8.1f} ms")
+        print(f"  panel gathered from the store          {panel_time * 1000:8.1f} ms once"
+              f"   (reactions of tables in memory {tables_time * 1000:.1f} ms)")
+        for n in args.n:
+            stats_time, _ = _timeit(lambda: earnings_stats(panel, n=n), args.repeat)
+            print(f"  all statistics, n={n:<3}                  {stats_time * 1000:8.1f} ms")
+        window_time, _ = _timeit(
+            lambda: earnings_stats(panel, start='2015-01-01', end='2020-01-01'), args.repeat)
+        print(f"  all statistics, 2015-2019 window       {window_time * 1000:8.1f} ms")
+
+
+# a [-before, +after] window per earnings date the way daily_prices used to find its bars,
+# one history lookup and slice per date
+def _legacy_event_windows(histories, earnings, before, after):
+    windows = {}
+    for symbol, dates in earnings.items():
+        history = histories[symbol]
+        rows = []
+        for date in dates:
+            date = pd.Timestamp(date)
+            post = history.index.searchsorted(date)
+            pre = history.index.searchsorted(date.normalize()) - 1
+            if pre < before - 1 or post + after >= len(history):
+                continue
+            close = history['Close']
+            window = pd.concat([close.iloc[pre - before + 1:pre + 1], close.iloc[post:post + after + 1]])
+            rows.append((window / close.iloc[pre] - 1).to_numpy())
+        windows[symbol] = rows
+    return windows
+
+
+def bench_events(args):
+    from analytics import event_study
+
+    for n_symbols in args.symbols:
+        histories, earnings = _price_fixture(n_symbols, args.earnings)
+        legacy_time, _ = _timeit(
+            lambda: _legacy_event_windows(histories, earnings, args.before, args.after), 1)
+        study_time, study = _timeit(
+            lambda: event_study(histories, earnings, args.before, args.after), args.repeat)
+        summary_time, summary = _timeit(lambda: study.summary(10), args.repeat)
+        sort_time, _ = _timeit(lambda: np.argsort(summary['window'].to_numpy(), kind='stable'),
+                               args.repeat)
+
+        print(f"\n{n_symbols} symbols x {args.earnings} earnings, "
+              f"[-{args.before}, +{args.after}] windows, {study.returns.nbytes / 2**20:.1f} MiB of returns")
+        print(f"  window per date, pandas slices     {legacy_time * 1000:9.1f} ms")
+        print(f"  event study, whole universe        {study_time * 1000:9.1f} ms"
+              f"   ({legacy_time / study_time:.0f}x)")
+        print(f"  per symbol summary of 10 reports   {summary_time * 1000:9.1f} ms")
+        print(f"  sorting the home table on it       {sort_time * 1000:9.3f} ms")
+
+
+# traced python memory held by what build returns, and the time it took
+def _traced(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = build()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size, elapsed
+
+
+def bench_memory(args):
+    from api import CompanyInfo
+    from store import SNPArrays, SNPStore
+
+    for n_symbols in args.symbols:
+        histories, earnings = _price_fixture(n_symbols, args.earnings)
+        tables = earnings_tables(histories, earnings)
+        chdir(tempfile.mkdtemp(prefix='snp-bench-'))
+        store = SNPStore()
+        store.save({symbol: {
+            'earnings': earnings[symbol], 'next_earnings': earnings[symbol][:1],
+            'table': table, 'avg': {'point_avg': 0.5, 'percent_avg': 1.0},
+            'detail': 'Company description. ' * 40,
+        } for symbol, table in tables.items()})
+
+        # today's snp_dict once every record was looked at: frames, datetime lists and strings
+        def decoded():
+            records = store.load()
+            return {symbol: {field: records[symbol][field] for field in records[symbol]}
+                    for symbol in records}
+        snp_dict, dict_size, dict_time = _traced(decoded)
+        live = store.load()
+
+        # every field of every symbol read once through the arrays, nothing kept but the arrays
+        def read_all():
+            arrays = SNPArrays(store, live)
+            for symbol in arrays.symbols:
+                for field in SNPStore.FIELDS:
+                    arrays.columns(symbol, field)
+            return arrays
+        arrays, arrays_size, arrays_time = _traced(read_all)
+
+        # CompanyInfo's accessors over the dict of frames vs the arrays
+        info = CompanyInfo.__new__(CompanyInfo)
+        info._snp = type('SNPData', (), {'arrays': lambda self: arrays})()
+        dict_access, _ = _timeit(lambda: [
+            snp_dict[_]['table'][['Date', 'Close_Pre', 'Close_Post', 'Percent_Change']].values
+            for _ in snp_dict], args.repeat)
+        arrays_access, _ = _timeit(lambda: [info.earnings_change(_) for _ in arrays.symbols],
+                                   args.repeat)
+
+        # home rows read while a refresh journals a table between every two of them
+        symbols = arrays.symbols
+
+        def rows_while_journaling():
+            for i, symbol in enumerate(symbols[:args.rows]):
+                store.update(live, symbols[-1 - i], 'table', tables[symbols[-1 - i]])
+                info.earnings_averages(symbol)
+                info.next_earnings_date(symbol, fetch=False)
+                info.earnings_change(symbol)
+        journal_time, _ = _timeit(rows_while_journaling, 1)
+
+        print(f"\n{n_symbols} symbols x {args.earnings} earnings")
+        print(f"  dict of frames and datetime lists  {_mib(dict_size)} MiB"
+              f"   built in {dict_time * 1000:7.1f} ms")
+        print(f"  store columns, every field read    {_mib(arrays_size)} MiB"
+              f"   read in  {arrays_time * 1000:7.1f} ms")
+        print(f"  earnings_change of every symbol    {dict_access * 1000:8.1f} ms from frames,"
+              f" {arrays_access * 1000:.1f} ms from the store columns")
+        print(f"  {args.rows} home rows, journaling between  {journal_time * 1000:8.1f} ms")
+
+
+# modules gui.py used to import on start that are now imported where they are first needed
+_DEFERRED_MODULES = ('matplotlib', 'mplfinance', 'yfinance', 'aiohttp', 'bs4', 'tqdm')
+
+
+# (total ms, module -> cumulative ms of what importing it pulled in) of a fresh interpreter
+# running code, read from its -X importtime report. Modules are the top level imports and the
+# ones they import directly.
+def _import_times(code):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=dirname(abspath(__file__)), capture_output=True, text=True, check=True)
+    total = 0
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # nested imports are indented by two more spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            total += int(cumulative) / 1000
+        if depth <= 1:
+            modules[name.strip()] = int(cumulative) / 1000
+    return total, modules
+
+
+def bench_startup(args):
+    eager = 'import gui, charts; charts._mpf(); ' + '; '.join(
+        f'import {_}' for _ in _DEFERRED_MODULES)
+    eager_total = min(_import_times(eager)[0] for _ in range(args.repeat))
+    runs = [_import_times('import gui') for _ in range(args.repeat)]
+    total, modules = min(runs, key=lambda _: _[0])
+    run = subprocess.run([sys.executable, '-c', 'import gui, sys; print(" ".join(sys.modules))'],
+                         cwd=dirname(abspath(__file__)), capture_output=True, text=True, check=True)
+    loaded = set(run.stdout.split())
+
+    print(f"\nimporting gui.py, best of {args.repeat}")
+    print(f"  everything up front        {eager_total:8.1f} ms")
+    print(f"  heavy imports deferred     {total:8.1f} ms   (budget {args.budget} ms)")
+    children = {name: cumulative for name, cumulative in modules.items() if name != 'gui'}
+    for name, cumulative in sorted(children.items(), key=lambda _: -_[1])[:args.top]:
+        print(f"    {name:<24} {cumulative:8.1f} ms")
+    early = [_ for _ in _DEFERRED_MODULES if _ in loaded]
+    if early:
+        print(f"  imported on start although deferred: {', '.join(early)}")
+    if total > args.budget or early:
+        sys.exit(1)
+
+
+# the home page list filled, sorted and scrolled, every row as a tree item vs the virtual list
+# needs a display, the window stays withdrawn
+def bench_listview(args):
+    import tkinter as tk
+    from gui import SortTreeview, VirtualTreeview
+    columns = ('Symbol', 'Company Name', 'Current Price', 'Point Average', 'Percent Average', 'Date')
+    sort = ('name', 'name', 'num', 'num', 'num', 'date')
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        # nothing is measured without a display, e.g. run it with xvfb-run on a server
+        sys.exit(f"listview needs a display ({e}), try: xvfb-run python benchmark.py listview")
+    root.withdraw()
+    root.geometry('1440x1024')
+
+    for n_rows in args.rows:
+        rows = _treeview_rows(n_rows)
+        print(f"\n{n_rows} rows")
+        # virtual list first, the peak rss of the process only grows
+        for label, tree_class in (('virtual', VirtualTreeview), ('every row', SortTreeview)):
+            tree = tree_class(root, sort, columns=columns, show='headings')
+            tree.pack(fill=tk.BOTH, expand=True)
+            root.update()
+            rss = _peak_rss()
+
+            def build():
+                for row in rows:
+                    tree.insert('', tk.END, values=row)
+                root.update()
+            build_time, _ = _timeit(build, 1)
+            grown = _peak_rss()
+
+            def sort_column():
+                tree._sort_by_date('Date', False)
+                root.update()
+            sort_time, _ = _timeit(sort_column, args.repeat)
+
+            # one page down, for the full tree the scrolled to rows are the ones it draws
+            def scroll():
+                for _ in range(20):
+                    tree.yview('scroll', 1, 'pages')
+                    root.update()
+            scroll_time, _ = _timeit(scroll, args.repeat)
+
+            print(f"  {label:10} build {build_time * 1000:9.1f} ms   sort {sort_time * 1000:8.1f} ms"
+                  f"   page down {scroll_time * 1000 / 20:6.2f} ms"
+                  f"   peak rss +{_mib(None if rss is None else grown - rss)} MiB")
+            tree.destroy()
+    root.destroy()
+
+
+###
+# Local stand-in for every scraped source, served by aiohttp in its own process so it doesn't
+# compete with the build for the GIL. Pages are generated per symbol and answered after
+# 'latency' seconds.
+###
+class _SourceServer:
+    def __init__(self, symbols, latency):
+        self.symbols = symbols
+        self.latency = latency
+        self.url = None
+        self._requests = multiprocessing.Value('i', 0)
+        self._process = None
+
+    @property
+    def requests(self):
+        return self._requests.value
+
+    @requests.setter
+    def requests(self, value):
+        self._requests.value = value
+
+    def _seed(self, symbol):
+        return zlib.crc32(symbol.encode('utf-8'))
+
+    def _wiki(self):
+        rows = ''.join(f'<tr><td>{_}</td><td>{_} Inc.</td><td>Sector</td></tr>' for _ in self.symbols)
+        return (f'<html><body><table><thead><tr><th>Symbol</th><th>Security</th><th>GICS Sector</th>'
+                f'</tr></thead><tbody>{rows}</tbody></table></body></html>')
+
+    def _earnings(self, symbol):
+        end = pd.Timestamp.now().normalize() - pd.Timedelta(days=30)
+        return _zacks_earnings_page(12, seed=self._seed(symbol), end=end, filler_rows=400)
+
+    def _estimates(self, symbol):
+        date = pd.Timestamp.now().normalize() + pd.Timedelta(days=self._seed(symbol) % 80 + 20)
+        return (f'<html><body><table><tbody><tr><td>Current Quarter</td><td>6/2026</td></tr>'
+                f'<tr><td>Next Report Date</td><td>{date.month}/{date.day}/{date.year}</td></tr>'
+                f'</tbody></table></body></html>')
+
+    def _detail(self, symbol):
+        return f'<html><body><p class="description__text">{symbol} makes things. {"x" * 600}</p></body></html>'
+
+    async def _handle(self, request):
+        from aiohttp import web
+        with self._requests.get_lock():
+            self._requests.value += 1
+        await asyncio.sleep(self.latency)
+        parts = request.path.strip('/').split('/')
+        if parts[0] == 'wiki':
+            body = self._wiki()
+        elif parts[0] == 'zacks' and parts[1] == 'research':
+            return web.Response(body=self._earnings(parts[2]), content_type='text/html')
+        elif parts[0] == 'zacks':
+            body = self._estimates(parts[2])
+        else:
+            body = self._detail(parts[1])
+        return web.Response(text=body, content_type='text/html')
+
+    def _serve(self, ports):
+        from aiohttp import web
+
+        async def serve():
+            app = web.Application()
+            app.router.add_get('/{tail:.*}', self._handle)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            ports.put(runner.addresses[0][1])
+            await asyncio.Event().wait()
+
+        asyncio.run(serve())
+
+    def start(self):
+        ports = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=self._serve, args=(ports,), daemon=True)
+        self._process.start()
+        self.url = f'http://127.0.0.1:{ports.get()}'
+        return self.url
+
+    def stop(self):
+        self._process.terminate()
+
+
+# _SourceServer that answers 429 once requests come in faster than 'rate' per second
+class _ThrottlingServer(_SourceServer):
+    def __init__(self, symbols, latency, rate, burst):
+        super().__init__(symbols, latency)
+        self.rate = rate
+        self.burst = burst
+        self._throttled = multiprocessing.Value('i', 0)
+        self._tokens = burst
+        self._stamp = None
+
+    @property
+    def throttled(self):
+        return self._throttled.value
+
+    async def _handle(self, request):
+        from aiohttp import web
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - (self._stamp or now)) * self.rate)
+        self._stamp = now
+        if self._tokens < 1:
+            with self._throttled.get_lock():
+                self._throttled.value += 1
+            return web.Response(status=429)
+        self._tokens -= 1
+        return await super()._handle(request)
+
+
+# yfinance stand-in for PriceFetcher: a random walk per ticker after 'latency' seconds per batch
+class _FakeYahoo:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def __call__(self, tickers, start, end=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        days = pd.bdate_range(start, pd.Timestamp(end) - pd.Timedelta(days=1) if end else None,
+                              tz='America/New_York')
+        histories = {}
+        for ticker in tickers:
+            rng = np.random.default_rng(zlib.crc32(ticker.encode('utf-8')))
+            close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(days))))
+            histories[ticker] = pd.DataFrame({
+                'Open': close, 'High': close * 1.01, 'Low': close * 0.99, 'Close': close,
+                'Volume': 1e6, 'Dividends': 0.0, 'Stock Splits': 0.0}, index=days)
+        return histories
+
+
+# peak resident set size of this process in bytes, None where the platform can't tell
+def _peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _mib(size):
+    return '       -' if size is None else f'{size / 2**20:8.1f}'
+
+
+def _build(prices, trace, workers=0):
+    import api
+    # fresh api singletons, the fetch engine and its cache are kept like in a running app
+    for cls in [api.SNPData, api.CompanyInfo, api._CurrentSPXCompanies, api._EarningsDates]:
+        api.Singleton._instances.pop(cls, None)
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+        snp = api.SNPData(prices=prices, workers=workers)
+    total = time.perf_counter() - start
+    peak = _peak_rss()
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return snp, total, peak
+
+
+def _report(label, snp, total, peak, server, yahoo):
+    print(f"  {label:<20} {total:8.2f} s   peak {_mib(peak)} MiB   "
+          f"{server.requests:6d} http requests   {yahoo.calls:4d} price batches")
+    for stage, (seconds, stage_peak) in snp.timings.items():
+        print(f"      {stage:<18} {seconds:8.2f} s" +
+              (f"   peak {_mib(stage_peak)} MiB" if stage_peak is not None else ""))
+    server.requests = 0
+    yahoo.calls = 0
+
+
+def bench_pipeline(args):
+    import api
+    from fetch import FetchEngine, ResponseCache
+    from prices import PriceFetcher
+
+    for n_symbols in args.symbols:
+        chdir(tempfile.mkdtemp(prefix='snp-bench-'))
+        symbols = [f'S{i:04d}' for i in range(n_symbols)]
+        server = _SourceServer(symbols, args.latency)
+        url = server.start()
+        yahoo = _FakeYahoo(args.price_latency)
+        prices = PriceFetcher(yahoo)
+
+        api._CurrentSPXCompanies._wiki_source = url + '/wiki'
+        api._EarningsDates._EARNINGS_URL = url + '/zacks/research/%s/earnings-announcements'
+        api._EarningsDates._NEXT_EARNINGS_URL = url + '/zacks/quote/%s/detailed-estimates'
+        api.SNPData._MARKET_WATCH_URL = url + '/marketwatch/%s'
+        # earnings pages are always asked for again, like after their ttl ran out,
+        # the stand-in never throttles so pacing is left to the throttle benchmark
+        api.Singleton._instances.pop(FetchEngine, None)
+        FetchEngine(cache=ResponseCache('http_cache', {
+            url + '/wiki': 24 * 60 * 60,
+            url + '/marketwatch/': 30 * 24 * 60 * 60,
+        }), rate_per_host=10000, max_rate_per_host=10000)
+
+        print(f"\n{n_symbols} symbols, {args.latency * 1000:.0f} ms per page, "
+              f"{args.price_latency * 1000:.0f} ms per price batch, peak memory is "
+              f"{'traced python memory' if args.tracemalloc else 'process rss'}")
+
+        snp, total, peak = _build(prices, args.tracemalloc, args.workers)
+        _report('cold build', snp, total, peak, server, yahoo)
+
+        snp, total, peak = _build(prices, args.tracemalloc, args.workers)
+        _report('warm start', snp, total, peak, server, yahoo)
+
+        # a slice of the universe just reported earnings
+        reported = pd.Timestamp.now(tz=_EASTERN_TZ) - pd.Timedelta(days=3)
+        for symbol in symbols[::10]:
+            snp.update(symbol, 'next_earnings', [reported.to_pydatetime()])
+        snp, total, peak = _build(prices, args.tracemalloc, args.workers)
+        _report('incremental refresh', snp, total, peak, server, yahoo)
+        server.stop()
+
+
+def bench_throttle(args):
+    import aiohttp
+    from fetch import FetchEngine, ResponseCache
+    from singleton import Singleton
+
+    symbols = [f'S{i:04d}' for i in range(args.pages)]
+    server = _ThrottlingServer(symbols, args.latency, args.rate, args.burst)
+    url = server.start()
+    urls = {symbol: url + f'/zacks/quote/{symbol}/detailed-estimates' for symbol in symbols}
+    print(f"\n{args.pages} pages, host allows {args.rate:.0f} requests/s (burst {args.burst}), "
+          f"{args.latency * 1000:.0f} ms per page")
+
+    def report(label, total):
+        ok = server.requests
+        print(f"  {label:<10} {total:8.2f} s   {ok:6d} pages   {server.throttled:6d} throttled   "
+              f"{ok / total:8.1f} pages/s")
+        server.requests = 0
+        server._throttled.value = 0
+
+    # 8 requests in flight as fast as the host answers, like the thread pools this replaced
+    async def unpaced():
+        semaphore = asyncio.Semaphore(8)
+        async with aiohttp.ClientSession() as session:
+            async def fetch(page_url):
+                async with semaphore:
+                    async with session.get(page_url) as response:
+                        await response.read()
+            await asyncio.gather(*[fetch(_) for _ in urls.values()])
+
+    start = time.perf_counter()
+    asyncio.run(unpaced())
+    report('unpaced', time.perf_counter() - start)
+
+    Singleton._instances.pop(FetchEngine, None)
+    engine = FetchEngine(cache=ResponseCache(tempfile.mkdtemp(prefix='snp-bench-'), {}),
+                         max_rate_per_host=args.max_rate)
+    start = time.perf_counter()
+    engine.get_all(urls)
+    report('adaptive', time.perf_counter() - start)
+    limiter = engine.limiter(url)
+    print(f"  adaptive limiter settled at {limiter.rate:.1f} requests/s, window {limiter.window:.1f}")
+    server.stop()
+
+
+BENCHMARKS = {
+    'daily_prices': bench_daily_prices,
+    'zacks': bench_zacks,
+    'pipeline': bench_pipeline,
+    'throttle': bench_throttle,
+    'sort': bench_sort,
+    'listview': bench_listview,
+    'search': bench_search,
+    'chart': bench_chart,
+    'panel': bench_panel,
+    'events': bench_events,
+    'memory': bench_memory,
+    'startup': bench_startup,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmarks.')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    daily_prices = subparsers.add_parser(
+        'daily_prices', help='earnings table lookups, legacy vs vectorized')
+    daily_prices.add_argument('--symbols', type=int, default=500)
+    daily_prices.add_argument('--earnings', type=int, default=40)
+    daily_prices.add_argument('--repeat', type=int, default=3)
+
+    zacks = subparsers.add_parser(
+        'zacks', help='zacks earnings announcement parsing, legacy vs targeted extractor')
+    zacks.add_argument('--fixtures', help='directory of saved earnings announcement pages')
+    zacks.add_argument('--pages', type=int, default=50)
+    zacks.add_argument('--rows', type=int, default=40)
+    zacks.add_argument('--repeat', type=int, default=3)
+
+    pipeline = subparsers.add_parser(
+        'pipeline', help='SNPData cold build, warm start and incremental refresh against local stand-ins')
+    pipeline.add_argument('--symbols', type=int, nargs='+', default=[500, 5000])
+    pipeline.add_argument('--latency', type=float, default=0.02, help='seconds per page')
+    pipeline.add_argument('--price-latency', type=float, default=0.2, help='seconds per price batch')
+    pipeline.add_argument('--workers', type=int, default=0,
+                          help='processes parsing pages, a sharded build (see SNPData.refresh)')
+    pipeline.add_argument('--tracemalloc', action='store_true',
+                          help='report traced peak memory per stage, slows the build down')
+
+    throttle = subparsers.add_parser(
+        'throttle', help='fetching from a host that throttles, unpaced vs adaptive rate limiting')
+    throttle.add_argument('--pages', type=int, default=1000)
+    throttle.add_argument('--rate', type=float, default=40, help='requests/s the host allows')
+    throttle.add_argument('--burst', type=int, default=10)
+    throttle.add_argument('--latency', type=float, default=0.05, help='seconds per page')
+    throttle.add_argument('--max-rate', type=float, default=200,
+                          help='ceiling of the adaptive rate, well above what the host allows')
+
+    sort = subparsers.add_parser(
+        'sort', help='treeview column sorts, parsing cells on every click vs the row model')
+    sort.add_argument('--rows', type=int, nargs='+', default=[500, 10000, 100000])
+    sort.add_argument('--repeat', type=int, default=3)
+
+    listview = subparsers.add_parser(
+        'listview', help='home page list with every row as a tree item vs the virtual list, needs a display')
+    listview.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 50000])
+    listview.add_argument('--repeat', type=int, default=3)
+
+    search = subparsers.add_parser(
+        'search', help='search box prefix lookups, scanning every cell vs the prefix index')
+    search.add_argument('--rows', type=int, nargs='+', default=[500, 10000, 100000])
+    search.add_argument('--repeat', type=int, default=3)
+
+    chart = subparsers.add_parser(
+        'chart', help='stock chart of a company, drawn on the tk thread vs the chart renderer')
+    chart.add_argument('--years', type=int, nargs='+', default=[2, 20])
+    chart.add_argument('--repeat', type=int, default=3)
+
+    panel = subparsers.add_parser(
+        'panel', help='earnings reaction statistics, per symbol tables vs the universe wide panel')
+    panel.add_argument('--symbols', type=int, nargs='+', default=[500, 3000])
+    panel.add_argument('--earnings', type=int, default=40)
+    panel.add_argument('--n', type=int, nargs='+', default=[4, 10, 40])
+    panel.add_argument('--repeat', type=int, default=3)
+
+    events = subparsers.add_parser(
+        'events', help='event study windows around every earnings date, per date slices vs vectorized')
+    events.add_argument('--symbols', type=int, nargs='+', default=[500, 3000])
+    events.add_argument('--earnings', type=int, default=40)
+    events.add_argument('--before', type=int, default=5)
+    events.add_argument('--after', type=int, default=5)
+    events.add_argument('--repeat', type=int, default=3)
+
+    memory = subparsers.add_parser(
+        'memory', help='snp_dict in memory, a dict of frames vs the struct of arrays')
+    memory.add_argument('--symbols', type=int, nargs='+', default=[500, 3000])
+    memory.add_argument('--earnings', type=int, default=40)
+    memory.add_argument('--rows', type=int, default=20)
+    memory.add_argument('--repeat', type=int, default=3)
+
+    startup = subparsers.add_parser(
+        'startup', help='import time of gui.py from its -X importtime report, fails over the budget')
+    startup.add_argument('--budget', type=float, default=800, help='milliseconds')
+    startup.add_argument('--top', type=int, default=8, help='slowest top level imports shown')
+    startup.add_argument('--repeat', type=int, default=3)
+
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
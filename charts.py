@@ -0,0 +1,164 @@
+import base64
+import io
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import settings
+from singleton import Singleton
+
+
+# size of the rendered chart in inches, mplfinance's default
+_FIGSIZE = (8, 5.75)
+_DPI = 100
+
+
+# calendar days of dates / a price index, tz aware dates are taken in their own time zone
+def _days(dates):
+    if isinstance(dates, pd.DatetimeIndex):
+        if dates.tz is not None:
+            dates = dates.tz_localize(None)
+        return dates.values.astype('datetime64[D]')
+    return np.array([str(_)[:10] for _ in dates], dtype='datetime64[D]')
+
+
+# matplotlib and mplfinance take longer to import than the rest of the app together, they are
+# imported with the first chart, on the rendering thread. Agg draws without a window, pyplot
+# (imported by mplfinance) must not pick the gui's backend on a worker thread.
+def _mpf():
+    import matplotlib
+    matplotlib.use('Agg')
+    matplotlib.rcParams['axes.unicode_minus'] = False
+    import mplfinance
+    return mplfinance
+
+
+# what a chart depends on of the earnings dates, hashable for the cache
+def _day_key(dates):
+    return tuple(str(_) for _ in _days(dates))
+
+
+###
+# Merge runs of consecutive bars so at most max_bars are left: first open, highest high, lowest
+# low, last close and the summed volume of each run, the way daily bars add up to weekly ones,
+# so the highs and lows of the line keep their place. flags (one per bar) are true for a run
+# when any of its bars is.
+###
+def downsample_ohlc(frame, max_bars, flags=None):
+    flags = np.zeros(len(frame), dtype=bool) if flags is None else np.asarray(flags, dtype=bool)
+    if len(frame) <= max_bars:
+        return frame, flags
+    size = -(-len(frame) // max_bars)
+    starts = np.arange(0, len(frame), size)
+    ends = np.r_[starts[1:], len(frame)] - 1
+
+    def column(name):
+        return frame[name].to_numpy(dtype=np.float64)
+    merged = pd.DataFrame({
+        'Open': column('Open')[starts],
+        'High': np.fmax.reduceat(column('High'), starts),
+        'Low': np.fmin.reduceat(column('Low'), starts),
+        'Close': column('Close')[ends],
+        'Volume': np.add.reduceat(np.nan_to_num(column('Volume')), starts),
+    }, index=frame.index[starts])
+    return merged, np.logical_or.reduceat(flags, starts)
+
+
+###
+# Line chart of a price history with a marker under every bar of an earnings day, rendered
+# with Agg off the Tk thread. Returns the PNG base64 encoded, as tk.PhotoImage(data=...) takes it.
+###
+def render_chart(stock_data, dates, max_bars=None):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    mpf = _mpf()
+    max_bars = max_bars or settings.CHART_MAX_BARS
+    flags = np.isin(_days(stock_data.index), _days(dates))
+    stock_data, flags = downsample_ohlc(stock_data, max_bars, flags)
+
+    # a figure of its own, pyplot would open a window of the gui's backend on this thread
+    fig = Figure(figsize=_FIGSIZE, dpi=_DPI)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    addplot = []
+    if flags.any():
+        addplot.append(mpf.make_addplot(
+            (stock_data['Open'] * 0.95).where(flags), ax=ax, type='scatter', marker='^',
+            markersize=200))
+    mpf.plot(stock_data, type='line', ax=ax, addplot=addplot)
+    # room for the slanted dates
+    fig.subplots_adjust(bottom=0.2)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return base64.b64encode(buffer.getvalue())
+
+
+###
+# Renders charts one at a time on a daemon thread and keeps the last CHART_CACHE_SIZE of them,
+# least recently used first out. A cached chart is reused for OHLCV_REFRESH_SECONDS, the time
+# the price cache serves today's bar before fetching it again.
+#   request(symbol, start, dates, callback): callback(symbol, image) runs on the rendering
+#   thread, image is None when there was no price history or it failed to render
+###
+class ChartRenderer(metaclass=Singleton):
+    def __init__(self, stock_data=None, size=None, max_age=None):
+        if stock_data is None:
+            from api import CompanyInfo
+            stock_data = CompanyInfo().stock_data
+        self.stock_data = stock_data
+        self.size = size or settings.CHART_CACHE_SIZE
+        self.max_age = max_age if max_age is not None else settings.OHLCV_REFRESH_SECONDS
+        # symbol -> (start, dates, image, time it was rendered)
+        self._charts = OrderedDict()
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue()
+        self._thread = None
+
+    def cached(self, symbol, start, dates):
+        key = (start, _day_key(dates))
+        with self._lock:
+            chart = self._charts.get(symbol)
+            if chart is None or chart[:2] != key or time.time() - chart[3] >= self.max_age:
+                return None
+            self._charts.move_to_end(symbol)
+            return chart[2]
+
+    def request(self, symbol, start, dates, callback):
+        image = self.cached(symbol, start, dates)
+        if image is not None:
+            callback(symbol, image)
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._jobs.put((symbol, start, list(dates), callback))
+
+    def render(self, symbol, start, dates):
+        image = self.cached(symbol, start, dates)
+        if image is not None:
+            return image
+        stock_data = self.stock_data(symbol, start)
+        if stock_data is None or len(stock_data) == 0:
+            return None
+        image = render_chart(stock_data, dates)
+        with self._lock:
+            self._charts[symbol] = (start, _day_key(dates), image, time.time())
+            self._charts.move_to_end(symbol)
+            while len(self._charts) > self.size:
+                self._charts.popitem(last=False)
+        return image
+
+    def _run(self):
+        while True:
+            symbol, start, dates, callback = self._jobs.get()
+            try:
+                image = self.render(symbol, start, dates)
+            except Exception:
+                image = None
+            callback(symbol, image)
+
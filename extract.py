@@ -0,0 +1,49 @@
+from json import JSONDecoder
+
+import numpy as np
+import pandas as pd
+
+
+_DECODER = JSONDecoder()
+_ZACKS_EARNINGS_KEY = b'"earnings_announcements_earnings_table"'
+_ZACKS_DATE_FORMAT = '%m/%d/%Y'
+_ZACKS_AFTER_CLOSE = 'After Close'
+_JSON_SPACE = b' \t\r\n'
+
+
+# first position at or after start that is not json whitespace
+def _skip_space(content, start):
+    while content[start:start + 1] and content[start:start + 1] in _JSON_SPACE:
+        start += 1
+    return start
+
+
+###
+# Zacks earnings announcements page -> (dates, after_close)
+# The table is a json array stored under "earnings_announcements_earnings_table" in a script
+# tag of the page, it is located directly in the raw bytes and only that array is decoded.
+#   dates: datetime64[ns] report days (NaT where a row can't be read)
+#   after_close: bool, True where the report came after the close
+# returns None when the page has no earnings table, or the key's value is not an array
+###
+def zacks_earnings_announcements(content):
+    key = content.find(_ZACKS_EARNINGS_KEY)
+    if key < 0:
+        return None
+    # "key" : [ with only whitespace in between, any other value has no table
+    start = _skip_space(content, key + len(_ZACKS_EARNINGS_KEY))
+    if content[start:start + 1] != b':':
+        return None
+    start = _skip_space(content, start + 1)
+    if content[start:start + 1] != b'[':
+        return None
+    try:
+        rows, _ = _DECODER.raw_decode(content[start:].decode('utf-8', 'replace'))
+    except ValueError:
+        return None
+
+    rows = [_ for _ in rows if isinstance(_, list) and len(_) > 6]
+    date_strings = pd.Series([str(_[0]).strip() for _ in rows], dtype=object)
+    dates = pd.to_datetime(date_strings, format=_ZACKS_DATE_FORMAT, errors='coerce')
+    after_close = np.array([_[6] == _ZACKS_AFTER_CLOSE for _ in rows], dtype=bool)
+    return dates.to_numpy(dtype='datetime64[ns]'), after_close
@@ -0,0 +1,350 @@
+import asyncio
+import atexit
+import hashlib
+import queue
+import random
+import threading
+import time
+import zlib
+from json import dumps, loads
+from os import makedirs, remove, replace, scandir
+from os.path import exists, join
+from urllib.parse import urlsplit
+
+import settings
+from singleton import Singleton
+
+
+###
+# On disk cache of page bodies.
+# Bodies are stored zlib compressed under the sha256 of their content so identical pages are
+# kept once, each url has a small entry file pointing at its body with the validators
+# (ETag / Last-Modified) needed to revalidate it. Files are written to a temporary name and
+# moved into place so a crash never leaves a partial entry.
+###
+class ResponseCache:
+    def __init__(self, directory=None, ttl=None):
+        self.directory = directory or settings.HTTP_CACHE_DIR
+        self.ttl = ttl if ttl is not None else settings.HTTP_CACHE_TTL
+        self._bodies = join(self.directory, 'bodies')
+        self._entries = join(self.directory, 'entries')
+        makedirs(self._bodies, exist_ok=True)
+        makedirs(self._entries, exist_ok=True)
+
+    # seconds pages of url stay fresh, None when the source is not cached
+    def ttl_for(self, url):
+        for prefix, ttl in self.ttl.items():
+            if url.startswith(prefix):
+                return ttl
+        return None
+
+    def _entry_path(self, url):
+        return join(self._entries, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def _body_path(self, digest):
+        return join(self._bodies, digest + '.z')
+
+    @staticmethod
+    def _write(path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        replace(tmp_path, path)
+
+    # (entry, body) or (None, None)
+    def lookup(self, url):
+        path = self._entry_path(url)
+        if not exists(path):
+            return None, None
+        try:
+            with open(path, 'rb') as f:
+                entry = loads(f.read())
+            with open(self._body_path(entry['digest']), 'rb') as f:
+                return entry, zlib.decompress(f.read())
+        except Exception:
+            return None, None
+
+    # max_age tightens the source's ttl for callers that need a recent copy
+    def is_fresh(self, url, entry, max_age=None):
+        ttl = self.ttl_for(url)
+        if ttl is not None and max_age is not None:
+            ttl = min(ttl, max_age)
+        return ttl is not None and time.time() - entry['stored_at'] < ttl
+
+    def store(self, url, body, etag=None, last_modified=None):
+        digest = hashlib.sha256(body).hexdigest()
+        if not exists(self._body_path(digest)):
+            self._write(self._body_path(digest), zlib.compress(body))
+        self._write(self._entry_path(url), dumps({
+            'url': url,
+            'digest': digest,
+            'etag': etag,
+            'last_modified': last_modified,
+            'stored_at': time.time(),
+        }).encode('utf-8'))
+
+    # a 304 answer makes the cached body fresh again
+    def touch(self, url, entry):
+        self._write(self._entry_path(url), dumps({**entry, 'stored_at': time.time()}).encode('utf-8'))
+
+    ###
+    # Remove the entries past their ttl that have no ETag or Last-Modified to revalidate with,
+    # they would be fetched again in full anyway, then the bodies no entry points at anymore.
+    ###
+    def prune(self):
+        used = set()
+        for entry_file in scandir(self._entries):
+            try:
+                with open(entry_file.path, 'rb') as f:
+                    entry = loads(f.read())
+            except Exception:
+                continue
+            validator = entry.get('etag') or entry.get('last_modified')
+            if not validator and not self.is_fresh(entry['url'], entry):
+                try:
+                    remove(entry_file.path)
+                    continue
+                except OSError:
+                    pass
+            used.add(entry['digest'])
+        for body_file in scandir(self._bodies):
+            if body_file.name[:-2] not in used:
+                try:
+                    remove(body_file.path)
+                except OSError:
+                    continue
+
+
+# a reply that still said 429 or 5xx after the last retry
+class FetchError(Exception):
+    def __init__(self, url, status):
+        super().__init__(f'{status} from {url}')
+        self.url = url
+        self.status = status
+
+
+###
+# Pacing of the requests to one host.
+# A token bucket spaces requests out to 'rate' per second and an AIMD window bounds how many are
+# in flight. Every healthy reply grows the window and the rate by 1/window (about one request and
+# one request/s per round trip), a 429, a 5xx, a failed request or a reply slower than
+# HTTP_SLOW_SECONDS cuts both by 30%. Replies to requests sent before the last cut don't cut
+# again, so one burst of errors backs off once. A Retry-After header pauses the host for as long
+# as it asks.
+###
+class _HostLimiter:
+    _MIN_RATE = 0.5
+    _DECREASE = 0.7
+
+    def __init__(self, max_concurrency, rate, max_rate):
+        self.max_concurrency = max_concurrency
+        self.max_rate = max_rate
+        self.rate = min(rate, max_rate)
+        self.window = max(1.0, max_concurrency / 2)
+        self.in_flight = 0
+        self._tokens = 1.0
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+        self._cut_at = 0.0
+        self._cond = asyncio.Condition()
+
+    def _refill(self, now):
+        self._tokens = min(self._tokens + (now - self._stamp) * self.rate, max(1.0, self.window))
+        self._stamp = now
+
+    # wait for a slot in the window and a token, returns the time the request may start
+    async def acquire(self):
+        async with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                timeout = None
+                if now < self._paused_until:
+                    timeout = self._paused_until - now
+                elif self.in_flight < int(self.window):
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.in_flight += 1
+                        return now
+                    timeout = (1 - self._tokens) / self.rate
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    # healthy=False for throttled, failed and slow replies
+    async def release(self, started, healthy, retry_after=None):
+        async with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if healthy:
+                self.window = min(self.max_concurrency, self.window + 1 / self.window)
+                self.rate = min(self.max_rate, self.rate + 1 / self.window)
+            elif started >= self._cut_at:
+                self.window = max(1.0, self.window * self._DECREASE)
+                self.rate = max(self._MIN_RATE, self.rate * self._DECREASE)
+                self._tokens = min(self._tokens, 1.0)
+                self._cut_at = now
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            self._cond.notify_all()
+
+
+###
+# Shared asyncio HTTP client for all scraping.
+# One aiohttp session keeps connections alive per host, requests to each host are paced by a
+# _HostLimiter that backs off when the host throttles and speeds up again while it is healthy.
+# The event loop runs on its own daemon thread so the blocking get/get_all wrappers can be
+# called from the Tk thread or worker threads.
+# Pages of sources listed in HTTP_CACHE_TTL are served from the ResponseCache while fresh and
+# revalidated with If-None-Match / If-Modified-Since once they are stale.
+###
+class FetchEngine(metaclass=Singleton):
+    _REQUEST_HEADER = {
+        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.75 Safari/537.36",
+    }
+    _TIMEOUT = 30
+
+    def __init__(self, concurrency_per_host=None, cache=None, rate_per_host=None, max_rate_per_host=None):
+        self.concurrency_per_host = concurrency_per_host or settings.HTTP_CONCURRENCY_PER_HOST
+        self.rate_per_host = rate_per_host or settings.HTTP_RATE_PER_HOST
+        self.max_rate_per_host = max_rate_per_host or settings.HTTP_MAX_RATE_PER_HOST
+        self.cache = cache or ResponseCache()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._session = None
+        self._limiters = {}
+        atexit.register(self.close)
+
+    def limiter(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._limiters:
+            self._limiters[host] = _HostLimiter(
+                self.concurrency_per_host, self.rate_per_host, self.max_rate_per_host)
+        return self._limiters[host]
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+
+    async def _get_session(self):
+        import aiohttp
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=0, limit_per_host=self.concurrency_per_host,
+                keepalive_timeout=settings.HTTP_KEEPALIVE_SECONDS)
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers=self._REQUEST_HEADER)
+        return self._session
+
+    # body of url, failed requests and throttled (429 / 5xx) replies are retried up to
+    # 'retries' times (default HTTP_RETRIES) with jittered exponential backoff, then raised.
+    # cached pages older than max_age seconds are revalidated even if the source's ttl allows them
+    async def fetch(self, url, headers=None, timeout=None, max_age=None, retries=None):
+        import aiohttp
+        retries = settings.HTTP_RETRIES if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                return await self._fetch_once(url, headers, timeout, max_age)
+            except (aiohttp.ClientError, asyncio.TimeoutError, FetchError):
+                if attempt == retries:
+                    raise
+            await asyncio.sleep(settings.HTTP_RETRY_SECONDS * 2 ** attempt * (0.5 + random.random()))
+
+    async def _fetch_once(self, url, headers, timeout, max_age):
+        import aiohttp
+        cacheable = self.cache.ttl_for(url) is not None
+        entry, cached = None, None
+        if cacheable:
+            entry, cached = await asyncio.to_thread(self.cache.lookup, url)
+            if entry is not None and self.cache.is_fresh(url, entry, max_age):
+                return cached
+
+        headers = dict(headers or {})
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        session = await self._get_session()
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self._TIMEOUT)
+        limiter = self.limiter(url)
+        started = await limiter.acquire()
+        healthy, retry_after = False, None
+        try:
+            async with session.get(url, headers=headers, timeout=client_timeout) as response:
+                throttled = response.status == 429 or response.status >= 500
+                healthy = not throttled and time.monotonic() - started < settings.HTTP_SLOW_SECONDS
+                if throttled:
+                    retry_after = self._retry_after(response)
+                    raise FetchError(url, response.status)
+                if response.status == 304 and entry is not None:
+                    await asyncio.to_thread(self.cache.touch, url, entry)
+                    return cached
+                body = await response.read()
+                if cacheable and response.status == 200:
+                    await asyncio.to_thread(
+                        self.cache.store, url, body, response.headers.get('ETag'),
+                        response.headers.get('Last-Modified'))
+                return body
+        finally:
+            await limiter.release(started, healthy, retry_after)
+
+    # callback(key, body or exception) for every key -> url as soon as its request is done
+    async def fetch_each(self, urls, callback, headers=None, timeout=None, max_age=None,
+                         retries=None):
+        async def fetch_one(key, url):
+            try:
+                result = await self.fetch(
+                    url, headers=headers, timeout=timeout, max_age=max_age, retries=retries)
+            except Exception as e:
+                result = e
+            callback(key, result)
+
+        await asyncio.gather(*[fetch_one(key, url) for key, url in urls.items()])
+
+    # key -> body for every key -> url, failed requests map to the exception they raised
+    async def fetch_all(self, urls, headers=None, timeout=None, progress=None, max_age=None,
+                        retries=None):
+        results = {}
+
+        def done(key, result):
+            results[key] = result
+            if progress:
+                progress(key)
+
+        await self.fetch_each(urls, done, headers=headers, timeout=timeout, max_age=max_age,
+                              retries=retries)
+        return results
+
+    def close(self):
+        if self._session is not None:
+            self.run(self._session.close())
+            self._session = None
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def get(self, url, headers=None, timeout=None, max_age=None, retries=None):
+        return self.run(self.fetch(
+            url, headers=headers, timeout=timeout, max_age=max_age, retries=retries))
+
+    def get_all(self, urls, headers=None, timeout=None, progress=None, max_age=None, retries=None):
+        return self.run(self.fetch_all(urls, headers=headers, timeout=timeout, progress=progress,
+                                       max_age=max_age, retries=retries))
+
+    # (key, body or exception) pairs in the order the requests finish, so the caller can handle
+    # each page while the rest download instead of holding every body until the last one is in
+    def iter_all(self, urls, headers=None, timeout=None, max_age=None, retries=None):
+        results = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self.fetch_each(
+            urls, lambda key, result: results.put((key, result)), headers=headers,
+            timeout=timeout, max_age=max_age, retries=retries), self._loop)
+        for _ in range(len(urls)):
+            yield results.get()
+        future.result()
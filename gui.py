@@ -5,65 +5,66 @@ import tkinter.ttk as ttk
 from ttkthemes import ThemedStyle
 
 import numpy as np
+import queue
+import threading
 from datetime import datetime
 from functools import partial
 
-import matplotlib
-matplotlib.use('TkAgg')
-matplotlib.rcParams['axes.unicode_minus'] = False
-
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-from matplotlib.backend_bases import key_press_handler
-import mplfinance as mpf
-
-from api import CompanyInfo, SNPPrice
-
-# truncate long date string (%Y-%m-%d)
-def to_datestrings(dates):
-    return [str(_)[:10] for _ in dates]
+from api import CompanyInfo, QuoteService, SNPData
+from charts import ChartRenderer
+from rowmodel import RowModel
+import settings
 
 # CUSTOM WIDGETS
+# price chart of a company, rendered by the ChartRenderer's thread and shown once it's ready
 class StockChart(ttk.Frame):
+    _POLL_MS = 50
+
     def __init__(self, parent, info, *args, **kwargs):
-        self.companyinfo = CompanyInfo()
         ttk.Frame.__init__(self, parent, *args, **kwargs)
         self.parent = parent
+        self.symbol = info.get('symbol')
+        self.image = None
+        self._charts = queue.Queue()
+
+        self.label = ttk.Label(self, text=f"Loading chart for {self.symbol}")
+        self.label.pack()
 
         try:
-            self.symbol = info['symbol']
             start = info['dates'].min()
-            self.plot(self.symbol, str(start)[:10], to_datestrings(info['dates']))
+            ChartRenderer().request(self.symbol, str(start)[:10], info['dates'],
+                                    lambda symbol, image: self._charts.put(image))
         except:
-            tk.Label(self, text=f"Cannot get chart for {self.symbol}").pack()
-
-    # use matplot lib tk connector to plot stock data
-    def plot(self, symbol, start, dates):
-            stock_data = self.companyinfo.stock_data(symbol, start)
-            markers = ["^" if _ in dates else None for _ in to_datestrings(
-                stock_data.index)]
-            adp = mpf.make_addplot(
-                stock_data['Open'] * 0.95, marker=markers, type="scatter", markersize=200)
-
-            fig = mpf.plot(stock_data, type="line",
-                        addplot=adp, returnfig=True)
-            canvas = FigureCanvasTkAgg(fig[0], master=self)
-            canvas.mpl_connect("key_press_event", key_press_handler)
-            widget = canvas.get_tk_widget()
-            # set chart width/ height
-            # width = int(widget['width'])
-            # height = int(widget['height'])
-            # widget.config(width=width*0.7, height=height*0.7)
-            toolbar = NavigationToolbar2Tk(canvas, self, pack_toolbar=True)
-            toolbar.update()
-            widget.pack()
-            canvas.draw()
+            self.label.config(text=f"Cannot get chart for {self.symbol}")
+            return
+        self.showChart()
+
+    def showChart(self):
+        if not self.winfo_exists():
+            return
+        try:
+            image = self._charts.get_nowait()
+        except queue.Empty:
+            self.after(self._POLL_MS, self.showChart)
+            return
+        if image is None:
+            self.label.config(text=f"Cannot get chart for {self.symbol}")
+            return
+        self.image = tk.PhotoImage(data=image)
+        self.label.config(image=self.image, text='')
 
 # Custom treeview with built in sorting
+# top level rows are mirrored into a RowModel as they are inserted and changed,
+# sorting reorders every row with one set_children call
 class SortTreeview(ttk.Treeview):
     def __init__(self, parent, types, *args, **kwargs):
         ttk.Treeview.__init__(self, parent, *args, **kwargs)
         self.sort = types
+        self.rows = RowModel(self['columns'], types)
+        # last sorted by (column, reverse), items shown while filtered
+        self._sorted = None
+        self._filter = None
+        self._pending_show = None
 
     def heading(self, column, sort_by=None, **kwargs):
         if sort_by and not hasattr(kwargs, 'command'):
@@ -72,23 +73,244 @@ class SortTreeview(ttk.Treeview):
                 kwargs['command'] = partial(func, column, False)
         return super().heading(column, **kwargs)
 
-    def _sort(self, column, reverse, data_type, callback):
-        l = [(self.set(k, column), k) for k in self.get_children('')]
-        l.sort(key=lambda t: data_type(t[0]), reverse=reverse)
-        for index, (_, k) in enumerate(l):
-            self.move(k, '', index)
+    # a row added while filtered is hidden, it isn't one of the shown items, a row added while
+    # sorted takes its place in the order once tk is idle so a burst of inserts sorts once
+    def insert(self, parent, index, iid=None, **kw):
+        item = super().insert(parent, index, iid, **kw)
+        if parent == '':
+            self.rows.add(item, kw.get('values', ()))
+            if self._filter is not None and item not in self._filter:
+                self.detach(item)
+            elif self._sorted and self._pending_show is None:
+                self._pending_show = self.after_idle(self._show)
+        return item
+
+    def item(self, item, option=None, **kw):
+        if 'values' in kw and item in self.rows:
+            self.rows.update(item, kw['values'])
+        return super().item(item, option, **kw)
+
+    def set(self, item, column=None, value=None):
+        if value is not None and item in self.rows:
+            self.rows.set(item, column, value)
+        return super().set(item, column, value)
+
+    def delete(self, *items):
+        for item in items:
+            if item in self.rows:
+                self.rows.remove(item)
+        return super().delete(*items)
+
+    # show only items, in the current sort order, None shows every row again
+    def filter(self, items=None):
+        self._filter = None if items is None else set(items)
+        self._show()
+
+    def _shown(self):
+        order = self.rows.order(*self._sorted) if self._sorted else self.rows.items()
+        if self._filter is None:
+            return order
+        return [_ for _ in order if _ in self._filter]
+
+    def _show(self):
+        if self._pending_show is not None:
+            self.after_cancel(self._pending_show)
+            self._pending_show = None
+        self.set_children('', *self._shown())
+
+    def _sort(self, column, reverse, callback):
+        self._sorted = (column, reverse)
+        self._show()
         self.heading(column, command=partial(callback, column, not reverse))
 
     def _sort_by_num(self, column, reverse):
-        self._sort(column, reverse, float, self._sort_by_num)
+        self._sort(column, reverse, self._sort_by_num)
 
     def _sort_by_name(self, column, reverse):
-        self._sort(column, reverse, str, self._sort_by_name)
+        self._sort(column, reverse, self._sort_by_name)
 
     def _sort_by_date(self, column, reverse):
-        def _str_to_datetime(string):
-            return datetime.strptime(string, "%Y-%m-%d")
-        self._sort(column, reverse, _str_to_datetime, self._sort_by_date)
+        self._sort(column, reverse, self._sort_by_date)
+
+
+# SortTreeview that only materializes the rows in view
+# rows are kept in the RowModel and a values dict under virtual ids ('R0', 'R1', ...), a fixed
+# pool of tree items, one per visible line, is refilled as the list scrolls so building, sorting
+# and scrolling cost about the same for 100 or 100k rows. item, set and delete take the ids
+# returned by insert, selection() and item(..., 'values') work on the pool item showing a row
+class VirtualTreeview(SortTreeview):
+    def __init__(self, parent, types, *args, **kwargs):
+        SortTreeview.__init__(self, parent, types, *args, **kwargs)
+        self._values = {}
+        self._order = []
+        self._offset = 0
+        self._pool = []
+        self._selected = None
+        self._next_id = 0
+        self._pending = None
+        self._resort = False
+        self._scrollcommand = None
+
+        self.bind('<Configure>', self._on_configure)
+        self.bind('<<TreeviewSelect>>', self._on_select, add=True)
+        self.bind('<MouseWheel>', lambda e: self.yview('scroll', -1 if e.delta > 0 else 1, 'units'))
+        self.bind('<Button-4>', lambda e: self.yview('scroll', -1, 'units'))
+        self.bind('<Button-5>', lambda e: self.yview('scroll', 1, 'units'))
+        self.bind('<Prior>', lambda e: self.yview('scroll', -1, 'pages'))
+        self.bind('<Next>', lambda e: self.yview('scroll', 1, 'pages'))
+
+    # the scrollbar's set, called with the first and last visible fraction of the rows
+    def set_scrollcommand(self, command):
+        self._scrollcommand = command
+        self._schedule_render()
+
+    def insert(self, parent, index, iid=None, **kw):
+        if iid is None:
+            iid = f'R{self._next_id}'
+            self._next_id += 1
+        self._values[iid] = tuple(kw.get('values', ()))
+        self.rows.add(iid, self._values[iid])
+        # same as SortTreeview.insert, the next render puts it in its sorted place
+        if self._filter is None or iid in self._filter:
+            self._order.append(iid)
+            self._resort = self._resort or self._sorted is not None
+        self._schedule_render()
+        return iid
+
+    def item(self, item, option=None, **kw):
+        if item not in self._values:
+            return ttk.Treeview.item(self, item, option, **kw)
+        if 'values' in kw:
+            self._values[item] = tuple(kw['values'])
+            self.rows.update(item, self._values[item])
+            self._schedule_render()
+        elif option == 'values':
+            return self._values[item]
+        elif option is None:
+            return {'values': self._values[item]}
+
+    def set(self, item, column=None, value=None):
+        if item not in self._values:
+            return ttk.Treeview.set(self, item, column, value)
+        if column is None:
+            return dict(zip(self['columns'], self._values[item]))
+        index = list(self['columns']).index(column)
+        if value is None:
+            return self._values[item][index]
+        values = list(self._values[item])
+        values[index] = value
+        self._values[item] = tuple(values)
+        self.rows.set(item, column, value)
+        self._schedule_render()
+
+    def delete(self, *items):
+        removed = {_ for _ in items if _ in self._values}
+        for item in removed:
+            del self._values[item]
+            self.rows.remove(item)
+        if removed:
+            self._order = [_ for _ in self._order if _ not in removed]
+            self._schedule_render()
+        pool = [_ for _ in items if _ not in removed]
+        if pool:
+            ttk.Treeview.delete(self, *pool)
+
+    # every row in display order, not just the ones in view
+    def get_children(self, item=None):
+        if item:
+            return ttk.Treeview.get_children(self, item)
+        return tuple(self._order)
+
+    def _show(self):
+        self._order = list(self._shown())
+        self._resort = False
+        self._offset = 0
+        self._schedule_render()
+
+    # scrollbar protocol: ('moveto', fraction) or ('scroll', count, 'units' | 'pages')
+    def yview(self, *args):
+        if not args:
+            return self._fractions()
+        if args[0] == 'moveto':
+            offset = int(float(args[1]) * len(self._order))
+        else:
+            step = len(self._pool) if args[2] == 'pages' else 1
+            offset = self._offset + int(args[1]) * step
+        offset = max(0, min(offset, len(self._order) - len(self._pool)))
+        if offset != self._offset:
+            self._offset = offset
+            self._render()
+
+    def _fractions(self):
+        if len(self._order) == 0:
+            return 0.0, 1.0
+        return (self._offset / len(self._order),
+                min(1.0, (self._offset + len(self._pool)) / len(self._order)))
+
+    # one pool item per line that fits below the headings
+    def _on_configure(self, event):
+        rowheight = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        lines = max(1, event.height // rowheight - 1)
+        while len(self._pool) < lines:
+            self._pool.append(ttk.Treeview.insert(self, '', tk.END))
+        if len(self._pool) > lines:
+            ttk.Treeview.delete(self, *self._pool[lines:])
+            del self._pool[lines:]
+        self._offset = max(0, min(self._offset, len(self._order) - lines))
+        self._render()
+
+    # remember the selected row, not the pool item, so it survives scrolling
+    def _on_select(self, event):
+        selection = ttk.Treeview.selection(self)
+        if len(selection) > 0 and selection[0] in self._pool:
+            index = self._offset + self._pool.index(selection[0])
+            if index < len(self._order):
+                self._selected = self._order[index]
+
+    # a burst of inserts and updates is rendered once when tk is idle
+    def _schedule_render(self):
+        if self._pending is None:
+            self._pending = self.after_idle(self._render)
+
+    # refill the pool with the rows in view, lines past the last row are detached
+    def _render(self):
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+            self._pending = None
+        # rows inserted while sorted, the view stays where it was scrolled to
+        if self._resort:
+            self._order = list(self._shown())
+            self._resort = False
+            self._offset = max(0, min(self._offset, len(self._order) - len(self._pool)))
+        selected = []
+        for line, item in enumerate(self._pool):
+            index = self._offset + line
+            if index < len(self._order):
+                ttk.Treeview.item(self, item, values=self._values[self._order[index]])
+                ttk.Treeview.move(self, item, '', line)
+                if self._order[index] == self._selected:
+                    selected.append(item)
+            else:
+                ttk.Treeview.detach(self, item)
+        if tuple(selected) != ttk.Treeview.selection(self):
+            ttk.Treeview.selection_set(self, selected)
+        if self._scrollcommand:
+            self._scrollcommand(*self._fractions())
+
+
+# lists of settings.GUI_VIRTUAL_ROWS rows or more only materialize the rows in view
+def make_treeview(parent, types, rows, *args, **kwargs):
+    if rows >= settings.GUI_VIRTUAL_ROWS:
+        return VirtualTreeview(parent, types, *args, **kwargs)
+    return SortTreeview(parent, types, *args, **kwargs)
+
+# a virtual list draws its own scrollbar, it has no tk rows for the tree to scroll
+def pack_treeview(parent, tree):
+    if isinstance(tree, VirtualTreeview):
+        scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=tree.yview)
+        tree.set_scrollcommand(scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    tree.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
 
 
 class NavButton(ttk.Frame):
@@ -109,7 +331,8 @@ class CompanyDetailView:
         self.info = {
             'symbol': symbol,
             'earnings_dates': self.companyinfo.earnings_dates(symbol),
-            'next_earnings': self.companyinfo.next_earnings_date(symbol).strftime('%Y-%m-%d'),
+            # the saved date, the view is built on the Tk thread and never fetches
+            'next_earnings': self.companyinfo.next_earnings_date(symbol, fetch=False).strftime('%Y-%m-%d'),
             'average_point_change': abs(round(changes['point_avg'], 2)),
             'average_point_change_pos': True if changes['point_avg'] > 0 else False,
             'average_percent_change': abs(round(changes['percent_avg'], 2)),
@@ -152,11 +375,9 @@ class EarningsInfoView(InfoView):
             'indicator': {},
         }
 
-        prices = SNPPrice.prices([symbol])
+        # the last polled quote, the view is built on the Tk thread and never fetches
+        price = QuoteService().quotes.get(symbol, '')
         for index, values in enumerate(self.companyinfo.earnings_change(self.symbol)):
-            price = prices[symbol]
-            avgs = self.companyinfo.earnings_averages(symbol)
-            next_earnings_date = self.companyinfo.next_earnings_date(symbol)
             info['values'][index] = tuple(
                 self.format_values(info['sort'], [price, *values]))
 
@@ -167,27 +388,91 @@ class SPInfoView(InfoView):
     percentaverage = "Percent Average"
     currentprice = "Current Price"
     earningsdate = "Upcomming Earnings Date"
-
-    def __init__(self):
+    gapaverage = "Gap Average"
+    windowaverage = "Window Average"
+
+    # built from the saved data only, prices arrive from the QuoteService and missing
+    # next earnings dates are fetched in one batch, on_dates(symbol -> date) is called
+    # from a worker thread once they are in
+    # the event study columns start out from the saved study, the refresh thread computes the
+    # day's study afterwards (see update_events)
+    def __init__(self, prices=None, on_dates=None):
         self.companyinfo = CompanyInfo()
+        self.prices = prices or {}
+        self.events = self.event_columns(self.companyinfo.event_summary(compute=False))
         info = {
             'text': 'Current S&P 500 Companies',
-            'columns': ('Symbol', 'Company Name', self.currentprice, 'Point Average', self.percentaverage, self.earningsdate),
-            'sort': ('name', 'name', 'num', 'num', 'num', 'date'),
+            'columns': ('Symbol', 'Company Name', self.currentprice, 'Point Average', self.percentaverage,
+                        self.gapaverage, self.windowaverage, self.earningsdate),
+            'sort': ('name', 'name', 'num', 'num', 'num', 'num', 'num', 'date'),
             'values': {}
         }
+        self.info = info
 
-        prices = SNPPrice.prices([ _['symbol'] for _ in self.companyinfo.companies ])
+        dates = self.companyinfo.next_earnings_dates(
+            [_['symbol'] for _ in self.companyinfo.companies], callback=on_dates)
         for company in self.companyinfo.companies:
-            symbol = company['symbol']
-            name = company['name']
-            price = prices[symbol]
-            avgs = self.companyinfo.earnings_averages(symbol)
-            next_earnings_date = self.companyinfo.next_earnings_date(symbol)
-            info['values'][symbol] = tuple(self.format_values(info['sort'], [
-                                           symbol, name, price, avgs['point_avg'], avgs['percent_avg'], next_earnings_date]))
+            info['values'][company['symbol']] = self.row(company, dates[company['symbol']])
 
-        self.info = info
+    def row(self, company, next_earnings_date=None):
+        symbol = company['symbol']
+        try:
+            avgs = self.companyinfo.earnings_averages(symbol) or {}
+        except KeyError:
+            # new company whose prices are not in yet
+            avgs = {}
+        if next_earnings_date is None:
+            next_earnings_date = self.companyinfo.next_earnings_date(symbol, fetch=False)
+        gap, window = self.events.get(symbol, ('', ''))
+        return tuple(self.format_values(self.info['sort'], [
+            symbol, company['name'], self.prices.get(symbol, ''),
+            avgs.get('point_avg', ''), avgs.get('percent_avg', ''), gap, window, next_earnings_date]))
+
+    # symbol -> (average gap, average window return) in percent of an event summary
+    @staticmethod
+    def event_columns(summary):
+        if summary is None:
+            return {}
+        percent = summary[['gap', 'window']] * 100
+        return {symbol: tuple('' if np.isnan(_) else _ for _ in row)
+                for symbol, row in zip(percent.index, percent.to_numpy())}
+
+    # a new event summary, returns the changed rows and the removed symbols like update
+    def update_events(self, summary):
+        self.events = self.event_columns(summary)
+        return self.update()
+
+    # recompute the rows of symbols (every company when None),
+    # returns the changed rows and the symbols no longer in the S&P 500
+    def update(self, symbols=None):
+        companies = {_['symbol']: _ for _ in self.companyinfo.companies}
+        values = self.info['values']
+        removed = [_ for _ in values if _ not in companies]
+        for symbol in removed:
+            del values[symbol]
+
+        changed = {}
+        for symbol in companies if symbols is None else symbols:
+            if symbol in companies:
+                row = self.row(companies[symbol])
+                if values.get(symbol) != row:
+                    values[symbol] = changed[symbol] = row
+        return changed, removed
+
+    # new quotes, returns symbol -> formatted price of the rows that changed
+    def update_prices(self, prices):
+        self.prices.update(prices)
+        column = self.info['columns'].index(self.currentprice)
+        values = self.info['values']
+        changed = {}
+        for symbol in prices:
+            if symbol in values:
+                price, = self.format_values(['num'], [prices[symbol]])
+                if values[symbol][column] != price:
+                    row = values[symbol]
+                    values[symbol] = (*row[:column], price, *row[column + 1:])
+                    changed[symbol] = price
+        return changed
 
 # UI ELEMENTS
 class InfoPane(ttk.Frame):
@@ -198,8 +483,8 @@ class InfoPane(ttk.Frame):
         self.header = ttk.Label(
             self, text=info['text'], anchor=tk.CENTER, style='Heading.TLabel')
 
-        self.list = SortTreeview(
-            self, info['sort'], columns=info['columns'], show='headings')
+        self.list = make_treeview(
+            self, info['sort'], len(info['values']), columns=info['columns'], show='headings')
 
         if onclick:
             self.list.bind("<ButtonRelease-1>", onclick(self.list))
@@ -209,11 +494,30 @@ class InfoPane(ttk.Frame):
             self.list.heading(
                 column, sort_by=info['sort'][index], text=column, anchor=tk.CENTER)
 
+        # tree item of each value key, used to update rows in place
+        self.items = {}
         for value in info['values']:
-            self.list.insert('', tk.END, values=info['values'][value])
+            self.items[value] = self.list.insert('', tk.END, values=info['values'][value])
 
         self.header.pack(side=tk.TOP, fill=tk.X)
-        self.list.pack(fill=tk.BOTH, expand=True)
+        pack_treeview(self, self.list)
+
+    # update changed rows in place, new keys are appended
+    def update_values(self, values, removed=()):
+        for key in removed:
+            if key in self.items:
+                self.list.delete(self.items.pop(key))
+        for key, row in values.items():
+            if key in self.items:
+                self.list.item(self.items[key], values=row)
+            else:
+                self.items[key] = self.list.insert('', tk.END, values=row)
+
+    # set one cell per key, the rest of each row is left alone
+    def update_column(self, column, values):
+        for key, value in values.items():
+            if key in self.items:
+                self.list.set(self.items[key], column, value)
 
 # 3 classes handle search functionality
 # SearchResult displays the search reslut in a new toplevel
@@ -227,7 +531,8 @@ class SearchResult(ttk.Frame):
 
         self.parent = parent
         self.tree_meta = tree_meta
-        self.list = SortTreeview(self, sort, columns=columns, show='headings')
+        self.list = make_treeview(
+            self, sort, len(value_list), columns=columns, show='headings')
         self.list.bind("<ButtonRelease-1>", self.onClick)
 
         for index, column in enumerate(columns):
@@ -238,7 +543,7 @@ class SearchResult(ttk.Frame):
         for values in value_list:
             self.list.insert('', tk.END, values=values)
 
-        self.list.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        pack_treeview(self, self.list)
 
     def onClick(self, event):
         selection = self.list.selection()
@@ -249,6 +554,9 @@ class SearchResult(ttk.Frame):
             self.parent.destroy()
 
 # Search text entry and button as well as the actual search function
+# typing filters the tree in place once the entry has been still for GUI_SEARCH_DELAY_MS,
+# the button opens the matches in a new window. Lookups go through the prefix index of the
+# tree's symbol and company name cells, which follows the rows as they are refreshed
 class SearchBox(ttk.Frame):
     def __init__(self, parent, root, tree, *args, **kwargs):
         ttk.Frame.__init__(self, parent, *args, **kwargs)
@@ -256,6 +564,8 @@ class SearchBox(ttk.Frame):
         self.root = root
         self.tree = tree
         self.entry = ttk.Entry(self)
+        self._pending = None
+        self._query = ''
 
         try:
             self.searchIcon = tk.PhotoImage(
@@ -266,18 +576,33 @@ class SearchBox(ttk.Frame):
         self.button = NavButton(
             self, image=self.searchIcon, command=self.search)
 
+        self.entry.bind('<KeyRelease>', self.onKey)
+        self.entry.bind('<Return>', lambda event: self.search())
+
         self.entry.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
         self.button.pack(side=tk.BOTTOM)
 
+    def onKey(self, event):
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+        self._pending = self.after(settings.GUI_SEARCH_DELAY_MS, self.filter)
+
+    def matches(self, query):
+        return self.tree.rows.search(query)
+
+    def filter(self):
+        self._pending = None
+        query = self.entry.get().strip()
+        if query == self._query or not self.tree.winfo_exists():
+            return
+        self._query = query
+        self.tree.filter(self.matches(query) if query else None)
+
     def search(self):
-        query = self.entry.get()
+        query = self.entry.get().strip()
         if query == "":
             return
-        selections = []
-        for child in self.tree.get_children():
-            values = self.tree.item(child)['values']
-            if any([query.lower() == str(_).lower()[:len(query)] for _ in values]):
-                selections.append(values)
+        selections = [self.tree.item(_)['values'] for _ in self.matches(query)]
 
         top = tk.Toplevel(self.root)
         tree_meta = {
@@ -404,13 +729,20 @@ class BaseRightCol(ThreeRowFrame):
 
 # App entry point and main Frame
 class MainApplication(ttk.Frame):
-    def __init__(self, parent, views, *args, **kwargs):
+    _POLL_MS = 200
+
+    # updates: queue of (kind, payload) messages for pollUpdates, shared with the views
+    def __init__(self, parent, views, updates=None, *args, **kwargs):
         ttk.Frame.__init__(self, parent, *args, **kwargs)
         self.views = views
+        self.updates = updates or queue.Queue()
         self.snpinfo = views['snp'].info
         self.parent = parent
         self.root = self
         self.sortByImage = None
+        self.infopane = None
+        # data age shown under the company list
+        self.status = tk.StringVar(self)
 
         snp = views['snp']
         self.sortcommands = [
@@ -435,6 +767,77 @@ class MainApplication(ttk.Frame):
         }
 
         self.showSPWindow()
+        self.startRefresh()
+
+    # the window shows the saved data while a worker thread refreshes it and the QuoteService
+    # polls prices, both only queue messages, every widget update happens in pollUpdates on the
+    # Tk thread
+    def startRefresh(self):
+        refreshed_at = SNPData().refreshed_at
+        if len(self.snpinfo['values']) == 0:
+            self.status.set("Building company data, this can take a while...")
+        elif refreshed_at is None:
+            self.status.set("Showing saved data, refreshing...")
+        else:
+            self.status.set(f"Showing data from {datetime.fromtimestamp(refreshed_at):%Y-%m-%d %H:%M}, refreshing...")
+
+        quotes = QuoteService()
+        quotes.subscribe(lambda prices: self.updates.put(('prices', prices)))
+        quotes.watch([_['symbol'] for _ in CompanyInfo().companies])
+        quotes.start()
+
+        threading.Thread(target=self._refresh, daemon=True).start()
+        self.after(self._POLL_MS, self.pollUpdates)
+
+    def _refresh(self):
+        try:
+            # refresh.py may be refreshing the same store, the app then keeps the saved data
+            refreshed = SNPData().refresh(
+                progress=lambda symbols: self.updates.put(('rows', symbols)), blocking=False)
+            self.updates.put(('done' if refreshed else 'busy', None))
+        except Exception as e:
+            self.updates.put(('failed', e))
+        # the event study columns, from the cached price histories
+        try:
+            self.updates.put(('events', CompanyInfo().event_summary()))
+        except Exception:
+            pass
+
+    def pollUpdates(self):
+        snp = self.views['snp']
+        showing = self.infopane is not None and self.infopane.winfo_exists()
+        while True:
+            try:
+                kind, payload = self.updates.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == 'prices':
+                changed = snp.update_prices(payload)
+                if showing:
+                    self.infopane.update_column(snp.currentprice, changed)
+                continue
+
+            if kind == 'rows':
+                changed, removed = snp.update(payload)
+            elif kind == 'events':
+                changed, removed = snp.update_events(payload)
+            elif kind == 'done':
+                # names, additions and removals of the new company list
+                changed, removed = snp.update()
+                QuoteService().watch([_['symbol'] for _ in CompanyInfo().companies])
+                refreshed_at = datetime.fromtimestamp(SNPData().refreshed_at)
+                self.status.set(f"Up to date as of {refreshed_at:%Y-%m-%d %H:%M}")
+            elif kind == 'busy':
+                changed, removed = {}, []
+                self.status.set("Another refresh of the data is running, showing saved data")
+            else:
+                changed, removed = {}, []
+                self.status.set(f"Refresh failed, showing saved data ({payload})")
+
+            if showing:
+                self.infopane.update_values(changed, removed)
+        self.after(self._POLL_MS, self.pollUpdates)
 
     # show the Home page of the app
     def showSPWindow(self):
@@ -450,7 +853,10 @@ class MainApplication(ttk.Frame):
         # left column
         infopane = InfoPane(
             twocols.left, self.snpinfo, onclick=self.spOnClick)
-        infopane.pack(fill=tk.BOTH, expand=True, padx=40, pady=80)
+        ttk.Label(twocols.left, textvariable=self.status, anchor=tk.CENTER).pack(
+            side=tk.BOTTOM, fill=tk.X, padx=40, pady=(0, 40))
+        infopane.pack(fill=tk.BOTH, expand=True, padx=40, pady=(80, 10))
+        self.infopane = infopane
 
         # right column
         rightcol = BaseRightCol(twocols.right, self.button_info)
@@ -551,8 +957,11 @@ if __name__ == "__main__":
     # window size
     root.geometry("1440x1024")
 
-    snpinfoview = SPInfoView()
+    # open from the saved snapshot, MainApplication refreshes it in the background
+    SNPData(refresh=False)
+    updates = queue.Queue()
+    snpinfoview = SPInfoView(on_dates=lambda dates: updates.put(('rows', list(dates))))
     views = {'snp': snpinfoview}
 
-    MainApplication(root, views).pack(side="top", fill="both", expand=True)
+    MainApplication(root, views, updates).pack(side="top", fill="both", expand=True)
     root.mainloop()
@@ -1,31 +1,49 @@
+import argparse
+import pickle
 import PyInstaller.__main__
 from glob import glob
 from shutil import copy
 from os import mkdir
 from os.path import exists
+from store import SNPStore
+
+# --onedir builds dist/gui/, a folder with the executable next to its libraries. It starts
+# faster than the default single file, which unpacks every library to a temporary folder on
+# each launch, but the whole folder has to be shared.
+arguments = argparse.ArgumentParser(description='Build the executable with pyinstaller.')
+arguments.add_argument('--onedir', action='store_true',
+                       help='a folder instead of a single file, no unpacking on start')
+args = arguments.parse_args()
 
 PyInstaller.__main__.run([
     'gui.py',
-    '--onefile',
+    '--onedir' if args.onedir else '--onefile',
     '--windowed'
 ])
 
-if exists('./dist') and exists('./icons') and exists('./snp_dict.pickle'):
+# the data files go next to the executable, the store is converted from snp_dict.pickle the
+# first time, it is generated and not kept in git
+if not exists('./snp_store.dat') and exists('./snp_dict.pickle'):
+    SNPStore().save(pickle.load(open('./snp_dict.pickle', 'rb')))
+
+dist = './dist/gui' if args.onedir else './dist'
+
+if exists(dist) and exists('./icons') and exists('./snp_store.dat'):
     try:
-        mkdir('./dist/icons')
+        mkdir(f'{dist}/icons')
         for filename in glob('./icons/*'):
-            copy(filename, './dist/icons')
-        copy('./snp_dict.pickle', './dist')
-        copy('./README.txt', './dist')
+            copy(filename, f'{dist}/icons')
+        copy('./snp_store.dat', dist)
+        copy('./README.txt', dist)
     except FileExistsError:
-        if exists('./dist/icons'):
+        if exists(f'{dist}/icons'):
             print('ICON FILES ALREADY EXIST IN DIST FOLDER.')
-        if exists('./dist/snp_dict.pickle'):
-            print('snp_dict.pickle ALREADY EXIST IN DIST FOLDER.')
-        if exists('./dist/README.txt'):
+        if exists(f'{dist}/snp_store.dat'):
+            print('snp_store.dat ALREADY EXIST IN DIST FOLDER.')
+        if exists(f'{dist}/README.txt'):
             print('README.txt ALREADY EXIST IN DIST FOLDER.')
     except:
         print("NOT COPYING NECESSARY FILES. SOMETHING WENT WRONG.")
 
 else:
-    print("NOT COPYING NECESSARY FILES. SOMETHING WENT WRONG.")
\ No newline at end of file
+    print("NOT COPYING NECESSARY FILES. SOMETHING WENT WRONG.")
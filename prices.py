@@ -0,0 +1,239 @@
+import threading
+import time
+from os import makedirs, remove, replace, scandir, utime
+from os.path import exists, join
+
+import numpy as np
+import pandas as pd
+import pytz
+
+import settings
+from analytics import PRICE_COLUMNS, eastern_index
+from store import ColumnFile
+
+
+_EASTERN_TZ = pytz.timezone('US/Eastern')
+
+
+# yahoo uses '-' and not '.' in ex BRK-B
+def yahoo_symbol(symbol):
+    return symbol.replace('.', '-')
+
+
+# default fetcher: one yfinance download for a batch of tickers,
+# returns ticker -> daily history laid out like yf.Ticker.history
+# yfinance is imported with the first download, a start from the price cache never needs it
+def yfinance_fetcher(tickers, start, end=None):
+    import yfinance as yf
+    data = yf.download(tickers, start=start, end=end, interval='1d', actions=True,
+                       group_by='ticker', ignore_tz=False, threads=False, progress=False)
+    if data is None or len(data) == 0:
+        return {}
+    if not isinstance(data.columns, pd.MultiIndex):
+        return {tickers[0]: data}
+    return {ticker: data[ticker] for ticker in data.columns.get_level_values(0).unique()}
+
+
+# Batched price download, one request per 'batch_size' tickers over a shared date window.
+# fetcher(tickers, start, end) -> {ticker: DataFrame} can be swapped out to run offline
+class PriceFetcher:
+    def __init__(self, fetcher=None, batch_size=None):
+        self.fetcher = fetcher or yfinance_fetcher
+        self.batch_size = batch_size or settings.PRICE_BATCH_SIZE
+
+    def batches(self, symbols):
+        symbols = list(symbols)
+        for i in range(0, len(symbols), self.batch_size):
+            yield symbols[i:i + self.batch_size]
+
+    # symbol -> daily history, symbols without data map to an empty frame
+    def histories(self, symbols, start, end=None):
+        result = {}
+        for batch in self.batches(symbols):
+            tickers = [yahoo_symbol(_) for _ in batch]
+            try:
+                data = self.fetcher(tickers, start, end)
+            except Exception:
+                data = {}
+            for symbol, ticker in zip(batch, tickers):
+                history = data.get(ticker)
+                if history is None:
+                    result[symbol] = pd.DataFrame()
+                    continue
+                # a batch shares one date index, drop the days this ticker has no bar for
+                result[symbol] = history.dropna(subset=['Close']) if 'Close' in history else history
+        return result
+
+    def history(self, symbol, start, end=None):
+        return self.histories([symbol], start, end)[symbol]
+
+
+# naive calendar day of a date string / datetime, tz aware dates are taken in US/Eastern
+def _day(date):
+    date = pd.Timestamp(date)
+    if date.tz is not None:
+        date = date.tz_convert(_EASTERN_TZ).tz_localize(None)
+    return date.normalize()
+
+
+def _today():
+    return pd.Timestamp.now(tz=_EASTERN_TZ).tz_localize(None).normalize()
+
+
+###
+# On disk daily OHLCV cache, one file per symbol.
+# Each file remembers the range of complete days [start, end) it holds, only the days outside
+# that range are downloaded. Today's bar is never complete, it is served from the cache for
+# OHLCV_REFRESH_SECONDS and then fetched again. Least recently used files are evicted once
+# the cache grows past OHLCV_CACHE_MAX_BYTES.
+###
+class OHLCVCache:
+    def __init__(self, prices=None, directory=None, max_bytes=None, refresh_seconds=None):
+        self.prices = prices or PriceFetcher()
+        self.directory = directory or settings.OHLCV_CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else settings.OHLCV_CACHE_MAX_BYTES
+        self.refresh_seconds = (refresh_seconds if refresh_seconds is not None
+                                else settings.OHLCV_REFRESH_SECONDS)
+        self._lock = threading.RLock()
+        makedirs(self.directory, exist_ok=True)
+
+    def _path(self, symbol):
+        return join(self.directory, f'{symbol}.ohlcv')
+
+    def _read(self, symbol):
+        path = self._path(symbol)
+        if not exists(path):
+            return None, None
+        try:
+            column_file = ColumnFile(path)
+        except Exception:
+            return None, None
+        try:
+            times = np.array(column_file.column('time'))
+            frame = pd.DataFrame({_: np.array(column_file.column(_)) for _ in PRICE_COLUMNS},
+                                 index=pd.DatetimeIndex(times.view('M8[ns]')).tz_localize(
+                                     'UTC').tz_convert(_EASTERN_TZ))
+            meta = column_file.meta
+        finally:
+            column_file.close()
+        # file modification time doubles as the last access time for eviction
+        utime(path)
+        return frame, meta
+
+    def _write(self, symbol, frame, meta):
+        path = self._path(symbol)
+        columns = {'time': eastern_index(frame.index).as_unit('ns').asi8}
+        for column in PRICE_COLUMNS:
+            columns[column] = frame[column].to_numpy(dtype=np.float64) if column in frame \
+                else np.zeros(len(frame))
+        replace(ColumnFile.write(path, columns, meta), path)
+
+    def _evict(self):
+        entries = [_ for _ in scandir(self.directory) if _.name.endswith('.ohlcv')]
+        total = sum(_.stat().st_size for _ in entries)
+        for entry in sorted(entries, key=lambda _: _.stat().st_mtime):
+            if total <= self.max_bytes:
+                break
+            total -= entry.stat().st_size
+            try:
+                remove(entry.path)
+            except OSError:
+                continue
+
+    # days in [start, end) that the cached entry does not cover yet, a gap always reaches the
+    # cached range so the range stays one piece, a request past either end of it fetches the
+    # days in between as well
+    def _gaps(self, meta, start, end, today):
+        if meta is None:
+            return [(start, end)]
+        cached_start, cached_end = pd.Timestamp(meta['start']), pd.Timestamp(meta['end'])
+        gaps = []
+        if start < cached_start:
+            gaps.append((start, cached_start))
+        if end > cached_end:
+            fresh = time.time() - meta['fetched_at'] < self.refresh_seconds
+            # only today's partial bar is missing and it was fetched recently
+            if not (fresh and cached_end >= today):
+                gaps.append((cached_end, end))
+        return gaps
+
+    def _merge(self, symbol, frame, meta, fetched, today):
+        frames = [] if frame is None else [frame]
+        cached_start = None if meta is None else pd.Timestamp(meta['start'])
+        cached_end = None if meta is None else pd.Timestamp(meta['end'])
+        for (gap_start, gap_end), history in fetched:
+            # an empty answer for more than a long weekend is a failed download, not a holiday,
+            # unless it is for the days ahead of bars already cached: there is nothing before a
+            # symbol's first bar, e.g. its IPO, and asking again on every call won't change that
+            head = cached_start is not None and gap_end == cached_start and frame is not None \
+                and len(frame) > 0
+            if len(history) == 0 and (gap_end - gap_start).days > 4 and not head:
+                continue
+            cached_start = gap_start if cached_start is None else min(cached_start, gap_start)
+            cached_end = gap_end if cached_end is None else max(cached_end, gap_end)
+            if len(history) == 0:
+                continue
+            history = history.reindex(columns=PRICE_COLUMNS)
+            history.index = eastern_index(history.index)
+            if len(frames) > 0:
+                days = frames[0].index.tz_localize(None).normalize()
+                frames[0] = frames[0][(days < gap_start) | (days >= gap_end)]
+            frames.append(history)
+
+        if cached_start is None:
+            return frame
+        merged = pd.concat(frames).sort_index() if frames else pd.DataFrame(
+            columns=PRICE_COLUMNS, index=pd.DatetimeIndex([], tz=_EASTERN_TZ))
+        merged = merged[~merged.index.duplicated(keep='last')]
+        self._write(symbol, merged, {
+            'start': str(cached_start.date()),
+            # today and later are not complete days yet
+            'end': str(min(cached_end, today).date()),
+            'fetched_at': time.time(),
+        })
+        return merged
+
+    ###
+    # symbol -> daily history for [start, end), missing days are fetched in batches.
+    # The lock is only held to read the cached files and to merge the downloads into them, not
+    # for the download, so readers of cached days don't wait behind a refresh's price stage.
+    # Files are read again before merging, another thread may have extended them meanwhile.
+    ###
+    def histories(self, symbols, start, end=None):
+        today = _today()
+        start = _day(start)
+        end = min(_day(end), today + pd.Timedelta(days=1)) if end is not None \
+            else today + pd.Timedelta(days=1)
+
+        with self._lock:
+            cached = {symbol: self._read(symbol) for symbol in symbols}
+        # symbols missing the same days share download batches
+        windows = {}
+        for symbol, (frame, meta) in cached.items():
+            for gap in self._gaps(meta, start, end, today):
+                windows.setdefault(gap, []).append(symbol)
+
+        fetched = {symbol: [] for symbol in symbols}
+        for (gap_start, gap_end), gap_symbols in windows.items():
+            histories = self.prices.histories(
+                gap_symbols, str(gap_start.date()), str(gap_end.date()))
+            for symbol in gap_symbols:
+                fetched[symbol].append(((gap_start, gap_end), histories.get(symbol, pd.DataFrame())))
+
+        result = {}
+        with self._lock:
+            for symbol, (frame, meta) in cached.items():
+                if len(fetched[symbol]) > 0:
+                    frame, meta = self._read(symbol)
+                    frame = self._merge(symbol, frame, meta, fetched[symbol], today)
+                if frame is None:
+                    result[symbol] = pd.DataFrame()
+                    continue
+                days = frame.index.tz_localize(None).normalize()
+                result[symbol] = frame[(days >= start) & (days < end)]
+            if len(windows) > 0:
+                self._evict()
+        return result
+
+    def history(self, symbol, start, end=None):
+        return self.histories([symbol], start, end)[symbol]
@@ -0,0 +1,95 @@
+import argparse
+import time
+
+import settings
+from api import SNPData
+from scheduler import RefreshScheduler
+
+
+# Headless refresh of the saved S&P 500 data, run it from cron or keep it running with --loop.
+# Each cycle only scrapes the symbols the schedule says are due, see scheduler.py for the policy.
+# usage: python3 refresh.py [--loop] [--snapshot]
+
+
+# a report whose earnings row is not in yet keeps the symbol polled as if it reported today
+def next_earnings_time(snp, symbol):
+    record = snp.data[symbol]
+    dates = snp.pending_reports(record) or record.get('next_earnings', [])
+    return dates[0].timestamp() if len(dates) > 0 else None
+
+
+# the store stays locked for the whole cycle, an app refreshing it meanwhile skips its refresh
+def cycle(snp, schedule, now=None):
+    with snp.locked():
+        return _cycle(snp, schedule, now)
+
+
+def _cycle(snp, schedule, now=None):
+    now = now or time.time()
+    added, removed = [], []
+    if schedule.companies_due(now):
+        added, removed = snp.refresh_companies(max_age=settings.REFRESH_COMPANIES_SECONDS)
+        schedule.companies_checked = now
+    for symbol in removed:
+        schedule.remove(symbol)
+    # symbols the schedule has not seen yet, e.g. on the first run, are due right away
+    for symbol in snp.data:
+        if symbol not in schedule:
+            schedule.schedule(symbol, None, now, due=now)
+
+    checked = schedule.pop_due(now)
+    changed = snp.refresh_symbols(checked, max_age=settings.REFRESH_HOT_SECONDS) if checked else []
+    for symbol in checked:
+        if symbol in snp.data:
+            schedule.schedule(symbol, next_earnings_time(snp, symbol), now)
+
+    snp.mark_refreshed(checked, now)
+    schedule.save()
+    return {'added': added, 'removed': removed, 'checked': checked, 'changed': changed}
+
+
+def report(result):
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}  checked {len(result['checked'])}, "
+          f"changed {len(result['changed'])}, added {len(result['added'])}, "
+          f"removed {len(result['removed'])}")
+    if result['changed']:
+        print(f"  changed: {' '.join(result['changed'])}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Refresh the saved S&P 500 data')
+    arg_parser.add_argument(
+        '--loop', action='store_true', help='keep running and refresh symbols as they come due')
+    arg_parser.add_argument(
+        '--snapshot', action='store_true',
+        help='write a snapshot and patch to SNAPSHOT_DIR after every cycle that changed something')
+    args = arg_parser.parse_args()
+
+    schedule = RefreshScheduler()
+    snp = SNPData(refresh=False)
+    # nothing saved yet, build everything once
+    if len(snp.data) == 0:
+        snp.refresh()
+        schedule.companies_checked = time.time()
+
+    while True:
+        try:
+            result = cycle(snp, schedule)
+            report(result)
+            if args.snapshot and any(result[_] for _ in ('added', 'removed', 'changed')):
+                print(f"  snapshot {snp.snapshot()}")
+        except Exception as e:
+            if not args.loop:
+                raise
+            print(f"refresh failed: {e}")
+        if not args.loop:
+            return
+
+        wake = min(_ for _ in [schedule.next_due(),
+                               schedule.companies_checked + settings.REFRESH_COMPANIES_SECONDS]
+                   if _ is not None)
+        time.sleep(max(wake - time.time(), 60))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+from bisect import bisect_left, insort
+
+import numpy as np
+
+
+###
+# Sort keys of the rows of a SortTreeview.
+# Every column is a typed numpy array ('num' -> float64, 'date' -> datetime64[D], 'name' -> str)
+# parsed once when a row is added or changed instead of on every sort. The stable argsort of a
+# column is cached until one of its keys changes, a reverse sort is the cached order backwards.
+###
+class RowModel:
+    _DTYPES = {'num': np.float64, 'date': 'datetime64[D]', 'name': object}
+
+    def __init__(self, columns, sort):
+        self.columns = list(columns)
+        self.sort = list(sort)
+        self._items = np.empty(0, dtype=object)
+        self._keys = [np.empty(0, dtype=self._DTYPES.get(_, object)) for _ in self.sort]
+        self._index = {}
+        self._size = 0
+        self._orders = {}
+        # text columns ('name') can be looked up by prefix
+        self._named = [i for i, _ in enumerate(self.sort) if _ == 'name']
+        self.prefixes = PrefixIndex()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, item):
+        return item in self._index
+
+    @staticmethod
+    def key(sort, value):
+        if sort == 'num':
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return np.nan
+        if sort == 'date':
+            try:
+                return np.datetime64(str(value)[:10], 'D')
+            except ValueError:
+                return np.datetime64('NaT')
+        return str(value)
+
+    def _column(self, column):
+        return column if isinstance(column, int) else self.columns.index(column)
+
+    def _grow(self):
+        capacity = max(16, 2 * len(self._items))
+        self._items = np.resize(self._items, capacity)
+        self._keys = [np.resize(_, capacity) for _ in self._keys]
+
+    def add(self, item, values):
+        if self._size == len(self._items):
+            self._grow()
+        self._index[item] = self._size
+        self._items[self._size] = item
+        self._size += 1
+        self.update(item, values)
+
+    def update(self, item, values):
+        row = self._index[item]
+        for i, value in enumerate(values[:len(self.sort)]):
+            self._keys[i][row] = self.key(self.sort[i], value)
+        self.prefixes.index(item, [self._keys[i][row] for i in self._named if i < len(values)])
+        self._orders.clear()
+
+    def set(self, item, column, value):
+        column = self._column(column)
+        row = self._index[item]
+        self._keys[column][row] = self.key(self.sort[column], value)
+        if column in self._named:
+            self.prefixes.index(item, [self._keys[i][row] for i in self._named])
+        self._orders.pop(column, None)
+
+    # the last row takes the removed row's place
+    def remove(self, item):
+        row = self._index.pop(item)
+        self.prefixes.remove(item)
+        last = self._size - 1
+        if row != last:
+            moved = self._items[last]
+            self._items[row] = moved
+            for keys in self._keys:
+                keys[row] = keys[last]
+            self._index[moved] = row
+        self._items[last] = None
+        self._size = last
+        self._orders.clear()
+
+    def clear(self):
+        self.__init__(self.columns, self.sort)
+
+    # items in the order they were added, a removed row's place is taken by the last one
+    def items(self):
+        return self._items[:self._size]
+
+    # items with a text cell starting with prefix, ignoring case
+    def search(self, prefix):
+        return self.prefixes.search(prefix)
+
+    # items sorted by column, cells that didn't parse stay last either way
+    def order(self, column, reverse=False):
+        column = self._column(column)
+        if column not in self._orders:
+            keys = self._keys[column][:self._size]
+            if keys.dtype == object:
+                keys = keys.astype(str)
+                missing = 0
+            elif keys.dtype.kind == 'M':
+                missing = np.isnat(keys).sum()
+            else:
+                missing = np.isnan(keys).sum()
+            order = self._items[:self._size][np.argsort(keys, kind='stable')]
+            self._orders[column] = (order, self._size - missing)
+        order, parsed = self._orders[column]
+        if reverse:
+            return np.concatenate([order[:parsed][::-1], order[parsed:]])
+        return order
+
+
+###
+# Case insensitive prefix lookups over the text cells of the rows.
+# Every (cell, item) pair is kept in one sorted list, the cells starting with a prefix are the
+# slice between bisecting for the prefix and for the prefix followed by the largest code point.
+# The list is sorted once on the first search, after that changing a row only moves its own cells.
+###
+class PrefixIndex:
+    def __init__(self):
+        self._entries = None
+        self._cells = {}
+
+    def __len__(self):
+        return len(self._cells)
+
+    def index(self, item, cells):
+        cells = sorted({str(_).lower() for _ in cells})
+        if self._cells.get(item) == cells:
+            return
+        self.remove(item)
+        self._cells[item] = cells
+        if self._entries is not None:
+            for cell in cells:
+                insort(self._entries, (cell, item))
+
+    def remove(self, item):
+        cells = self._cells.pop(item, ())
+        if self._entries is not None:
+            for cell in cells:
+                del self._entries[bisect_left(self._entries, (cell, item))]
+
+    # matching items in cell order, each item once
+    def search(self, prefix):
+        if self._entries is None:
+            self._entries = sorted((cell, item) for item, cells in self._cells.items() for cell in cells)
+        prefix = str(prefix).lower()
+        start = bisect_left(self._entries, (prefix,))
+        end = bisect_left(self._entries, (prefix + '\U0010ffff',))
+        return list(dict.fromkeys(item for _, item in self._entries[start:end]))
@@ -0,0 +1,107 @@
+import heapq
+import time
+from json import dumps, loads
+from os import replace
+from os.path import exists
+
+import settings
+
+
+_DAY = 24 * 60 * 60
+
+
+###
+# Earnings aware refresh schedule for refresh.py.
+# Every symbol sits in a heap keyed on the time it is due. How long a symbol waits depends on
+# how close its next earnings date is: symbols reporting today or tomorrow (or that reported and
+# whose results are not in yet) are polled every REFRESH_HOT_SECONDS, symbols reporting within
+# REFRESH_SOON_DAYS twice a day and quiet ones about once a week. A quiet symbol is woken when it
+# enters a busier band instead of sleeping through it.
+# The due times are saved as json so the schedule carries over between runs.
+###
+class RefreshScheduler:
+    def __init__(self, path=None):
+        self.path = path or settings.REFRESH_SCHEDULE_PATH
+        # symbol -> due time, heap entries that disagree with it are stale and skipped
+        self._due = {}
+        self._heap = []
+        self.companies_checked = 0
+        self.load()
+
+    def load(self):
+        if not exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                state = loads(f.read())
+        except Exception:
+            return
+        self.companies_checked = state.get('companies_checked', 0)
+        self._due = state.get('due', {})
+        self._heap = [(due, symbol) for symbol, due in self._due.items()]
+        heapq.heapify(self._heap)
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(dumps({'companies_checked': self.companies_checked, 'due': self._due}))
+        replace(tmp_path, self.path)
+
+    def __contains__(self, symbol):
+        return symbol in self._due
+
+    def __len__(self):
+        return len(self._due)
+
+    # seconds until a symbol with next_earnings (epoch seconds or None) is polled again
+    @staticmethod
+    def interval(next_earnings, now):
+        if next_earnings is None:
+            return settings.REFRESH_UNKNOWN_SECONDS
+        until = next_earnings - now
+        if -2 * _DAY <= until <= 2 * _DAY:
+            return settings.REFRESH_HOT_SECONDS
+        if until < 0:
+            # the date passed long ago but the source still lists it
+            return settings.REFRESH_SOON_SECONDS
+        if until <= settings.REFRESH_SOON_DAYS * _DAY:
+            return settings.REFRESH_SOON_SECONDS
+        return settings.REFRESH_QUIET_SECONDS
+
+    def due_time(self, next_earnings, now):
+        due = now + self.interval(next_earnings, now)
+        if next_earnings is not None:
+            for boundary in (next_earnings - settings.REFRESH_SOON_DAYS * _DAY,
+                             next_earnings - 2 * _DAY):
+                if now < boundary < due:
+                    due = boundary
+        return due
+
+    def schedule(self, symbol, next_earnings, now=None, due=None):
+        now = now or time.time()
+        due = self.due_time(next_earnings, now) if due is None else due
+        self._due[symbol] = due
+        heapq.heappush(self._heap, (due, symbol))
+
+    def remove(self, symbol):
+        self._due.pop(symbol, None)
+
+    # time the next symbol is due, None when nothing is scheduled
+    def next_due(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    # pop every symbol due at now, they leave the schedule until rescheduled
+    def pop_due(self, now=None):
+        now = now or time.time()
+        symbols = []
+        while self.next_due() is not None and self._heap[0][0] <= now:
+            due, symbol = heapq.heappop(self._heap)
+            del self._due[symbol]
+            symbols.append(symbol)
+        return symbols
+
+    def companies_due(self, now=None):
+        now = now or time.time()
+        return now - self.companies_checked >= settings.REFRESH_COMPANIES_SECONDS
@@ -0,0 +1,86 @@
+from os import environ
+
+
+# Tunable settings, each one can be overridden with an environment variable of the same name
+
+# tickers requested per yfinance download
+PRICE_BATCH_SIZE = int(environ.get('PRICE_BATCH_SIZE', 50))
+
+# per symbol daily price cache behind CompanyInfo.stock_data
+OHLCV_CACHE_DIR = environ.get('OHLCV_CACHE_DIR', 'ohlcv_cache')
+OHLCV_CACHE_MAX_BYTES = int(environ.get('OHLCV_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+# how long today's partial bar is served from the cache before it is fetched again
+OHLCV_REFRESH_SECONDS = int(environ.get('OHLCV_REFRESH_SECONDS', 15 * 60))
+
+# most concurrent requests to one host, the fetch engine's adaptive window never grows past it
+HTTP_CONCURRENCY_PER_HOST = int(environ.get('HTTP_CONCURRENCY_PER_HOST', 8))
+# requests per second sent to one host at first and at most, the rate adapts in between
+HTTP_RATE_PER_HOST = float(environ.get('HTTP_RATE_PER_HOST', 10))
+HTTP_MAX_RATE_PER_HOST = float(environ.get('HTTP_MAX_RATE_PER_HOST', 50))
+# failed and throttled requests are retried this many times, waiting about
+# HTTP_RETRY_SECONDS, then twice as long for every further retry
+HTTP_RETRIES = int(environ.get('HTTP_RETRIES', 3))
+HTTP_RETRY_SECONDS = float(environ.get('HTTP_RETRY_SECONDS', 1))
+# replies slower than this are taken as a sign the host is overloaded
+HTTP_SLOW_SECONDS = float(environ.get('HTTP_SLOW_SECONDS', 5))
+# idle keep-alive connections are closed after this many seconds
+HTTP_KEEPALIVE_SECONDS = int(environ.get('HTTP_KEEPALIVE_SECONDS', 30))
+
+# on disk cache of scraped pages
+HTTP_CACHE_DIR = environ.get('HTTP_CACHE_DIR', 'http_cache')
+# seconds a cached page is used without asking the server, the first matching url prefix wins,
+# pages of sources not listed here are never cached
+HTTP_CACHE_TTL = {
+    'https://en.wikipedia.org/': 24 * 60 * 60,
+    'https://www.zacks.com/stock/research/': 12 * 60 * 60,  # earnings announcements
+    'https://www.zacks.com/stock/quote/': 6 * 60 * 60,  # next earnings date
+    'https://www.marketwatch.com/': 30 * 24 * 60 * 60,  # company descriptions
+}
+
+# sharded builds: worker processes parsing the scraped pages while the refreshing process
+# downloads them and writes the store, 0 parses them in the refreshing process.
+# Pages go to the workers in shards of BUILD_SHARD_SIZE
+BUILD_WORKERS = int(environ.get('BUILD_WORKERS', 0))
+BUILD_SHARD_SIZE = int(environ.get('BUILD_SHARD_SIZE', 25))
+
+# event study around every earnings date, trading days before and after the report day,
+# and how many of each company's latest reports the home page averages
+EVENT_DAYS_BEFORE = int(environ.get('EVENT_DAYS_BEFORE', 5))
+EVENT_DAYS_AFTER = int(environ.get('EVENT_DAYS_AFTER', 5))
+EVENT_REPORTS = int(environ.get('EVENT_REPORTS', 10))
+EVENT_STUDY_PATH = environ.get('EVENT_STUDY_PATH', 'event_study.npz')
+
+# refresh.py schedule, seconds until a symbol is polled again
+REFRESH_SCHEDULE_PATH = environ.get('REFRESH_SCHEDULE_PATH', 'refresh_schedule.json')
+# reporting today or tomorrow, or reported and the results are not in yet
+REFRESH_HOT_SECONDS = int(environ.get('REFRESH_HOT_SECONDS', 60 * 60))
+# reporting within REFRESH_SOON_DAYS days
+REFRESH_SOON_DAYS = int(environ.get('REFRESH_SOON_DAYS', 15))
+REFRESH_SOON_SECONDS = int(environ.get('REFRESH_SOON_SECONDS', 12 * 60 * 60))
+# next report further out
+REFRESH_QUIET_SECONDS = int(environ.get('REFRESH_QUIET_SECONDS', 7 * 24 * 60 * 60))
+# no next report date known
+REFRESH_UNKNOWN_SECONDS = int(environ.get('REFRESH_UNKNOWN_SECONDS', 24 * 60 * 60))
+# S&P 500 membership
+REFRESH_COMPANIES_SECONDS = int(environ.get('REFRESH_COMPANIES_SECONDS', 24 * 60 * 60))
+
+# current quotes, symbols per quote feed request, seconds a quote is reused and seconds
+# between the home page's background polls
+QUOTE_CHUNK_SIZE = int(environ.get('QUOTE_CHUNK_SIZE', 50))
+QUOTE_TTL_SECONDS = int(environ.get('QUOTE_TTL_SECONDS', 30))
+QUOTE_POLL_SECONDS = int(environ.get('QUOTE_POLL_SECONDS', 60))
+
+# lists with at least this many rows keep only the rows in view as tree items
+GUI_VIRTUAL_ROWS = int(environ.get('GUI_VIRTUAL_ROWS', 1000))
+# milliseconds the search entry has to be still before the list is filtered
+GUI_SEARCH_DELAY_MS = int(environ.get('GUI_SEARCH_DELAY_MS', 150))
+
+# stock charts, bars drawn at most, longer histories are merged into fewer wider bars,
+# and rendered charts kept for reopening a company
+CHART_MAX_BARS = int(environ.get('CHART_MAX_BARS', 500))
+CHART_CACHE_SIZE = int(environ.get('CHART_CACHE_SIZE', 32))
+
+# versioned snapshots of the store and the patches between them (see snapshots.py),
+# the folder they are written to and read from and the number of versions kept there
+SNAPSHOT_DIR = environ.get('SNAPSHOT_DIR', 'snapshots')
+SNAPSHOT_KEEP = int(environ.get('SNAPSHOT_KEEP', 30))
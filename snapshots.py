@@ -0,0 +1,279 @@
+import argparse
+import re
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from os import listdir, makedirs, remove, replace
+from os.path import exists, getsize, join
+
+import numpy as np
+
+import settings
+from store import ColumnFile, SNPStore
+
+
+# Versioned, compressed snapshots of the store and per symbol patches between two versions.
+#   <version>.snap            the store file of a version, zlib compressed
+#   <base>-<version>.patch    the fields of the symbols that changed from base to version
+# Versions are the UTC time of the refresh they hold, YYYYMMDDHHMMSS, so they sort by age.
+# A client whose store is at a version moves to the latest one by applying the patches in
+# between, which are far smaller than a snapshot, and falls back to the latest snapshot
+# when it has no version or the patches it needs are gone.
+# usage: python3 snapshots.py build | update | apply <patch>... | restore [version]
+
+_SNAPSHOT = re.compile(r'^(\d{14})\.snap$')
+_PATCH = re.compile(r'^(\d{14})-(\d{14})\.patch$')
+
+
+# the raw columns of two records' field hold the same values
+def _same(old, new):
+    return old.keys() == new.keys() and all(
+        old[column].tobytes() == new[column].tobytes() for column in old)
+
+
+def _write_compressed(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(zlib.compress(data, 9))
+    replace(tmp_path, path)
+
+
+class Snapshots:
+    def __init__(self, directory=None, keep=None):
+        self.directory = directory or settings.SNAPSHOT_DIR
+        self.keep = keep or settings.SNAPSHOT_KEEP
+
+    # versions with a snapshot, oldest first
+    def versions(self):
+        if not exists(self.directory):
+            return []
+        return sorted(match.group(1) for match in map(_SNAPSHOT.match, listdir(self.directory)) if match)
+
+    # base -> version of every patch
+    def patches(self):
+        if not exists(self.directory):
+            return {}
+        return dict(match.groups() for match in map(_PATCH.match, listdir(self.directory)) if match)
+
+    def snapshot_path(self, version):
+        return join(self.directory, f'{version}.snap')
+
+    def patch_path(self, base, version):
+        return join(self.directory, f'{base}-{version}.patch')
+
+    # a snapshot or patch decompressed into a temporary folder, the path of the column file
+    @contextmanager
+    def _decompressed(self, path):
+        with tempfile.TemporaryDirectory(prefix='snp-snapshot-') as directory:
+            column_path = join(directory, 'snp_store.dat')
+            with open(path, 'rb') as f:
+                data = zlib.decompress(f.read())
+            with open(column_path, 'wb') as f:
+                f.write(data)
+            yield column_path
+
+    # the snapshot of a version opened as a read only store
+    @contextmanager
+    def _open(self, version):
+        with self._decompressed(self.snapshot_path(version)) as path:
+            store = SNPStore(path)
+            try:
+                yield store
+            finally:
+                store.close()
+
+    ###
+    # Save snp_dict, journal included, as a new version of the store and write its snapshot
+    # and the patch from the latest version before it. Versions beyond the last 'keep' are
+    # removed with their patches.
+    #   returns (version, snp_dict rebound to the saved store)
+    ###
+    def build(self, store, snp_dict, version=None):
+        refreshed_at = store.meta.get('refreshed_at') or time.time()
+        version = version or time.strftime('%Y%m%d%H%M%S', time.gmtime(refreshed_at))
+        versions = self.versions()
+        if version in versions:
+            return version, snp_dict
+
+        snp_dict = store.save(snp_dict, {**store.meta, 'version': version})
+        makedirs(self.directory, exist_ok=True)
+        with open(store.path, 'rb') as f:
+            _write_compressed(self.snapshot_path(version), f.read())
+
+        older = [_ for _ in versions if _ < version]
+        if older:
+            self.diff(older[-1], version)
+        self.prune()
+        return version, snp_dict
+
+    ###
+    # Write the patch from base to version: the symbols removed, the fields dropped from
+    # a symbol and the changed fields as raw store columns, one flat column per field over
+    # the symbols that changed, plus the meta values that changed.
+    ###
+    def diff(self, base, version):
+        with self._open(base) as old, self._open(version) as new:
+            old_dict, new_dict = old.load(), new.load()
+            removed = [_ for _ in old_dict if _ not in new_dict]
+            dropped = {}
+            changed = {field: {} for field in SNPStore.FIELDS}
+            for symbol in new_dict:
+                for field in SNPStore.FIELDS:
+                    in_old = symbol in old_dict and field in old_dict[symbol]
+                    if field not in new_dict[symbol]:
+                        if in_old:
+                            dropped.setdefault(symbol, []).append(field)
+                        continue
+                    if in_old and _same(old.raw(old.index(symbol), field),
+                                        new.raw(new.index(symbol), field)):
+                        continue
+                    changed[field][symbol] = new_dict[symbol]
+
+            columns = {}
+            fields = {}
+            for field, records in changed.items():
+                if len(records) == 0:
+                    continue
+                symbols, lengths, values = new.field_columns(records, field)
+                fields[field] = {'symbols': symbols, 'columns': list(values)}
+                columns[f'{field}.lengths'] = lengths
+                for column, array in values.items():
+                    columns[f'{field}.{column}'] = array
+
+            meta = {
+                'base': base, 'version': version, 'removed': removed, 'dropped': dropped,
+                'fields': fields,
+                'meta': {k: v for k, v in new.meta.items() if old.meta.get(k) != v},
+                'unset': [_ for _ in old.meta if _ not in new.meta],
+            }
+
+        path = self.patch_path(base, version)
+        with tempfile.TemporaryDirectory(prefix='snp-patch-') as directory:
+            tmp_path = ColumnFile.write(join(directory, 'patch'), columns, meta)
+            with open(tmp_path, 'rb') as f:
+                _write_compressed(path, f.read())
+        return path
+
+    # (meta, field -> symbol -> raw columns) of a patch, copied out of the file
+    def _read_patch(self, path):
+        with self._decompressed(path) as column_path:
+            patch = ColumnFile(column_path)
+            try:
+                chunks = {}
+                for field, changed in patch.meta['fields'].items():
+                    offsets = np.r_[0, np.cumsum(patch.column(f'{field}.lengths'))]
+                    values = {column: np.array(patch.column(f'{field}.{column}'))
+                              for column in changed['columns']}
+                    chunks[field] = {
+                        symbol: {column: array[offsets[i]:offsets[i + 1]]
+                                 for column, array in values.items()}
+                        for i, symbol in enumerate(changed['symbols'])}
+                return patch.meta, chunks
+            finally:
+                patch.close()
+
+    ###
+    # Apply a patch to a store at its base version and save the result as the patch's version.
+    # Changed fields replace the record's, journaled changes to other fields are kept.
+    #   returns snp_dict rebound to the saved store
+    ###
+    def apply(self, store, snp_dict, path):
+        meta, chunks = self._read_patch(path)
+        if store.meta.get('version') != meta['base']:
+            raise Exception(f"{path} patches version {meta['base']}, "
+                            f"the store is at version {store.meta.get('version')}.")
+
+        for symbol in meta['removed']:
+            snp_dict.pop(symbol, None)
+        for symbol, fields in meta['dropped'].items():
+            for field in fields:
+                if symbol in snp_dict:
+                    snp_dict[symbol].pop(field, None)
+        for field, records in chunks.items():
+            for symbol, chunk in records.items():
+                if symbol not in snp_dict:
+                    snp_dict[symbol] = {}
+                snp_dict[symbol][field] = store.decode(field, chunk)
+
+        store_meta = {**store.meta, **meta['meta']}
+        for key in meta['unset']:
+            store_meta.pop(key, None)
+        return store.save(snp_dict, store_meta)
+
+    # replace the store with a snapshot, the latest by default, and clear its journal
+    #   returns the store's snp_dict
+    def restore(self, store, version=None):
+        version = version or self.versions()[-1]
+        with self._open(version) as snapshot:
+            # the snapshot's records are copied column by column without decoding them
+            return store.save(snapshot.load(), snapshot.meta)
+
+    ###
+    # Move the store to the latest version, through the chain of patches from its own version
+    # when there is one, from the latest snapshot otherwise.
+    #   returns (snp_dict, patches applied or None when the snapshot was restored)
+    ###
+    def update(self, store, snp_dict):
+        versions = self.versions()
+        if len(versions) == 0 or store.meta.get('version') == versions[-1]:
+            return snp_dict, []
+        patches = self.patches()
+        chain = []
+        version = store.meta.get('version')
+        while version in patches:
+            chain.append(self.patch_path(version, patches[version]))
+            version = patches[version]
+        if version != versions[-1]:
+            return self.restore(store), None
+        for path in chain:
+            snp_dict = self.apply(store, snp_dict, path)
+        return snp_dict, chain
+
+    # remove snapshots and patches older than the last 'keep' versions
+    def prune(self):
+        versions = self.versions()
+        stale = set(versions[:-self.keep])
+        for version in stale:
+            remove(self.snapshot_path(version))
+        for base, version in self.patches().items():
+            if version in stale:
+                remove(self.patch_path(base, version))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Versioned snapshots of the saved S&P 500 data')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='snapshot the store and patch the last version')
+    build.add_argument('--version', help='YYYYMMDDHHMMSS, the store\'s refresh time by default')
+    commands.add_parser('update', help='move the store to the latest version')
+    apply = commands.add_parser('apply', help='apply patches to the store, oldest first')
+    apply.add_argument('patches', nargs='+')
+    restore = commands.add_parser('restore', help='replace the store with a snapshot')
+    restore.add_argument('version', nargs='?')
+    args = arg_parser.parse_args()
+
+    snapshots = Snapshots()
+    store = SNPStore()
+    snp_dict = store.load()
+    if args.command == 'build':
+        version, _ = snapshots.build(store, snp_dict, args.version)
+        patches = [_ for _ in snapshots.patches().items() if _[1] == version]
+        print(f"version {version}: snapshot {getsize(snapshots.snapshot_path(version))} bytes"
+              + ''.join(f", patch from {base} {getsize(snapshots.patch_path(base, version))} bytes"
+                        for base, _ in patches))
+    elif args.command == 'update':
+        _, chain = snapshots.update(store, snp_dict)
+        print(f"version {store.meta.get('version')}: " + (
+            'restored the snapshot' if chain is None else f'{len(chain)} patches applied'))
+    elif args.command == 'apply':
+        for path in args.patches:
+            snp_dict = snapshots.apply(store, snp_dict, path)
+        print(f"version {store.meta.get('version')}")
+    else:
+        snapshots.restore(store, args.version)
+        print(f"version {store.meta.get('version')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,741 @@
+import mmap
+import threading
+import time
+import zlib
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from json import dumps, loads
+from os import fsync, replace, remove, stat
+from os.path import exists, getsize, splitext
+
+import numpy as np
+import pandas as pd
+import pytz
+
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
+    import msvcrt
+
+
+_EASTERN_TZ = pytz.timezone('US/Eastern')
+
+# columns of the per symbol earnings table built by SNPData.daily_prices
+TABLE_COLUMNS = ['Open_Pre', 'High_Pre', 'Low_Pre', 'Close_Pre', 'Volume_Pre',
+                 'Dividends_Pre', 'Stock Splits_Pre', 'Date_Pre', 'Open_Post',
+                 'High_Post', 'Low_Post', 'Close_Post', 'Volume_Post', 'Dividends_Post',
+                 'Stock Splits_Post', 'Date_Post', 'Point_Change', 'Percent_Change', 'Date']
+DATE_COLUMNS = ['Date_Pre', 'Date_Post', 'Date']
+
+
+# tz aware dates -> int64 nanoseconds since the epoch (NaT -> iNaT)
+def to_epoch(dates):
+    if len(dates) == 0:
+        return np.empty(0, dtype=np.int64)
+    index = pd.DatetimeIndex(pd.to_datetime(pd.Series(dates), utc=True, errors='coerce'))
+    return index.as_unit('ns').asi8.copy()
+
+
+# int64 nanoseconds since the epoch -> US/Eastern DatetimeIndex
+def from_epoch(values):
+    index = pd.DatetimeIndex(np.array(values, dtype=np.int64).view('M8[ns]'))
+    return index.tz_localize('UTC').tz_convert(_EASTERN_TZ)
+
+
+# Single file columnar container
+# layout: magic | header length | json header | 64 byte aligned flat numpy arrays
+# the file is memory mapped and columns are only viewed when they are first asked for
+class ColumnFile:
+    _MAGIC = b'SNPSTORE'
+    _ALIGN = 64
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:8] != self._MAGIC:
+            self._mmap.close()
+            raise Exception(f"{path} is not a snp store file.")
+        header_length = int.from_bytes(self._mmap[8:16], 'little')
+        header = loads(self._mmap[16:16 + header_length])
+        self.meta = header['meta']
+        self._layout = header['columns']
+        self._start = self._align(16 + header_length)
+        self._columns = {}
+
+    @classmethod
+    def _align(cls, offset):
+        return -(-offset // cls._ALIGN) * cls._ALIGN
+
+    def column(self, name):
+        if name not in self._columns:
+            dtype, length, offset = self._layout[name]
+            self._columns[name] = np.frombuffer(
+                self._mmap, dtype=np.dtype(dtype), count=length, offset=self._start + offset)
+        return self._columns[name]
+
+    # views into the map must be dropped before it can be closed
+    def close(self):
+        self._columns = {}
+        self._mmap.close()
+
+    # write columns to a temporary file and move it into place so readers never see a partial file
+    @classmethod
+    def write(cls, path, columns, meta):
+        layout = {}
+        offset = 0
+        arrays = []
+        for name, array in columns.items():
+            array = np.ascontiguousarray(array)
+            offset = cls._align(offset)
+            layout[name] = [array.dtype.str, len(array), offset]
+            arrays.append((offset, array))
+            offset += array.nbytes
+
+        header = dumps({'meta': meta, 'columns': layout}).encode('utf-8')
+        start = cls._align(16 + len(header))
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(cls._MAGIC)
+            f.write(len(header).to_bytes(8, 'little'))
+            f.write(header)
+            for offset, array in arrays:
+                f.seek(start + offset)
+                f.write(array.tobytes())
+            f.flush()
+            fsync(f.fileno())
+        return tmp_path
+
+
+# One company entry of snp_dict backed by the store file.
+# Fields are decoded on first access, assigned fields shadow the stored ones.
+class _LazyRecord(MutableMapping):
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+        # fields set since the snapshot, and decoded snapshot fields
+        self._values = {}
+        self._cache = {}
+        self._deleted = set()
+
+    # the field is unchanged since the snapshot, so its raw columns can be used as they are
+    def stored(self, field):
+        return (field not in self._deleted and field not in self._values
+                and self._store.has_field(self._index, field))
+
+    def __getitem__(self, field):
+        with self._store._lock:
+            if field in self._values:
+                return self._values[field]
+            if field in self._cache:
+                return self._cache[field]
+            if not self.stored(field):
+                raise KeyError(field)
+            value = self._store.read(self._index, field)
+            self._cache[field] = value
+            return value
+
+    def __setitem__(self, field, value):
+        with self._store._lock:
+            self._deleted.discard(field)
+            self._cache.pop(field, None)
+            self._values[field] = value
+
+    def __delitem__(self, field):
+        with self._store._lock:
+            if field not in self:
+                raise KeyError(field)
+            self._values.pop(field, None)
+            self._cache.pop(field, None)
+            self._deleted.add(field)
+
+    def __contains__(self, field):
+        return field in self._values or self.stored(field)
+
+    def __iter__(self):
+        with self._store._lock:
+            fields = [_ for _ in SNPStore.FIELDS if _ in self]
+            return iter([*fields, *[_ for _ in self._values if _ not in fields]])
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
+# snp_dict backed by the store file, companies are only touched when they are looked up.
+# The Tk thread reads it while the refresh thread writes it, _records only changes and is
+# only iterated under the store's lock.
+class LazySNPDict(MutableMapping):
+    def __init__(self, store):
+        self._store = store
+        self._records = {}
+        self._deleted = set()
+
+    def __getitem__(self, symbol):
+        with self._store._lock:
+            if symbol in self._records:
+                return self._records[symbol]
+            if symbol in self._deleted or not self._store.has_symbol(symbol):
+                raise KeyError(symbol)
+            record = _LazyRecord(self._store, self._store.index(symbol))
+            self._records[symbol] = record
+            return record
+
+    def __setitem__(self, symbol, value):
+        with self._store._lock:
+            self._deleted.discard(symbol)
+            self._records[symbol] = value
+
+    def __delitem__(self, symbol):
+        with self._store._lock:
+            if symbol not in self:
+                raise KeyError(symbol)
+            self._records.pop(symbol, None)
+            self._deleted.add(symbol)
+
+    def __contains__(self, symbol):
+        with self._store._lock:
+            return symbol in self._records or (
+                symbol not in self._deleted and self._store.has_symbol(symbol))
+
+    def __iter__(self):
+        with self._store._lock:
+            stored = [_ for _ in self._store.symbols if _ not in self._deleted]
+            return iter([*stored, *[_ for _ in self._records if not self._store.has_symbol(_)]])
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    # point lazy records at a freshly written store file, which now holds every set field
+    def _rebind(self):
+        self._deleted = set()
+        for symbol, record in self._records.items():
+            if isinstance(record, _LazyRecord):
+                record._index = self._store.index(symbol)
+                record._deleted = set()
+                record._cache.update(record._values)
+                record._values = {}
+
+
+# Append only log of single symbol updates made since the last store snapshot.
+# Every record is one line '<crc32> <json>\n', a torn or corrupt line is skipped on replay
+class SNPJournal:
+    def __init__(self, path):
+        self.path = path
+        self._count = sum(1 for _ in self.records())
+        self.size = getsize(path) if exists(path) else 0
+        self._file = None
+
+    def __len__(self):
+        return self._count
+
+    def records(self):
+        if not exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    continue
+                crc, _, payload = line[:-1].partition(b' ')
+                try:
+                    if int(crc, 16) == zlib.crc32(payload):
+                        yield loads(payload)
+                except ValueError:
+                    continue
+
+    def append(self, record):
+        self.append_many([record])
+
+    # one write and flush for all records
+    def append_many(self, records):
+        if self._file is None:
+            self._file = open(self.path, 'ab+')
+            # start on a fresh line if the last write was torn
+            if self._file.tell() > 0:
+                self._file.seek(-1, 2)
+                if self._file.read(1) != b'\n':
+                    self._file.write(b'\n')
+        lines = []
+        for record in records:
+            payload = dumps(record).encode('utf-8')
+            lines.append(b'%08x %s\n' % (zlib.crc32(payload), payload))
+        data = b''.join(lines)
+        self._file.write(data)
+        self._file.flush()
+        self._count += len(lines)
+        self.size += len(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def truncate(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if exists(self.path):
+            remove(self.path)
+        self._count = 0
+        self.size = 0
+
+
+###
+# Exclusive lock between processes on a file next to the store, so the app and a headless
+# refresh never write the same store at once. It is held by the whole process: threads of
+# the holder pass right through, the store's own lock orders them.
+#   acquire(blocking): the number of holders in this process after it, 0 when another
+#   process holds the lock and blocking is False
+###
+class StoreLock:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._count = 0
+        self._mutex = threading.Lock()
+
+    def _lock(self, blocking):
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                return True
+            except BlockingIOError:
+                return False
+        while True:
+            try:
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.1)
+
+    def acquire(self, blocking=True):
+        with self._mutex:
+            if self._count == 0:
+                self._file = open(self.path, 'a+b')
+                if not self._lock(blocking):
+                    self._file.close()
+                    self._file = None
+                    return 0
+            self._count += 1
+            return self._count
+
+    def release(self):
+        with self._mutex:
+            self._count -= 1
+            if self._count == 0:
+                # closing the file releases the lock
+                self._file.close()
+                self._file = None
+
+    @property
+    def held(self):
+        return self._count > 0
+
+
+# Folds the journal into a new snapshot in the background once it outgrows the snapshot
+class _Compactor(threading.Thread):
+    def __init__(self, store):
+        super().__init__(daemon=True)
+        self._store = store
+        self._wake = threading.Event()
+
+    def notify(self):
+        self._wake.set()
+
+    def run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self._store.compact()
+            except Exception:
+                # the journal is kept and replayed on the next load
+                continue
+
+
+# Columnar on disk store for snp_dict, replaces snp_dict.pickle
+# every field is stored as flat columns shared by all symbols plus an offsets column,
+# a symbol's data is the slice offsets[i]:offsets[i + 1] of each of its field's columns
+class SNPStore:
+    FIELDS = ('earnings', 'next_earnings', 'table', 'avg', 'detail')
+    _FIELD_COLUMNS = {
+        'earnings': ['values'],
+        'next_earnings': ['values'],
+        'table': TABLE_COLUMNS,
+        'avg': ['point_avg', 'percent_avg'],
+        'detail': ['values'],
+    }
+
+    # the journal is folded in once it is larger than the snapshot and at least this many bytes,
+    # so a bulk refresh rewrites the snapshot a few times as it doubles instead of every few records
+    _COMPACT_MIN_BYTES = 1024 * 1024
+
+    def __init__(self, path='snp_store.dat'):
+        self.path = path
+        self._file = None
+        self._index = {}
+        self.symbols = []
+        # snapshot wide values saved alongside the columns, e.g. company names
+        self.meta = {}
+        # guards the store file, it is swapped out from under readers on save
+        self._lock = threading.RLock()
+        self._journal = SNPJournal(splitext(path)[0] + '.journal')
+        self._live = None
+        self._compactor = None
+        self._bulk = 0
+        # bumped on every change of the records, caches built from them compare it
+        self.version = 0
+        # held by the process writing the store (see writing)
+        self.file_lock = StoreLock(splitext(path)[0] + '.lock')
+        if exists(path):
+            self._open()
+        # the store and journal files as this process last left them
+        self._seen = self._disk_state()
+
+    def exists(self):
+        return self._file is not None
+
+    # release the store file, e.g. before the folder it is in is removed
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _open(self):
+        self._file = ColumnFile(self.path)
+        self.symbols = self._file.meta['symbols']
+        self.meta = {k: v for k, v in self._file.meta.items() if k != 'symbols'}
+        self._index = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    def _disk_state(self):
+        def state(path):
+            if not exists(path):
+                return None
+            info = stat(path)
+            return info.st_ino, info.st_size, info.st_mtime_ns
+        return state(self.path), state(self._journal.path)
+
+    ###
+    # Hold the lock between processes while writing. When another process wrote the store since
+    # this one last did, the snapshot and journal are read again first and the live snp_dict is
+    # updated in place, so writes always go on top of the latest data.
+    #   yields False without writing when blocking is False and another process holds the lock
+    ###
+    @contextmanager
+    def writing(self, blocking=True):
+        holders = self.file_lock.acquire(blocking)
+        if holders == 0:
+            yield False
+            return
+        try:
+            # nested and concurrent writers of this process find the files as it left them
+            with self._lock:
+                if holders == 1 and self._disk_state() != self._seen:
+                    self._reload()
+            yield True
+        finally:
+            with self._lock:
+                self._seen = self._disk_state()
+                self.file_lock.release()
+
+    def _reload(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._journal.close()
+        self._journal = SNPJournal(self._journal.path)
+        self.symbols, self._index, self.meta = [], {}, {}
+        if exists(self.path):
+            self._open()
+        live = self._live
+        fresh = self.load()
+        if isinstance(live, LazySNPDict):
+            live._records, live._deleted = fresh._records, fresh._deleted
+            self._live = live
+        self.version += 1
+
+    def has_symbol(self, symbol):
+        return symbol in self._index
+
+    def index(self, symbol):
+        return self._index[symbol]
+
+    def has_field(self, index, field):
+        with self._lock:
+            present = self._file.column('present')[index]
+        return bool(present & (1 << self.FIELDS.index(field)))
+
+    def raw(self, index, field):
+        offsets = self._file.column(f'{field}.offsets')
+        start, end = offsets[index], offsets[index + 1]
+        return {column: self._file.column(f'{field}.{column}')[start:end]
+                for column in self._FIELD_COLUMNS[field]}
+
+    def read(self, index, field):
+        with self._lock:
+            return self.decode(field, self.raw(index, field))
+
+    # snapshot with the journal replayed on top
+    def load(self):
+        snp_dict = LazySNPDict(self)
+        for record in self._journal.records():
+            if record['op'] == 'meta':
+                self.meta[record['key']] = record['value']
+                continue
+            symbol = record['symbol']
+            if record['op'] == 'delete':
+                if record.get('field') is None:
+                    snp_dict.pop(symbol, None)
+                elif symbol in snp_dict:
+                    snp_dict[symbol].pop(record['field'], None)
+                continue
+            if symbol not in snp_dict:
+                snp_dict[symbol] = {}
+            field = record['field']
+            snp_dict[symbol][field] = self.decode(field, {
+                column: np.array(values, dtype=self._dtype(field, column))
+                for column, values in record['value'].items()})
+        self._live = snp_dict
+        return snp_dict
+
+    # set one field of one symbol and log it, the snapshot is left alone
+    def update(self, snp_dict, symbol, field, value):
+        self.update_many(snp_dict, field, {symbol: value})
+
+    # set one field of several symbols, logged with a single journal write
+    def update_many(self, snp_dict, field, values):
+        if len(values) == 0:
+            return
+        with self.writing(), self._lock:
+            records = []
+            for symbol, value in values.items():
+                if symbol not in snp_dict:
+                    snp_dict[symbol] = {}
+                snp_dict[symbol][field] = value
+                records.append({
+                    'op': 'set',
+                    'symbol': symbol,
+                    'field': field,
+                    'value': {column: column_values.tolist()
+                              for column, column_values in self.encode(field, value).items()},
+                })
+            self._live = snp_dict
+            self.version += 1
+            self._journal.append_many(records)
+            self._schedule_compaction()
+
+    # drop a symbol, or only one of its fields, and log it
+    def delete(self, snp_dict, symbol, field=None):
+        with self.writing(), self._lock:
+            if field is None:
+                snp_dict.pop(symbol, None)
+            elif symbol in snp_dict:
+                snp_dict[symbol].pop(field, None)
+            self._live = snp_dict
+            self.version += 1
+            self._journal.append({'op': 'delete', 'symbol': symbol, 'field': field})
+            self._schedule_compaction()
+
+    # set one snapshot wide value, it is written into the snapshot on the next save
+    def set_meta(self, key, value):
+        with self.writing(), self._lock:
+            self.meta[key] = value
+            self._journal.append({'op': 'meta', 'key': key, 'value': value})
+            self._schedule_compaction()
+
+    # compaction waits while a bulk update runs, the caller saves once it is done
+    @contextmanager
+    def bulk(self):
+        with self._lock:
+            self._bulk += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._bulk -= 1
+
+    def _schedule_compaction(self):
+        if self._bulk > 0:
+            return
+        snapshot_size = getsize(self.path) if self.exists() else 0
+        if self._journal.size < max(self._COMPACT_MIN_BYTES, snapshot_size):
+            return
+        if self._compactor is None:
+            self._compactor = _Compactor(self)
+            self._compactor.start()
+        self._compactor.notify()
+
+    # the lock between processes is taken first, readers must not wait on another process
+    def compact(self):
+        with self.writing(), self._lock:
+            if self._live is not None and len(self._journal) > 0:
+                self.save(self._live)
+
+    def encode(self, field, value):
+        if field in ('earnings', 'next_earnings'):
+            return {'values': to_epoch(value)}
+        if field == 'detail':
+            return {'values': np.frombuffer(str(value).encode('utf-8'), dtype=np.uint8)}
+        if field == 'avg':
+            return {column: np.array([value[column]], dtype=np.float64)
+                    for column in self._FIELD_COLUMNS['avg']}
+
+        chunk = {}
+        for column in TABLE_COLUMNS:
+            if column not in value:
+                chunk[column] = (np.full(len(value), np.iinfo(np.int64).min)
+                                 if column in DATE_COLUMNS else np.full(len(value), np.nan))
+            elif column in DATE_COLUMNS:
+                chunk[column] = to_epoch(value[column])
+            else:
+                chunk[column] = pd.to_numeric(value[column], errors='coerce').to_numpy(
+                    dtype=np.float64, na_value=np.nan)
+        return chunk
+
+    def decode(self, field, chunk):
+        if field in ('earnings', 'next_earnings'):
+            return from_epoch(chunk['values']).to_pydatetime().tolist()
+        if field == 'detail':
+            return chunk['values'].tobytes().decode('utf-8')
+        if field == 'avg':
+            return {column: float(chunk[column][0]) for column in chunk}
+
+        return pd.DataFrame({
+            column: pd.Series(from_epoch(chunk[column])) if column in DATE_COLUMNS
+            else np.array(chunk[column])
+            for column in TABLE_COLUMNS
+        })
+
+    # one field of every record as flat columns: (symbols, number of values of each symbol,
+    # column -> values), stored values are sliced out of the snapshot without decoding them
+    def field_columns(self, snp_dict, field):
+        with self._lock:
+            symbols = []
+            lengths = []
+            chunks = []
+            for symbol in snp_dict:
+                record = snp_dict[symbol]
+                if isinstance(record, _LazyRecord) and record.stored(field):
+                    chunk = self.raw(record._index, field)
+                elif field in record:
+                    chunk = self.encode(field, record[field])
+                else:
+                    continue
+                symbols.append(symbol)
+                lengths.append(len(chunk[self._FIELD_COLUMNS[field][0]]))
+                chunks.append(chunk)
+            columns = {column: np.concatenate([np.empty(0, dtype=self._dtype(field, column)),
+                                               *[_[column] for _ in chunks]])
+                       for column in self._FIELD_COLUMNS[field]}
+        return symbols, np.array(lengths, dtype=np.int64), columns
+
+    def _dtype(self, field, column):
+        if field == 'detail':
+            return np.uint8
+        if field in ('earnings', 'next_earnings') or column in DATE_COLUMNS:
+            return np.int64
+        return np.float64
+
+    def _columns(self, snp_dict):
+        symbols = list(snp_dict)
+        present = np.zeros(len(symbols), dtype=np.uint8)
+        lengths = {field: np.zeros(len(symbols) + 1, dtype=np.int64) for field in self.FIELDS}
+        chunks = {field: [] for field in self.FIELDS}
+
+        for i, symbol in enumerate(symbols):
+            record = snp_dict[symbol]
+            for bit, field in enumerate(self.FIELDS):
+                if isinstance(record, _LazyRecord) and record.stored(field):
+                    chunk = record._store.raw(record._index, field)
+                elif field in record:
+                    chunk = self.encode(field, record[field])
+                else:
+                    continue
+                present[i] |= 1 << bit
+                lengths[field][i + 1] = len(chunk[self._FIELD_COLUMNS[field][0]])
+                chunks[field].append(chunk)
+
+        columns = {'present': present}
+        for field in self.FIELDS:
+            columns[f'{field}.offsets'] = np.cumsum(lengths[field])
+            for column in self._FIELD_COLUMNS[field]:
+                columns[f'{field}.{column}'] = np.concatenate(
+                    [np.empty(0, dtype=self._dtype(field, column)),
+                     *[_[column] for _ in chunks[field]]])
+        return symbols, columns
+
+    # write snp_dict as a new snapshot and clear the journal,
+    # untouched fields of lazy records are copied without decoding, meta defaults to the current one
+    def save(self, snp_dict, meta=None):
+        with self.writing(), self._lock:
+            meta = self.meta if meta is None else meta
+            # views into the current file are released when _columns returns
+            symbols, columns = self._columns(snp_dict)
+            tmp_path = ColumnFile.write(self.path, columns, {**meta, 'symbols': symbols})
+            if self._file is not None:
+                self._file.close()
+            replace(tmp_path, self.path)
+            self._open()
+            # a crash before this point replays the journal onto the new snapshot, which is harmless
+            self._journal.truncate()
+
+            if isinstance(snp_dict, LazySNPDict) and snp_dict._store is self:
+                snp_dict._rebind()
+            else:
+                snp_dict = LazySNPDict(self)
+            self._live = snp_dict
+            self.version += 1
+            return snp_dict
+
+
+###
+# snp_dict read as the flat columns of the store file: a company's field is a slice of the
+# memory mapped columns, nothing is decoded or gathered up front. Records set since the
+# snapshot are overlaid, encoded once per value until the store changes again, so memory only
+# grows with the companies that are looked up and with what the journal holds.
+#   present(symbol, field): the record has the field
+#   columns(symbol, field): column -> array of the symbol's values, KeyError without it,
+#   copied out of the map since a save swaps the file underneath
+###
+class SNPArrays:
+    def __init__(self, store, snp_dict):
+        self._store = store
+        self.snp_dict = snp_dict
+        # (symbol, field) -> (value, encoded columns) of fields set since the snapshot
+        self._overlay = {}
+        self._version = store.version
+
+    @property
+    def symbols(self):
+        return list(self.snp_dict)
+
+    def __contains__(self, symbol):
+        return symbol in self.snp_dict
+
+    def __len__(self):
+        return len(self.snp_dict)
+
+    def present(self, symbol, field):
+        with self._store._lock:
+            return symbol in self.snp_dict and field in self.snp_dict[symbol]
+
+    def columns(self, symbol, field):
+        with self._store._lock:
+            record = self.snp_dict[symbol]
+            if isinstance(record, _LazyRecord) and record.stored(field):
+                return {column: np.array(values)
+                        for column, values in self._store.raw(record._index, field).items()}
+            if self._version != self._store.version:
+                self._overlay = {}
+                self._version = self._store.version
+            value = record[field]
+            overlaid = self._overlay.get((symbol, field))
+            if overlaid is None or overlaid[0] is not value:
+                overlaid = (value, self._store.encode(field, value))
+                self._overlay[(symbol, field)] = overlaid
+            return overlaid[1]
@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+import pytest
+from json import dumps
+
+from analytics import earnings_tables, event_study
+from benchmark import (_legacy_event_windows, _legacy_parse_earnings, _price_fixture, _reported,
+                       _zacks_earnings_page)
+from extract import zacks_earnings_announcements
+from store import SNPStore
+
+
+# Offline checks of the page parser, the store and the price cache, nothing here touches the network.
+# usage: python3 -m pytest -q
+
+
+def _zacks_page(table):
+    return (f'<html><script>document.obj_data = {{"earnings_announcements_earnings_table": '
+            f'{table}, "earnings_announcements_sales_table": [["1/1/2000"]]}};</script></html>'
+            ).encode('utf-8')
+
+
+def test_zacks_dates_and_after_close():
+    page = _zacks_page(dumps([
+        ['4/27/2021', '3/2021', '$1.00', '$0.90', '+0.10', '+11.11%', 'After Close'],
+        ['1/26/2021', '12/2020', '$0.80', '$0.85', '-0.05', '-5.88%', 'Before Open'],
+        ['10/27/2020', '9/2020', '$0.70', '$0.70', '0.00', '0.00%', '--'],
+    ]))
+    dates, after_close = zacks_earnings_announcements(page)
+    assert list(dates) == list(pd.to_datetime(['2021-04-27', '2021-01-26', '2020-10-27']).to_numpy())
+    assert after_close.tolist() == [True, False, False]
+
+
+def test_zacks_unreadable_date_is_nat():
+    dates, after_close = zacks_earnings_announcements(_zacks_page(dumps([
+        ['4/27/2021', '', '', '', '', '', '--'], ['soon', '', '', '', '', '', '--']])))
+    assert not pd.isna(dates[0]) and pd.isna(dates[1])
+
+
+def test_zacks_without_table():
+    assert zacks_earnings_announcements(b'<html><script>var a = [1, 2];</script></html>') is None
+
+
+# a key without an array has no table, the next array on the page is not read in its place
+@pytest.mark.parametrize('value', ['null', '{"rows": [["4/27/2021"]]}', '""'])
+def test_zacks_key_without_array(value):
+    assert zacks_earnings_announcements(_zacks_page(value)) is None
+
+
+def test_zacks_matches_legacy_parser():
+    pytest.importorskip('bs4')
+    for seed in range(3):
+        page = _zacks_earnings_page(12, seed=seed, filler_rows=10)
+        assert _reported(*zacks_earnings_announcements(page)) == [
+            pd.Timestamp(_) for _ in _legacy_parse_earnings(page)]
+
+
+def _records(n_symbols=3, n_earnings=4):
+    histories, earnings = _price_fixture(n_symbols, n_earnings)
+    tables = earnings_tables(histories, earnings)
+    return {symbol: {'earnings': earnings[symbol], 'table': tables[symbol],
+                     'avg': {'point_avg': 0.5, 'percent_avg': 1.0}, 'detail': f'{symbol} makes things.'}
+            for symbol in earnings}
+
+
+# the journaled changes since the last save are there again when the store is opened
+def test_journal_replay(tmp_path):
+    path = str(tmp_path / 'snp_store.dat')
+    store = SNPStore(path)
+    snp_dict = store.save(_records())
+    store.update(snp_dict, 'S0000', 'detail', 'changed')
+    store.update_many(snp_dict, 'avg', {'S0001': {'point_avg': 2.0, 'percent_avg': 3.0}})
+    store.delete(snp_dict, 'S0002')
+    store.set_meta('refreshed_at', 1.0)
+    store.close()
+
+    store = SNPStore(path)
+    replayed = store.load()
+    try:
+        assert list(replayed) == ['S0000', 'S0001']
+        assert replayed['S0000']['detail'] == 'changed'
+        assert replayed['S0001']['avg'] == {'point_avg': 2.0, 'percent_avg': 3.0}
+        assert store.meta['refreshed_at'] == 1.0
+    finally:
+        store.close()
+
+
+# a torn last journal line, e.g. from a crash while appending, is skipped
+def test_journal_replay_skips_torn_line(tmp_path):
+    path = str(tmp_path / 'snp_store.dat')
+    store = SNPStore(path)
+    snp_dict = store.save(_records())
+    store.update(snp_dict, 'S0000', 'detail', 'changed')
+    journal = store._journal.path
+    store.close()
+    with open(journal, 'ab') as f:
+        f.write(b'0badc0de {"op": "set", "symbol": "S0001"')
+
+    store = SNPStore(path)
+    try:
+        replayed = store.load()
+        assert replayed['S0000']['detail'] == 'changed'
+        assert replayed['S0001']['detail'] == 'S0001 makes things.'
+    finally:
+        store.close()
+
+
+# every complete window of the event study is the one a per date slice of the history finds
+def test_event_windows_match_per_date_slices():
+    histories, earnings = _price_fixture(5, 8)
+    study = event_study(histories, earnings, 5, 5)
+    legacy = _legacy_event_windows(histories, earnings, 5, 5)
+    offsets = np.r_[0, np.cumsum(study.lengths)]
+    for i, symbol in enumerate(study.symbols):
+        returns = study.returns[offsets[i]:offsets[i + 1]]
+        complete = returns[~np.isnan(returns).any(axis=1)]
+        assert len(complete) == len(legacy[symbol]) > 0
+        np.testing.assert_allclose(complete, np.array(legacy[symbol]), rtol=1e-5, atol=1e-6)
+
+
+# a price fetcher over one listed symbol's bars, remembers the windows it was asked for
+class _ListedFetcher:
+    def __init__(self, listed='2019-06-03'):
+        days = pd.bdate_range(listed, '2021-12-31', tz='US/Eastern')
+        self.history = pd.DataFrame({
+            'Open': 1.0, 'High': 1.0, 'Low': 1.0, 'Close': 1.0, 'Volume': 1.0,
+            'Dividends': 0.0, 'Stock Splits': 0.0}, index=days)
+        self.calls = []
+
+    def __call__(self, tickers, start, end=None):
+        self.calls.append((start, end))
+        days = self.history.index.tz_localize(None)
+        return {_: self.history[(days >= start) & (days < end)] for _ in tickers}
+
+
+# a request disjoint from the cached range fills the days in between instead of skipping them
+def test_price_cache_fills_hole(tmp_path):
+    from prices import OHLCVCache, PriceFetcher
+    cache = OHLCVCache(PriceFetcher(_ListedFetcher()), str(tmp_path))
+    cache.history('SYM', '2020-01-01', '2020-04-01')
+    cache.history('SYM', '2021-01-01', '2021-03-01')
+    history = cache.history('SYM', '2020-01-01', '2021-03-01')
+    assert len(history) == len(pd.bdate_range('2020-01-01', '2021-02-28'))
+
+
+# the empty days ahead of a symbol's first bar are remembered and not asked for again
+def test_price_cache_remembers_listing(tmp_path):
+    from prices import OHLCVCache, PriceFetcher
+    fetcher = _ListedFetcher(listed='2019-06-03')
+    cache = OHLCVCache(PriceFetcher(fetcher), str(tmp_path))
+    cache.history('SYM', '2019-06-03', '2019-09-01')
+    cache.history('SYM', '2018-01-01', '2019-09-01')
+    calls = len(fetcher.calls)
+    history = cache.history('SYM', '2018-01-01', '2019-09-01')
+    assert fetcher.calls[calls:] == []
+    assert len(history) == len(pd.bdate_range('2019-06-03', '2019-08-31'))
+
+
+# pruning drops expired pages that can't be revalidated and their bodies, keeps the rest
+def test_response_cache_prune(tmp_path):
+    from fetch import ResponseCache
+    cache = ResponseCache(str(tmp_path), {'http://cached/': 60})
+    cache.store('http://cached/expired', b'expired')
+    cache.store('http://cached/validated', b'validated', etag='"v1"')
+    cache.store('http://cached/fresh', b'fresh')
+    cache.store('http://other/page', b'not a cached source')
+    for url in ('http://cached/expired', 'http://cached/validated'):
+        entry, _ = cache.lookup(url)
+        cache._write(cache._entry_path(url), dumps({**entry, 'stored_at': 0}).encode('utf-8'))
+    cache.prune()
+    assert [cache.lookup(_)[1] for _ in (
+        'http://cached/expired', 'http://cached/validated', 'http://cached/fresh', 'http://other/page')
+    ] == [None, b'validated', b'fresh', None]
+    assert len(list((tmp_path / 'bodies').iterdir())) == 2
+
+
+# saving SNPData keeps the snapshot version, so the copy moves on with patches
+def test_save_keeps_snapshot_version(tmp_path, monkeypatch):
+    from api import SNPData
+    from snapshots import Snapshots
+    monkeypatch.chdir(tmp_path)
+    SNPStore().save(_records())
+    snapshots = Snapshots('snapshots')
+    snp = SNPData(refresh=False)
+    version = snp.snapshot(snapshots)
+    snp.save()
+    assert SNPStore().meta.get('version') == version
+    assert snapshots.update(snp._store, snp.snp_dict)[1] == []